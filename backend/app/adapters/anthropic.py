@@ -1,14 +1,60 @@
 import time
 import uuid
-import httpx
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 from app.adapters.base import ProviderAdapter
-from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, Usage
+from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, ChatDelta, Usage
 
 class AnthropicAdapter(ProviderAdapter):
+    PROVIDER = "anthropic"
     BASE_URL = "https://api.anthropic.com/v1/messages"
 
     async def chat_completion(self, request: ChatRequest, api_key: str) -> ChatResponse:
+        payload = self._build_payload(request, stream=False)
+        response = await self.client.post(self.BASE_URL, headers=self._headers(api_key), json=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        return self._normalize_response(data, request.model)
+
+    async def stream_chat_completion(self, request: ChatRequest, api_key: str) -> AsyncIterator[ChatDelta]:
+        payload = self._build_payload(request, stream=True)
+        input_tokens = 0
+        output_tokens = 0
+
+        async with self.client.stream("POST", self.BASE_URL, headers=self._headers(api_key), json=payload) as response:
+            await self._raise_for_status(response)
+            async for event in self._iter_sse(response):
+                event_type = event.get("type")
+                if event_type == "message_start":
+                    usage_data = event.get("message", {}).get("usage", {})
+                    input_tokens = usage_data.get("input_tokens", 0)
+                    output_tokens = usage_data.get("output_tokens", 0)
+                elif event_type == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta":
+                        yield ChatDelta(content=delta.get("text", ""))
+                elif event_type == "message_delta":
+                    output_tokens = event.get("usage", {}).get("output_tokens", output_tokens)
+                    yield ChatDelta(finish_reason=event.get("delta", {}).get("stop_reason"))
+                elif event_type == "message_stop":
+                    break
+                elif event_type == "error":
+                    raise RuntimeError(f"Anthropic stream error: {event.get('error')}")
+
+        yield ChatDelta(usage=Usage(
+            prompt_tokens=input_tokens,
+            completion_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens
+        ))
+
+    def _headers(self, api_key: str) -> Dict[str, str]:
+        return {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+    def _build_payload(self, request: ChatRequest, stream: bool) -> Dict[str, Any]:
         anthropic_model = self._map_model(request.model)
         
         # Anthropic likes system prompt separate
@@ -22,29 +68,16 @@ class AnthropicAdapter(ProviderAdapter):
                     "role": "user" if msg.role == "user" else "assistant",
                     "content": msg.content
                 })
-        
-        headers = {
-            "x-api-key": api_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
-        payload = {
+
+        return {
             "model": anthropic_model,
             "system": system_prompt.strip() if system_prompt else None,
             "messages": messages,
             "max_tokens": request.max_tokens,
             "temperature": request.temperature,
-            "stream": request.stream
+            "stream": stream
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self.BASE_URL, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-
-        return self._normalize_response(data, request.model)
-
     async def list_models(self, api_key: str) -> List[str]:
         # Anthropic doesn't have a simple public model list API that works with just a key easily
         # but we can return the known models
@@ -1,12 +1,33 @@
+import json
+import httpx
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from app.models.schemas import ChatRequest, ChatResponse
+from typing import List, Dict, Any, AsyncIterator
+from app.models.schemas import ChatRequest, ChatResponse, ChatDelta
+from app.core.http_client import http_clients
 
 class ProviderAdapter(ABC):
+    # Provider name used to look up the shared connection pool
+    PROVIDER = ""
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client for this provider."""
+        return http_clients.get(self.PROVIDER)
+
     @abstractmethod
     async def chat_completion(self, request: ChatRequest, api_key: str) -> ChatResponse:
         pass
 
+    async def stream_chat_completion(self, request: ChatRequest, api_key: str) -> AsyncIterator[ChatDelta]:
+        """Stream normalized deltas. Falls back to a single delta for providers without streaming."""
+        response = await self.chat_completion(request, api_key)
+        choice = response.choices[0] if response.choices else None
+        yield ChatDelta(
+            content=choice.message.content if choice else "",
+            finish_reason=choice.finish_reason if choice else None,
+            usage=response.usage
+        )
+
     @abstractmethod
     async def list_models(self, api_key: str) -> List[str]:
         """List available models for this provider/key."""
@@ -16,3 +37,23 @@ class ProviderAdapter(ABC):
     async def get_quota_info(self, api_key: str) -> Dict[str, Any]:
         """Fetch remaining quota/limit information if available."""
         pass
+
+    @staticmethod
+    async def _raise_for_status(response: httpx.Response):
+        """raise_for_status for a streamed response, reading an error body first so the router can classify it."""
+        if response.is_error:
+            await response.aread()
+        response.raise_for_status()
+
+    @staticmethod
+    async def _iter_sse(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the JSON payload of each `data:` line of a server-sent event stream."""
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if not data:
+                continue
+            if data == "[DONE]":
+                return
+            yield json.loads(data)
@@ -1,22 +1,51 @@
+import json
 import time
 import uuid
-import httpx
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 from app.adapters.base import ProviderAdapter
-from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, Usage
+from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, ChatDelta, Usage
 
 class CohereAdapter(ProviderAdapter):
+    PROVIDER = "cohere"
     BASE_URL = "https://api.cohere.ai/v1/chat"
 
     async def chat_completion(self, request: ChatRequest, api_key: str) -> ChatResponse:
-        cohere_model = self._map_model(request.model)
-        
-        headers = {
+        payload = self._build_payload(request, stream=False)
+        response = await self.client.post(self.BASE_URL, headers=self._headers(api_key), json=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        return self._normalize_response(data, request.model)
+
+    async def stream_chat_completion(self, request: ChatRequest, api_key: str) -> AsyncIterator[ChatDelta]:
+        payload = self._build_payload(request, stream=True)
+
+        # Cohere streams newline-delimited JSON events rather than SSE
+        async with self.client.stream("POST", self.BASE_URL, headers=self._headers(api_key), json=payload) as response:
+            await self._raise_for_status(response)
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                event_type = event.get("event_type")
+                if event_type == "text-generation":
+                    yield ChatDelta(content=event.get("text", ""))
+                elif event_type == "stream-end":
+                    yield ChatDelta(
+                        finish_reason="complete",
+                        usage=self._extract_usage(event.get("response", {}))
+                    )
+
+    def _headers(self, api_key: str) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "accept": "application/json"
         }
-        
+
+    def _build_payload(self, request: ChatRequest, stream: bool) -> Dict[str, Any]:
+        cohere_model = self._map_model(request.model)
+
         # Cohere uses "message" for current turn and "chat_history"
         chat_history = []
         for msg in request.messages[:-1]:
@@ -25,20 +54,14 @@ class CohereAdapter(ProviderAdapter):
                 "message": msg.content
             })
             
-        payload = {
+        return {
             "model": cohere_model,
             "message": request.messages[-1].content,
             "chat_history": chat_history,
             "temperature": request.temperature,
+            "stream": stream
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self.BASE_URL, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-
-        return self._normalize_response(data, request.model)
-
     async def list_models(self, api_key: str) -> List[str]:
         return ["command-r", "command-r-plus", "command-light", "command"]
 
@@ -63,13 +86,7 @@ class CohereAdapter(ProviderAdapter):
             )
         ]
         
-        # Cohere usage format
-        token_count = data.get("token_count", {})
-        usage = Usage(
-            prompt_tokens=token_count.get("prompt_tokens", 0),
-            completion_tokens=token_count.get("response_tokens", 0),
-            total_tokens=token_count.get("total_tokens", 0)
-        )
+        usage = self._extract_usage(data)
 
         return ChatResponse(
             id=data.get("generation_id", f"cohere-{uuid.uuid4()}"),
@@ -78,3 +95,12 @@ class CohereAdapter(ProviderAdapter):
             choices=choices,
             usage=usage
         )
+
+    def _extract_usage(self, data: Dict[str, Any]) -> Usage:
+        # Cohere usage format
+        token_count = data.get("token_count", {})
+        return Usage(
+            prompt_tokens=token_count.get("prompt_tokens", 0),
+            completion_tokens=token_count.get("response_tokens", 0),
+            total_tokens=token_count.get("total_tokens", 0)
+        )
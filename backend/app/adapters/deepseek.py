@@ -1,6 +1,7 @@
 from app.adapters.openai import OpenAIAdapter
 
 class DeepSeekAdapter(OpenAIAdapter):
+    PROVIDER = "deepseek"
     BASE_URL = "https://api.deepseek.com/chat/completions"
     MODELS_URL = "https://api.deepseek.com/models"
 
@@ -1,18 +1,52 @@
 import time
 import uuid
-import httpx
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 from app.adapters.base import ProviderAdapter
-from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, Usage
+from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, ChatDelta, Usage
 
 class GeminiAdapter(ProviderAdapter):
+    PROVIDER = "gemini"
     # Google AI Studio API
     BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+    STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
 
     async def chat_completion(self, request: ChatRequest, api_key: str) -> ChatResponse:
         gemini_model = self._map_model(request.model)
         url = self.BASE_URL.format(model=gemini_model, api_key=api_key)
-        
+
+        response = await self.client.post(url, json=self._build_payload(request))
+        response.raise_for_status()
+        data = response.json()
+
+        return self._normalize_response(data, request.model, gemini_model)
+
+    async def stream_chat_completion(self, request: ChatRequest, api_key: str) -> AsyncIterator[ChatDelta]:
+        gemini_model = self._map_model(request.model)
+        url = self.STREAM_URL.format(model=gemini_model, api_key=api_key)
+        usage = None
+
+        async with self.client.stream("POST", url, json=self._build_payload(request)) as response:
+            await self._raise_for_status(response)
+            async for chunk in self._iter_sse(response):
+                # usageMetadata is cumulative, the last chunk carries the totals
+                usage_data = chunk.get("usageMetadata")
+                if usage_data:
+                    usage = Usage(
+                        prompt_tokens=usage_data.get("promptTokenCount", 0),
+                        completion_tokens=usage_data.get("candidatesTokenCount", 0),
+                        total_tokens=usage_data.get("totalTokenCount", 0)
+                    )
+                candidates = chunk.get("candidates") or [{}]
+                parts = candidates[0].get("content", {}).get("parts", [])
+                yield ChatDelta(
+                    content="".join([p.get("text", "") for p in parts]),
+                    finish_reason=candidates[0].get("finishReason")
+                )
+
+        if usage:
+            yield ChatDelta(usage=usage)
+
+    def _build_payload(self, request: ChatRequest) -> Dict[str, Any]:
         # Convert our messages to Gemini format
         contents = []
         for msg in request.messages:
@@ -22,7 +56,7 @@ class GeminiAdapter(ProviderAdapter):
                 "parts": [{"text": msg.content}]
             })
         
-        payload = {
+        return {
             "contents": contents,
             "generationConfig": {
                 "temperature": request.temperature,
@@ -30,21 +64,13 @@ class GeminiAdapter(ProviderAdapter):
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-
-        return self._normalize_response(data, request.model, gemini_model)
-
     async def list_models(self, api_key: str) -> List[str]:
         # Google AI Studio model list endpoint
         url = f"https://generativelanguage.googleapis.com/v1beta/models?key={api_key}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            return [m["name"].split("/")[-1] for m in data.get("models", []) if "gemini" in m["name"]]
+        response = await self.client.get(url)
+        response.raise_for_status()
+        data = response.json()
+        return [m["name"].split("/")[-1] for m in data.get("models", []) if "gemini" in m["name"]]
 
     async def get_quota_info(self, api_key: str) -> Dict[str, Any]:
         return {"info": "Quota info not available via public API"}
@@ -1,6 +1,7 @@
 from app.adapters.openai import OpenAIAdapter
 
 class GroqAdapter(OpenAIAdapter):
+    PROVIDER = "groq"
     BASE_URL = "https://api.groq.com/openai/v1/chat/completions"
     MODELS_URL = "https://api.groq.com/openai/v1/models"
 
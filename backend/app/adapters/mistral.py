@@ -1,8 +1,11 @@
 from app.adapters.openai import OpenAIAdapter
 
 class MistralAdapter(OpenAIAdapter):
+    PROVIDER = "mistral"
     BASE_URL = "https://api.mistral.ai/v1/chat/completions"
     MODELS_URL = "https://api.mistral.ai/v1/models"
+    # Usage is sent in the last chunk without asking; stream_options is rejected
+    STREAM_USAGE_OPTION = False
 
     def _map_model(self, logical_model: str) -> str:
         mapping = {
@@ -1,46 +1,69 @@
 import time
 import uuid
-import httpx
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 from app.adapters.base import ProviderAdapter
-from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, Usage
+from app.models.schemas import ChatRequest, ChatResponse, ChatChoice, ChatMessage, ChatDelta, Usage
 
 class OpenAIAdapter(ProviderAdapter):
+    PROVIDER = "openai"
     BASE_URL = "https://api.openai.com/v1/chat/completions"
     MODELS_URL = "https://api.openai.com/v1/models"
+    # Ask for a final usage chunk when streaming; not every compatible API accepts it
+    STREAM_USAGE_OPTION = True
 
     async def chat_completion(self, request: ChatRequest, api_key: str) -> ChatResponse:
-        # Map logical model to specific OpenAI model if needed
-        # For now, let's assume a mapping or just use a default
-        openai_model = self._map_model(request.model)
-        
-        headers = {
+        payload = self._build_payload(request, stream=False)
+        response = await self.client.post(self.BASE_URL, headers=self._headers(api_key), json=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        return self._normalize_response(data, request.model)
+
+    async def stream_chat_completion(self, request: ChatRequest, api_key: str) -> AsyncIterator[ChatDelta]:
+        payload = self._build_payload(request, stream=True)
+        if self.STREAM_USAGE_OPTION:
+            payload["stream_options"] = {"include_usage": True}
+
+        async with self.client.stream("POST", self.BASE_URL, headers=self._headers(api_key), json=payload) as response:
+            await self._raise_for_status(response)
+            async for chunk in self._iter_sse(response):
+                usage_data = chunk.get("usage")
+                usage = Usage(
+                    prompt_tokens=usage_data.get("prompt_tokens", 0),
+                    completion_tokens=usage_data.get("completion_tokens", 0),
+                    total_tokens=usage_data.get("total_tokens", 0)
+                ) if usage_data else None
+                choices = chunk.get("choices") or [{}]
+                yield ChatDelta(
+                    content=(choices[0].get("delta") or {}).get("content"),
+                    finish_reason=choices[0].get("finish_reason"),
+                    usage=usage
+                )
+
+    def _headers(self, api_key: str) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        
-        payload = {
+
+    def _build_payload(self, request: ChatRequest, stream: bool) -> Dict[str, Any]:
+        # Map logical model to specific OpenAI model if needed
+        # For now, let's assume a mapping or just use a default
+        openai_model = self._map_model(request.model)
+        return {
             "model": openai_model,
             "messages": [m.dict() for m in request.messages],
             "temperature": request.temperature,
             "max_tokens": request.max_tokens,
-            "stream": request.stream
+            "stream": stream
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self.BASE_URL, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-
-        return self._normalize_response(data, request.model)
-
     async def list_models(self, api_key: str) -> List[str]:
         headers = {"Authorization": f"Bearer {api_key}"}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.MODELS_URL, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            return [m["id"] for m in data["data"]]
+        response = await self.client.get(self.MODELS_URL, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        return [m["id"] for m in data["data"]]
 
     async def get_quota_info(self, api_key: str) -> Dict[str, Any]:
         # OpenAI doesn't have a simple quota API for keys, 
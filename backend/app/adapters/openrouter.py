@@ -1,6 +1,7 @@
 from app.adapters.openai import OpenAIAdapter
 
 class OpenRouterAdapter(OpenAIAdapter):
+    PROVIDER = "openrouter"
     BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
     MODELS_URL = "https://openrouter.ai/api/v1/models"
 
@@ -1,8 +1,11 @@
 from app.adapters.openai import OpenAIAdapter
 
 class PerplexityAdapter(OpenAIAdapter):
+    PROVIDER = "perplexity"
     BASE_URL = "https://api.perplexity.ai/chat/completions"
     MODELS_URL = "https://api.perplexity.ai/models" # Note: Perplexity might not have a public list but standardizes on keys
+    # Usage is sent in the last chunk without asking; stream_options is rejected
+    STREAM_USAGE_OPTION = False
 
     def _map_model(self, logical_model: str) -> str:
         mapping = {
@@ -1,6 +1,7 @@
 from app.adapters.openai import OpenAIAdapter
 
 class TogetherAdapter(OpenAIAdapter):
+    PROVIDER = "together"
     BASE_URL = "https://api.together.xyz/v1/chat/completions"
     MODELS_URL = "https://api.together.xyz/v1/models"
 
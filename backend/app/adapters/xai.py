@@ -1,6 +1,7 @@
 from app.adapters.openai import OpenAIAdapter
 
 class XAIAdapter(OpenAIAdapter):
+    PROVIDER = "xai"
     BASE_URL = "https://api.x.ai/v1/chat/completions"
     MODELS_URL = "https://api.x.ai/v1/models"
 
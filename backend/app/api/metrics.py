@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Response
+from app.core.router import router
+from app.services.metrics import metrics
+from app.services.usage_writer import usage_writer
+from app.services.key_registry import key_registry
+from app.services.circuit_breaker import circuit_breaker, CLOSED, OPEN
+
+metrics_router = APIRouter()
+
+CIRCUIT_STATE_VALUES = {CLOSED: 0, OPEN: 1}
+
+def _usage_queue():
+    stats = usage_writer.get_stats()
+    yield (), stats["queue_depth"]
+
+def _circuits():
+    for provider in router.adapters:
+        circuit = circuit_breaker.circuits.get(provider)
+        state = circuit.state if circuit else CLOSED
+        yield (provider,), CIRCUIT_STATE_VALUES.get(state, 2)
+
+def _key_in_flight():
+    for state in key_registry.keys.values():
+        yield (state.provider, state.id), state.in_flight
+
+metrics.gauge("llm_hub_usage_queue_depth", "Usage events waiting to be written.", (), _usage_queue)
+metrics.gauge("llm_hub_circuit_state", "Provider circuit state: 0 closed, 1 open, 2 half-open.", ("provider",), _circuits)
+metrics.gauge("llm_hub_key_in_flight", "Requests in flight per API key on this worker.", ("provider", "key_id"), _key_in_flight)
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,14 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, and_, or_
 from app.core.database import get_db
-from app.core.security import check_admin
-from app.models.db_models import User, APIKey, UsageLog
-from app.models.schemas import APIKeyCreate, APIKeyOut, UsageLogOut
+from app.core.security import check_admin, encrypt_value, GATEWAY_TOKEN_PREFIX
+from app.models.db_models import User, APIKey, UsageLog, GatewayToken
+from app.models.schemas import (
+    APIKeyCreate, APIKeyOut, UsageLogOut, UserOut, UserUpdate,
+    GatewayTokenCreate, GatewayTokenUpdate, GatewayTokenOut, GatewayTokenCreated
+)
 from typing import List
 
 from app.core.router import router
-from typing import List, Dict, Any
+from app.core.http_client import http_clients
+from app.services.key_registry import key_registry
+from app.services.quota_service import quota_service
+from app.services.usage_writer import usage_writer
+from app.services.provider_stats import provider_stats
+from app.services.circuit_breaker import circuit_breaker
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services import usage_rollups
+from app.services.usage_export import usage_exporter
+from app.services.auth_cache import auth_cache, hash_token
+from app.services.login_throttle import login_throttle
+from app.services.credentials import credential_cache
+from typing import List, Dict, Any, Optional
+import time
+import secrets
 
 admin_router = APIRouter()
 
@@ -50,7 +69,24 @@ async def admin_debug(admin_user: User = Depends(check_admin)):
 @admin_router.get("/keys", response_model=List[APIKeyOut])
 async def list_keys(db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
     result = await db.execute(select(APIKey))
-    return result.scalars().all()
+    rows = result.scalars().all()
+    # Live counters may not be persisted yet
+    live = await quota_service.key_states([key.id for key in rows])
+    keys = []
+    for key in rows:
+        out = APIKeyOut.model_validate(key)
+        state = live.get(key.id)
+        if state:
+            out.used_today = state["used_today"]
+            out.cooldown_until = state["cooldown_until"]
+            out.in_flight = state["in_flight"]
+        keys.append(out)
+    return keys
+
+@admin_router.get("/keys/strategies")
+async def get_key_strategies(admin: User = Depends(check_admin)):
+    """Key load-balancing strategy in use per provider."""
+    return key_registry.strategies()
 
 @admin_router.post("/keys", response_model=APIKeyOut)
 async def create_key(key_in: APIKeyCreate, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
@@ -72,17 +108,25 @@ async def create_key(key_in: APIKeyCreate, db: AsyncSession = Depends(get_db), a
         key_value=encrypt_value(key_in.key_value),
         key_prefix=prefix,
         daily_quota=key_in.daily_quota,
+        rpm_limit=key_in.rpm_limit or 0,
+        tpm_limit=key_in.tpm_limit or 0,
+        max_concurrency=key_in.max_concurrency or 0,
         is_active=True
     )
     db.add(new_key)
     await db.commit()
     await db.refresh(new_key)
+    key_registry.upsert(new_key)
+    await quota_service.key_config_changed()
     return new_key
 
 @admin_router.delete("/keys/{key_id}")
 async def delete_key(key_id: int, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
     await db.execute(delete(APIKey).where(APIKey.id == key_id))
     await db.commit()
+    key_registry.remove(key_id)
+    await quota_service.key_config_changed()
+    credential_cache.invalidate(key_id)
     return {"status": "success", "message": "Key deleted"}
 
 from app.models.schemas import APIKeyUpdate
@@ -100,27 +144,32 @@ async def update_key(key_id: int, key_in: APIKeyUpdate, db: AsyncSession = Depen
         key.is_active = key_in.is_active
     if key_in.daily_quota is not None:
         key.daily_quota = key_in.daily_quota
+    for limit in ("rpm_limit", "tpm_limit", "max_concurrency"):
+        value = getattr(key_in, limit)
+        if value is not None:
+            setattr(key, limit, value)
         
     await db.commit()
     await db.refresh(key)
+    key_registry.upsert(key)
+    await quota_service.key_config_changed()
+    credential_cache.invalidate(key.id)
     return key
 
 @admin_router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
-    """Aggregate stats for dashboard"""
-    # Total requests
-    result = await db.execute(select(UsageLog))
-    logs = result.scalars().all()
-    
-    total_requests = len(logs)
-    total_tokens = sum(log.total_tokens for log in logs)
-    
-    # Simple distribution
-    model_counts = {}
-    for log in logs:
-        m = log.model
-        model_counts[m] = model_counts.get(m, 0) + 1
-        
+async def get_stats(
+    hours: int = Query(24, ge=1, le=24 * 366),
+    bucket_hours: int = Query(4, ge=1, le=24 * 31),
+    db: AsyncSession = Depends(get_db),
+    admin: User = Depends(check_admin)
+):
+    """Aggregate stats for dashboard, read from the hourly usage rollups"""
+    import datetime
+
+    # All-time totals and model distribution
+    totals = await usage_rollups.totals(db)
+    model_counts = await usage_rollups.requests_by_model(db)
+
     model_share = [
         {"name": m, "value": count, "color": "#06b6d4"} # Color placeholder
         for m, count in model_counts.items()
@@ -131,50 +180,229 @@ async def get_stats(db: AsyncSession = Depends(get_db), admin: User = Depends(ch
     if total > 0:
         for item in model_share:
             item["value"] = round((item["value"] / total) * 100, 1)
-            
-    # Time-series data (Last 24 hours, grouped by 4-hour blocks)
-    import time
-    now = int(time.time())
-    one_day_ago = now - 86400
-    
-    # Initialize buckets (6 buckets of 4 hours)
-    buckets = []
-    for i in range(6):
-        t = one_day_ago + (i * 14400)
-        # Format as HH:00
-        import datetime
+
+    # Time-series data over the requested range, aligned to whole hours
+    bucket_seconds = bucket_hours * usage_rollups.BUCKET_SECONDS
+    end = usage_rollups.bucket_of(int(time.time())) + usage_rollups.BUCKET_SECONDS
+    count = max(-(-hours // bucket_hours), 1)
+    start = end - count * bucket_seconds
+    hourly = await usage_rollups.series(db, start, end)
+
+    usage_data = []
+    for i in range(count):
+        t = start + i * bucket_seconds
+        requests = tokens = 0
+        for hour in range(t, t + bucket_seconds, usage_rollups.BUCKET_SECONDS):
+            if hour in hourly:
+                requests += hourly[hour][0]
+                tokens += hourly[hour][1]
         dt = datetime.datetime.fromtimestamp(t)
-        buckets.append({
-            "name": dt.strftime("%H:00"),
-            "requests": 0,
-            "tokens": 0,
-            "start": t,
-            "end": t + 14400
+        usage_data.append({
+            "name": dt.strftime("%H:00") if hours <= 24 else dt.strftime("%m-%d %H:00"),
+            "requests": requests,
+            "tokens": tokens
         })
-        
-    for log in logs:
-        if log.timestamp >= one_day_ago:
-            for b in buckets:
-                if b["start"] <= log.timestamp < b["end"]:
-                    b["requests"] += 1
-                    b["tokens"] += log.total_tokens
-                    break
-    
-    # Clean up buckets for response
-    usage_data = [
-        {"name": b["name"], "requests": b["requests"], "tokens": b["tokens"]}
-        for b in buckets
-    ]
 
+    avg_latency = totals["avg_latency_ms"]
     return {
-        "total_requests": total_requests,
-        "total_tokens": total_tokens,
-        "avg_latency": "N/A", # Not tracked yet
+        "total_requests": totals["requests"],
+        "total_tokens": totals["tokens"],
+        "avg_latency": f"{avg_latency / 1000:.2f}s" if avg_latency is not None else "N/A",
         "model_share": model_share,
-        "usage_data": usage_data
+        "usage_data": usage_data,
+        # Percentiles over the same range as usage_data
+        "latency": await usage_rollups.latency_percentiles(db, since=start),
+        "cache": response_cache.get_stats(),
+        "single_flight": single_flight.get_stats()
     }
 
 @admin_router.get("/logs", response_model=List[UsageLogOut])
-async def list_logs(limit: int = 100, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
-    result = await db.execute(select(UsageLog).order_by(UsageLog.timestamp.desc()).limit(limit))
+async def list_logs(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    api_key_id: Optional[int] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: User = Depends(check_admin)
+):
+    """Newest-first usage logs with keyset pagination.
+
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
+    `start` and `end` are epoch seconds (end exclusive).
+    """
+    query = (
+        select(
+            UsageLog.id,
+            UsageLog.api_key_id,
+            UsageLog.timestamp,
+            UsageLog.model,
+            UsageLog.prompt_tokens,
+            UsageLog.completion_tokens,
+            UsageLog.total_tokens,
+            APIKey.name.label("key_name"),
+            APIKey.provider
+        )
+        .outerjoin(APIKey, APIKey.id == UsageLog.api_key_id)
+        .order_by(UsageLog.timestamp.desc(), UsageLog.id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        try:
+            cursor_ts, cursor_id = (int(part) for part in cursor.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(or_(
+            UsageLog.timestamp < cursor_ts,
+            and_(UsageLog.timestamp == cursor_ts, UsageLog.id < cursor_id)
+        ))
+    if start is not None:
+        query = query.where(UsageLog.timestamp >= start)
+    if end is not None:
+        query = query.where(UsageLog.timestamp < end)
+    if api_key_id is not None:
+        query = query.where(UsageLog.api_key_id == api_key_id)
+    if provider:
+        query = query.where(APIKey.provider == provider)
+    if model:
+        query = query.where(UsageLog.model == model)
+
+    rows = (await db.execute(query)).mappings().all()
+    if len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = f"{last['timestamp']}:{last['id']}"
+    return rows
+
+@admin_router.get("/logs/export")
+async def export_logs(
+    format: str = "csv",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    after_id: Optional[int] = None,
+    admin: User = Depends(check_admin)
+):
+    """Stream usage logs (with key name and provider) as CSV or NDJSON, oldest first.
+
+    For incremental exports pass the last exported id as `after_id`.
+    """
+    media_type = usage_exporter.FORMATS.get(format)
+    if media_type is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(usage_exporter.FORMATS)}")
+    filename = f"usage-{int(time.time())}.{format}"
+    return StreamingResponse(
+        usage_exporter.stream(format, start, end, after_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@admin_router.get("/http-pools")
+async def get_http_pools(admin: User = Depends(check_admin)):
+    """Connection pool settings and reuse counters per provider."""
+    return http_clients.get_stats()
+
+@admin_router.get("/usage-writer")
+async def get_usage_writer_stats(admin: User = Depends(check_admin)):
+    """Queue depth, backpressure and flush lag of the write-behind usage pipeline."""
+    return usage_writer.get_stats()
+
+@admin_router.get("/routing/scores")
+async def get_routing_scores(admin: User = Depends(check_admin)):
+    """Live adaptive routing scores per logical model (lower is tried first)."""
+    return provider_stats.get_scores(router.routing_config)
+
+@admin_router.get("/providers/health")
+async def get_provider_health(admin: User = Depends(check_admin)):
+    """Circuit breaker state and live latency/error stats for every provider."""
+    health = []
+    for provider in router.adapters:
+        stats = provider_stats.providers.get(provider)
+        health.append({
+            "provider": provider,
+            **circuit_breaker.get_state(provider),
+            **(stats.snapshot(provider_stats.half_life) if stats else {}),
+        })
+    return health
+
+@admin_router.get("/users", response_model=List[UserOut])
+async def list_users(db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    result = await db.execute(select(User).order_by(User.id))
     return result.scalars().all()
+
+@admin_router.patch("/users/{user_id}", response_model=UserOut)
+async def update_user(user_id: int, user_in: UserUpdate, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if user_in.role is not None:
+        if user_in.role not in ("admin", "user"):
+            raise HTTPException(status_code=400, detail="Role must be 'admin' or 'user'")
+        user.role = user_in.role
+    if user_in.is_active is not None:
+        user.is_active = user_in.is_active
+    await db.commit()
+    await db.refresh(user)
+    auth_cache.invalidate_user(user.username)
+    auth_cache.invalidate_user_tokens(user.id)
+    return user
+
+@admin_router.get("/tokens", response_model=List[GatewayTokenOut])
+async def list_tokens(db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    result = await db.execute(select(GatewayToken).order_by(GatewayToken.id))
+    return result.scalars().all()
+
+@admin_router.post("/tokens", response_model=GatewayTokenCreated)
+async def create_token(token_in: GatewayTokenCreate, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    token = GATEWAY_TOKEN_PREFIX + secrets.token_urlsafe(32)
+    row = GatewayToken(
+        name=token_in.name,
+        token_hash=hash_token(token),
+        token_prefix=token[:10] + "...",
+        user_id=admin.id,
+        is_active=True
+    )
+    db.add(row)
+    await db.commit()
+    await db.refresh(row)
+    # Drop a cached "unknown token" in case a client tried it early
+    auth_cache.invalidate_token(row.token_hash)
+    return GatewayTokenCreated(token=token, **GatewayTokenOut.model_validate(row).model_dump())
+
+@admin_router.patch("/tokens/{token_id}", response_model=GatewayTokenOut)
+async def update_token(token_id: int, token_in: GatewayTokenUpdate, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    result = await db.execute(select(GatewayToken).where(GatewayToken.id == token_id))
+    row = result.scalar_one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Token not found")
+    if token_in.name is not None:
+        row.name = token_in.name
+    if token_in.is_active is not None:
+        row.is_active = token_in.is_active
+    await db.commit()
+    await db.refresh(row)
+    auth_cache.invalidate_token(row.token_hash)
+    return row
+
+@admin_router.delete("/tokens/{token_id}")
+async def delete_token(token_id: int, db: AsyncSession = Depends(get_db), admin: User = Depends(check_admin)):
+    result = await db.execute(select(GatewayToken).where(GatewayToken.id == token_id))
+    row = result.scalar_one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Token not found")
+    await db.delete(row)
+    await db.commit()
+    auth_cache.invalidate_token(row.token_hash)
+    return {"status": "success", "message": "Token deleted"}
+
+@admin_router.get("/credentials")
+async def get_credential_stats(admin: User = Depends(check_admin)):
+    """Decrypted provider key cache counters, including keys that failed to decrypt."""
+    return credential_cache.get_stats()
+
+@admin_router.get("/auth-cache")
+async def get_auth_cache_stats(admin: User = Depends(check_admin)):
+    """Entries and hit counts of the in-memory authentication cache, plus login throttling."""
+    return {**auth_cache.get_stats(), "login_throttle": login_throttle.get_stats()}
@@ -1,17 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.core.database import get_db
-from app.core.security import create_access_token, get_password_hash, verify_password, Token
+from app.core.security import create_access_token, get_password_hash_async, verify_password_async, Token
+from app.services.login_throttle import login_throttle
+from app.services.auth_cache import auth_cache
 from app.models.db_models import User
 from app.models.schemas import UserRegister, UserOut, UserLogin
-from typing import List
+from typing import List, Optional
 
 auth_router = APIRouter()
 
+def _throttle(request: Request, username: Optional[str] = None):
+    ip = request.client.host if request.client else "unknown"
+    retry_after = login_throttle.check(ip, username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
 @auth_router.post("/register", response_model=UserOut)
-async def register(user_in: UserRegister, db: AsyncSession = Depends(get_db)):
+async def register(user_in: UserRegister, request: Request, db: AsyncSession = Depends(get_db)):
+    _throttle(request)
     try:
         # Check if user already exists
         result = await db.execute(select(User).where(User.username == user_in.username))
@@ -24,7 +37,7 @@ async def register(user_in: UserRegister, db: AsyncSession = Depends(get_db)):
                 raise HTTPException(status_code=400, detail="Email already registered")
 
         # Create new user
-        hashed_password = get_password_hash(user_in.password)
+        hashed_password = await get_password_hash_async(user_in.password)
         # First user is admin
         result = await db.execute(select(User))
         is_first = result.scalars().first() is None
@@ -47,18 +60,28 @@ async def register(user_in: UserRegister, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @auth_router.post("/login", response_model=Token)
-async def login(user_in: UserLogin, db: AsyncSession = Depends(get_db)):
+async def login(user_in: UserLogin, request: Request, db: AsyncSession = Depends(get_db)):
+    _throttle(request, user_in.username)
     try:
         result = await db.execute(select(User).where(User.username == user_in.username))
         user = result.scalar_one_or_none()
-        
-        if not user or not verify_password(user_in.password, user.password_hash):
+
+        verified, new_hash = (await verify_password_async(user_in.password, user.password_hash)) if user else (False, None)
+        if not verified:
+            login_throttle.record_failure(user_in.username)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        
+        login_throttle.record_success(user_in.username)
+
+        # Stored hash used an older work factor: replace it while we have the password
+        if new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+            auth_cache.invalidate_user(user.username)
+
         access_token = create_access_token(data={"sub": user.username, "role": user.role})
         return {"access_token": access_token, "token_type": "bearer"}
     except Exception as e:
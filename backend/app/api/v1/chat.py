@@ -1,17 +1,159 @@
-from fastapi import APIRouter, HTTPException, Depends
+import json
+import time
+import uuid
+from typing import AsyncIterator, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.schemas import ChatRequest, ChatResponse
-from app.core.router import router
-from app.core.database import get_db
+from app.models.schemas import (
+    ChatRequest, ChatResponse, ChatDelta, ChatCompletionChunk, ChatChunkChoice,
+    ChatBatchRequest, ChatBatchResponse, ChatBatchSummary
+)
+from app.core.router import router, UpstreamRequestError
+from app.core.database import get_db, AsyncSessionLocal
+from app.core.security import require_api_token
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.chat_batch import chat_batch
 
-api_router = APIRouter()
+# Gateway token check (a no-op unless ENABLE_PUBLIC_API_AUTH is set)
+api_router = APIRouter(dependencies=[Depends(require_api_token)])
 
 @api_router.post("/chat", response_model=ChatResponse)
-async def chat_completion(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat_completion(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    cache_control: Optional[str] = Header(None)
+):
+    received_at = time.monotonic()
+    if request.stream:
+        return await _stream_completion(request, db, received_at)
+
+    no_store, no_cache, max_age = _parse_cache_control(cache_control)
+    use_cache = request.cache is not False and not no_store and response_cache.is_cacheable(request)
+    cache_key = response_cache.make_key(request) if use_cache else None
+
+    # Cache hits skip key selection and usage logging entirely
+    if use_cache and not no_cache:
+        cached = response_cache.get(cache_key, max_age)
+        if cached:
+            body, age = cached
+            return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT", "Age": str(age)})
+
+    headers = {"X-Cache": "MISS" if use_cache else "BYPASS"}
     try:
-        response = await router.route(db, request)
-        return response
+        if single_flight.is_enabled(request):
+            # Identical requests already in flight share one upstream call
+            flight_key = cache_key or response_cache.make_key(request)
+            response, coalesced = await single_flight.run(flight_key, lambda: _route_detached(request, received_at))
+            if coalesced:
+                headers["X-Coalesced"] = "true"
+        else:
+            response = await router.route(db, request, received_at)
+    except UpstreamRequestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+    body = response.model_dump_json().encode()
+    if use_cache:
+        response_cache.put(cache_key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch_completion(batch: ChatBatchRequest):
+    if len(batch.requests) > chat_batch.max_items:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {chat_batch.max_items} requests")
+    concurrency = chat_batch.concurrency(batch.concurrency)
+    summary = ChatBatchSummary()
+
+    if batch.stream:
+        async def lines() -> AsyncIterator[str]:
+            async for item in chat_batch.run(batch.requests, concurrency, summary):
+                yield item.model_dump_json(exclude_none=True) + "\n"
+            # Last line: totals for the whole batch
+            yield summary.model_dump_json() + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [item async for item in chat_batch.run(batch.requests, concurrency, summary)]
+    results.sort(key=lambda item: item.index)
+    return ChatBatchResponse(results=results, **summary.model_dump())
+
+async def _route_detached(request: ChatRequest, received_at: float) -> ChatResponse:
+    # The shared call can outlive the request that started it, so it uses its own session
+    async with AsyncSessionLocal() as db:
+        return await router.route(db, request, received_at)
+
+def _parse_cache_control(value: Optional[str]) -> Tuple[bool, bool, Optional[int]]:
+    """Return (no_store, no_cache, max_age) from a Cache-Control request header."""
+    no_store = no_cache = False
+    max_age = None
+    for directive in (value or "").lower().split(","):
+        directive = directive.strip()
+        if directive == "no-store":
+            no_store = True
+        elif directive == "no-cache":
+            no_cache = True
+        elif directive.startswith("max-age="):
+            try:
+                max_age = int(directive[8:])
+            except ValueError:
+                pass
+    return no_store, no_cache, max_age
+
+async def _stream_completion(request: ChatRequest, db: AsyncSession, received_at: float) -> StreamingResponse:
+    stream = router.route_stream(db, request, received_at)
+    # Wait for the first delta so routing failures still surface as a plain HTTP error
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except UpstreamRequestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        _sse_events(request, first, stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _sse_events(request: ChatRequest, first: Optional[ChatDelta], stream: AsyncIterator[ChatDelta]) -> AsyncIterator[str]:
+    """Re-emit normalized deltas as OpenAI-style `chat.completion.chunk` events."""
+    chunk_id = f"hub-{uuid.uuid4()}"
+    created = int(time.time())
+    model = request.model.value
+
+    def event(choices, usage=None) -> str:
+        chunk = ChatCompletionChunk(id=chunk_id, created=created, model=model, choices=choices, usage=usage)
+        return f"data: {chunk.model_dump_json(exclude_none=True)}\n\n"
+
+    yield event([ChatChunkChoice(delta={"role": "assistant"})])
+
+    usage = None
+    delta = first
+    try:
+        while delta is not None:
+            if delta.usage:
+                usage = delta.usage
+            if delta.content or delta.finish_reason:
+                content = {"content": delta.content} if delta.content else {}
+                yield event([ChatChunkChoice(delta=content, finish_reason=delta.finish_reason)])
+            delta = await stream.__anext__()
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        yield f"data: {json.dumps({'error': {'message': str(e)}})}\n\n"
+    finally:
+        await stream.aclose()
+
+    if usage:
+        yield event([], usage=usage)
+    yield "data: [DONE]\n\n"
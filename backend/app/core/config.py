@@ -0,0 +1,8 @@
+import os
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Boolean setting from the environment: 1, true, yes or on (any case) enable it."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
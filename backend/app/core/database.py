@@ -1,15 +1,64 @@
 import os
+from typing import Dict, Any
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from app.core.config import env_bool
 
-# Force absolute path for the database file
+# Default to a SQLite file next to the backend package (absolute, so the cwd does not matter)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_PATH = os.path.join(BASE_DIR, "llm_hub.db")
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+def _async_url(url: str) -> str:
+    """Map plain driver URLs to their async drivers (sqlite -> aiosqlite, postgres -> asyncpg)."""
+    for prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+DATABASE_URL = _async_url(os.getenv("DATABASE_URL") or f"sqlite+aiosqlite:///{DB_PATH}")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+ENGINE_SETTINGS = {
+    "echo": env_bool("DB_ECHO"),
+    # A server can drop idle connections; a local SQLite file cannot, so skip the extra round trip
+    "pool_pre_ping": env_bool("DB_POOL_PRE_PING", not IS_SQLITE),
+}
+if not (IS_SQLITE and ":memory:" in DATABASE_URL):
+    ENGINE_SETTINGS.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5" if IS_SQLITE else "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10" if IS_SQLITE else "20")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    )
+
+# Applied to every new SQLite connection: WAL lets readers run during the usage
+# writer's flushes, and NORMAL sync is durable enough in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")) * -1,  # negative = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+engine = create_async_engine(DATABASE_URL, **ENGINE_SETTINGS)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 class Base(DeclarativeBase):
     pass
 
@@ -18,6 +67,48 @@ async def get_db():
         yield session
 
 async def init_db():
-    from app.models.db_models import APIKey, UsageLog, User
+    from app.models.db_models import APIKey, UsageLog, UsageRollup, RequestAttempt, LatencyRollup, User, GatewayToken
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        # create_all skips indexes of tables that already exist
+        for index in UsageLog.__table__.indexes:
+            await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+
+def _add_missing_columns(sync_conn):
+    """Add columns introduced after a table was created (create_all never alters tables)."""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                literal = ("TRUE" if default else "FALSE") if isinstance(default, bool) else repr(default)
+                ddl += f" NOT NULL DEFAULT {literal}"
+            sync_conn.execute(text(ddl))
+            print(f"Added column {table.name}.{column.name}")
+
+async def check_db() -> Dict[str, Any]:
+    """Connect once and report the effective engine, pool and SQLite/Postgres settings."""
+    url = make_url(DATABASE_URL)
+    report: Dict[str, Any] = {
+        "url": url.render_as_string(hide_password=True),
+        "dialect": engine.dialect.name,
+        "driver": engine.dialect.driver,
+        "echo": ENGINE_SETTINGS["echo"],
+        "pool": engine.pool.status(),
+    }
+    async with engine.connect() as conn:
+        if IS_SQLITE:
+            report["pragmas"] = {
+                name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in SQLITE_PRAGMAS
+            }
+        elif engine.dialect.name == "postgresql":
+            report["server_version"] = (await conn.execute(text("SHOW server_version"))).scalar()
+    return report
@@ -0,0 +1,136 @@
+import os
+import time
+import httpx
+from contextvars import ContextVar
+from typing import Dict, Any, Iterable, Optional
+from app.services.metrics import metrics
+from app.services.rate_limits import cooldown_from_headers
+from app.core.config import env_bool
+
+# Set by the router while a provider call runs; the response hook stamps the
+# moment the upstream response headers arrived on it (`first_byte`) and any
+# rate-limit cooldown those headers ask for (`cooldown`)
+current_attempt: ContextVar[Optional[Any]] = ContextVar("current_attempt", default=None)
+
+# Defaults for every provider pool. Each value can be overridden globally
+# (e.g. HTTP_MAX_CONNECTIONS) or per provider (e.g. OPENAI_HTTP_MAX_CONNECTIONS).
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": 100,
+    "max_keepalive": 20,
+    "keepalive_expiry": 30.0,
+    "timeout": 30.0,
+    "connect_timeout": 5.0,
+}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class PoolStats:
+    """Counters for a single provider pool. Reuse = requests - new connections."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        # httpcore emits this event only when a brand new TCP connection is dialed
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+        }
+
+class HTTPClientPool:
+    """One long-lived, keep-alive httpx.AsyncClient per provider.
+
+    Clients are opened in the server lifespan and closed on shutdown. Calls made
+    outside the lifespan (scripts, tests) lazily create the client on first use.
+    """
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, PoolStats] = {}
+        self.settings: Dict[str, Dict[str, Any]] = {}
+
+    def _setting(self, provider: str, key: str):
+        default = DEFAULT_POOL_SETTINGS[key]
+        raw = os.getenv(f"{provider.upper()}_HTTP_{key.upper()}") or os.getenv(f"HTTP_{key.upper()}")
+        if raw is None:
+            return default
+        return type(default)(raw)
+
+    def _build_client(self, provider: str) -> httpx.AsyncClient:
+        settings = {key: self._setting(provider, key) for key in DEFAULT_POOL_SETTINGS}
+        http2 = env_bool(f"{provider.upper()}_HTTP2", env_bool("HTTP2_ENABLED"))
+        if http2 and not _http2_available():
+            print(f"HTTP/2 requested for {provider} but the 'h2' package is not installed, using HTTP/1.1.")
+            http2 = False
+        settings["http2"] = http2
+        self.settings[provider] = settings
+
+        stats = self.stats.setdefault(provider, PoolStats())
+
+        async def on_request(request: httpx.Request):
+            stats.requests += 1
+            request.extensions["trace"] = stats.trace
+
+        status_counters: Dict[int, Any] = {}
+
+        async def on_response(response: httpx.Response):
+            counter = status_counters.get(response.status_code)
+            if counter is None:
+                counter = status_counters[response.status_code] = metrics.upstream_responses.labels(provider, response.status_code)
+            counter.inc()
+            attempt = current_attempt.get()
+            if attempt is not None:
+                if attempt.first_byte is None:
+                    attempt.first_byte = time.monotonic()
+                # Errors are inspected by the router; successes may still say the budget is spent
+                if response.status_code < 400:
+                    attempt.cooldown = cooldown_from_headers(response.headers)
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive"],
+                keepalive_expiry=settings["keepalive_expiry"],
+            ),
+            timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
+    def start(self, providers: Iterable[str]):
+        for provider in providers:
+            self.get(provider)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self.clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._build_client(provider)
+            self.clients[provider] = client
+        return client
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    def get_stats(self, provider: Optional[str] = None) -> Dict[str, Any]:
+        providers = [provider] if provider else sorted(self.stats)
+        return {
+            name: {**self.stats[name].to_dict(), "settings": self.settings.get(name, {})}
+            for name in providers if name in self.stats
+        }
+
+http_clients = HTTPClientPool()
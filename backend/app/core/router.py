@@ -1,6 +1,10 @@
 import os
+import math
+import time
+import uuid
+import asyncio
 import httpx
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, AsyncIterator, Any, Callable, Awaitable
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.adapters.openai import OpenAIAdapter
 from app.adapters.gemini import GeminiAdapter
@@ -13,9 +17,75 @@ from app.adapters.together import TogetherAdapter
 from app.adapters.openrouter import OpenRouterAdapter
 from app.adapters.cohere import CohereAdapter
 from app.adapters.xai import XAIAdapter
-from app.models.schemas import ChatRequest, ChatResponse, LogicalModel
+from app.models.schemas import ChatRequest, ChatResponse, ChatDelta, LogicalModel
 from app.services.quota_service import quota_service
-from app.core.security import decrypt_value
+from app.services.provider_stats import provider_stats
+from app.services.circuit_breaker import circuit_breaker
+from app.services.usage_writer import usage_writer
+from app.services.metrics import metrics
+from app.core.security import DecryptionError
+from app.services.credentials import credential_cache
+from app.services.token_estimator import token_estimator
+from app.services import rate_limits
+from app.core.http_client import current_attempt
+from app.core.config import env_bool
+
+# Cooldowns when a provider gives no hint of its own (RATE_LIMIT_COOLDOWN) or rejects a key outright
+RATE_LIMIT_COOLDOWN = int(os.getenv("RATE_LIMIT_COOLDOWN", "300"))
+KEY_REJECTED_COOLDOWN = int(os.getenv("KEY_REJECTED_COOLDOWN", "600"))
+
+# How long a key whose stored secret cannot be decrypted is kept out of rotation
+DECRYPT_FAILURE_COOLDOWN = 3600
+
+class UpstreamRequestError(Exception):
+    """Every provider tried rejected the request itself (e.g. 400); carries the last one's status."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+class Attempt:
+    """One call to a provider made while routing a request."""
+
+    __slots__ = (
+        "provider", "key_id", "index", "hedged", "key_select", "handle",
+        "started", "first_byte", "latency", "outcome", "status_code", "reserved", "cooldown",
+    )
+
+    def __init__(self, provider: str, key_id: Optional[int], index: int, hedged: bool, key_select: float, reserved: int = 0):
+        self.provider = provider
+        self.key_id = key_id
+        # Estimated tokens held on the key until the attempt is released
+        self.reserved = reserved
+        self.index = index
+        self.hedged = hedged
+        # Seconds spent picking the provider and key for this attempt
+        self.key_select = key_select
+        # Extra object kept with the call, e.g. the stream of a streaming request
+        self.handle: Any = None
+        self.started = time.monotonic()
+        # Set by the HTTP client when the upstream response headers arrive
+        self.first_byte: Optional[float] = None
+        # Seconds until the call returned (the first delta for streams)
+        self.latency: Optional[float] = None
+        self.outcome: Optional[str] = None
+        self.status_code: Optional[int] = None
+        # Seconds the provider's rate-limit headers say the key should rest (set by the HTTP client)
+        self.cooldown: Optional[float] = None
+
+class RequestTrace:
+    """Timings of one routed request across all of its attempts."""
+
+    __slots__ = ("request_id", "model", "received_at", "dispatched_at", "answered_at", "attempts")
+
+    def __init__(self, model: LogicalModel, received_at: Optional[float]):
+        self.request_id = uuid.uuid4().hex
+        self.model = model
+        self.dispatched_at = time.monotonic()
+        # When the gateway accepted the request; queue time runs until dispatch
+        self.received_at = received_at if received_at is not None else self.dispatched_at
+        self.answered_at: Optional[float] = None
+        self.attempts: List[Attempt] = []
 
 class RoutingEngine:
     def __init__(self):
@@ -42,61 +112,374 @@ class RoutingEngine:
             LogicalModel.ANY: ["openai", "gemini", "groq", "anthropic", "deepseek", "mistral", "perplexity", "together", "openrouter", "cohere", "xai"]
         }
 
-    async def route(self, db: AsyncSession, request: ChatRequest) -> ChatResponse:
-        providers = self.routing_config.get(request.model, [])
+        # Opt-in hedging per logical model (e.g. HEDGE_DELAY_MS_FAST=800): if no attempt
+        # has answered (or sent its first token) within the delay, the next provider
+        # is started in parallel and the first one to succeed wins.
+        self.hedge_delays: Dict[LogicalModel, float] = {}
+        for model in LogicalModel:
+            delay_ms = os.getenv(f"HEDGE_DELAY_MS_{model.name}")
+            if delay_ms:
+                self.hedge_delays[model] = int(delay_ms) / 1000
+        self.hedge_max_parallel = int(os.getenv("HEDGE_MAX_PARALLEL", "2"))
+        self.record_timings = env_bool("REQUEST_TIMINGS_ENABLED", True)
+
+    async def _resolve_key(self, db: AsyncSession, provider_name: str, request: ChatRequest) -> Optional[Tuple[str, Optional[int], int]]:
+        """Return (api_key, key_id, reserved_tokens) for a provider, or None if it has no usable key."""
+        # Reserve the request's estimated size so a key never takes a request its quota cannot cover
+        reserve = token_estimator.reservation(request, provider_name)
+        # Get an active key from the database for this provider
+        active_key = await quota_service.get_active_key(db, provider_name, reserve)
+        while active_key:
+            try:
+                return credential_cache.get(active_key.id, active_key.key_value), active_key.id, reserve
+            except DecryptionError:
+                # Unusable until its ciphertext changes; keep it out of rotation meanwhile
+                await quota_service.release_key(active_key.id, reserve)
+                await quota_service.set_cooldown(db, active_key.id, DECRYPT_FAILURE_COOLDOWN)
+                active_key = await quota_service.get_active_key(db, provider_name, reserve)
+
+        if not active_key:
+            # Fallback to env var if no keys in DB yet (for backward compatibility/initial setup)
+            # In a full Phase 2 system, we would expect keys to be in DB.
+            env_key_name = f"{provider_name.upper()}_API_KEY"
+            api_key = os.getenv(env_key_name)
+            if not api_key:
+                return None
+            return api_key, None, 0
+
+    async def route(
+        self,
+        db: AsyncSession,
+        request: ChatRequest,
+        received_at: Optional[float] = None,
+        usage_rows: Optional[List[Dict[str, Any]]] = None
+    ) -> ChatResponse:
+        """Route a chat request. When `usage_rows` is given, usage events are
+        appended to it for the caller to write instead of being logged here."""
+        def start(adapter, api_key):
+            return adapter.chat_completion(request, api_key), None
+
+        trace = RequestTrace(request.model, received_at)
+        try:
+            response, attempt = await self._dispatch(db, request, start, trace)
+        except Exception:
+            await self._record_trace(trace)
+            raise
+        # Swap the reservation for what was actually used
+        await quota_service.release_key(attempt.key_id, attempt.reserved)
+        response.usage = token_estimator.fill_usage(
+            response.usage, request, attempt.provider,
+            (choice.message.content for choice in response.choices)
+        )
+
+        # Log usage if we have a key_id (meaning it came from DB)
+        if attempt.key_id and usage_rows is not None:
+            usage_rows.append(await quota_service.record_usage(
+                attempt.key_id,
+                request.model,
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                provider=attempt.provider,
+                latency_ms=int(attempt.latency * 1000)
+            ))
+        elif attempt.key_id:
+            await quota_service.log_usage(
+                db, 
+                attempt.key_id, 
+                request.model, 
+                response.usage.prompt_tokens, 
+                response.usage.completion_tokens,
+                provider=attempt.provider,
+                latency_ms=int(attempt.latency * 1000)
+            )
+        await self._record_trace(trace, attempt, attempt.latency)
         
+        return response
+
+    async def route_stream(self, db: AsyncSession, request: ChatRequest, received_at: Optional[float] = None) -> AsyncIterator[ChatDelta]:
+        """Stream deltas from the first provider that starts answering.
+
+        Fallback (and hedging) is only possible until the first delta has
+        arrived; after that the stream is committed to the chosen provider.
+        Usage is logged once the stream finishes.
+        """
+        def start(adapter, api_key):
+            stream = adapter.stream_chat_completion(request, api_key)
+            return self._first_delta(stream), stream
+
+        trace = RequestTrace(request.model, received_at)
+        try:
+            first, attempt = await self._dispatch(db, request, start, trace)
+        except Exception:
+            await self._record_trace(trace)
+            raise
+        stream = attempt.handle
+
+        usage = None
+        # Kept to estimate usage for providers that do not report it
+        completion: List[str] = []
+        try:
+            delta = first
+            while delta is not None:
+                if delta.usage:
+                    usage = delta.usage
+                if delta.content:
+                    completion.append(delta.content)
+                yield delta
+                delta = await stream.__anext__()
+        except StopAsyncIteration:
+            pass
+        finally:
+            # Give the key back before awaiting anything a cancellation could interrupt
+            await quota_service.release_key(attempt.key_id, attempt.reserved)
+            await stream.aclose()
+            upstream = time.monotonic() - attempt.started
+            usage = token_estimator.fill_usage(usage, request, attempt.provider, completion)
+            if attempt.key_id:
+                await quota_service.log_usage(
+                    db,
+                    attempt.key_id,
+                    request.model,
+                    usage.prompt_tokens,
+                    usage.completion_tokens,
+                    provider=attempt.provider,
+                    latency_ms=int(upstream * 1000)
+                )
+            await self._record_trace(trace, attempt, upstream)
+
+    @staticmethod
+    async def _first_delta(stream: AsyncIterator[ChatDelta]) -> Optional[ChatDelta]:
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def _dispatch(
+        self,
+        db: AsyncSession,
+        request: ChatRequest,
+        start: Callable[[Any, str], Tuple[Awaitable[Any], Any]],
+        trace: RequestTrace
+    ) -> Tuple[Any, Attempt]:
+        """Run attempts over the model's providers until one succeeds.
+
+        `start(adapter, api_key)` returns the awaitable for one attempt and a
+        handle kept alongside it (the stream for streaming requests). Without
+        hedging, providers are tried one after another. With hedging, a further
+        provider is started whenever nothing has answered within the hedge
+        delay; the first success wins and every other attempt is cancelled.
+        Returns the winner's result and its Attempt; every attempt started is
+        added to `trace`.
+        """
+        providers = iter(provider_stats.order(self.routing_config.get(request.model, [])))
+        hedge_delay = self.hedge_delays.get(request.model)
+        max_parallel = self.hedge_max_parallel if hedge_delay else 1
+        attempts: Dict[asyncio.Task, Attempt] = {}
         last_exception = None
-        for provider_name in providers:
-            # Get an active key from the database for this provider
-            active_key = await quota_service.get_active_key(db, provider_name)
-            
-            if not active_key:
-                # Fallback to env var if no keys in DB yet (for backward compatibility/initial setup)
-                # In a full Phase 2 system, we would expect keys to be in DB.
-                env_key_name = f"{provider_name.upper()}_API_KEY"
-                api_key = os.getenv(env_key_name)
-                key_id = None
-                if not api_key:
+        # Set while every failure so far was a provider refusing the request
+        rejected: Optional[Tuple[str, httpx.Response]] = None
+        only_rejections = True
+        failures = 0
+
+        async def launch_next(hedged: bool = False) -> bool:
+            selecting = time.monotonic()
+            for provider_name in providers:
+                # Checked before taking a key, which spends one of its RPM tokens
+                adapter = self.adapters.get(provider_name)
+                if not adapter:
                     continue
-            else:
-                api_key = decrypt_value(active_key.key_value)
-                key_id = active_key.id
-                
-            adapter = self.adapters.get(provider_name)
-            if not adapter:
-                continue
-                
-            try:
+
+                if not circuit_breaker.allow(provider_name):
+                    print(f"Circuit for {provider_name} is open, skipping.")
+                    continue
+
+                resolved = await self._resolve_key(db, provider_name, request)
+                if not resolved:
+                    # Give back the probe slot a half-open circuit handed out
+                    circuit_breaker.release(provider_name)
+                    continue
+                api_key, key_id, reserved = resolved
+
                 print(f"Routing request for {request.model} to {provider_name}...")
-                response = await adapter.chat_completion(request, api_key)
-                
-                # Log usage if we have a key_id (meaning it came from DB)
-                if key_id:
-                    await quota_service.log_usage(
-                        db, 
-                        key_id, 
-                        request.model, 
-                        response.usage.prompt_tokens, 
-                        response.usage.completion_tokens
-                    )
-                
-                return response
-            except httpx.HTTPStatusError as e:
-                # Detect rate limits
-                if e.response.status_code == 429 and key_id:
-                    print(f"Rate limit hit for {provider_name}, putting key on cooldown.")
-                    await quota_service.set_cooldown(db, key_id)
-                
-                print(f"HTTP Error with provider {provider_name}: {str(e)[:100]}")
-                last_exception = e
-                continue
-            except Exception as e:
-                print(f"Error with provider {provider_name}: {str(e)[:100]}")
-                last_exception = e
-                continue
-        
+                attempt = Attempt(provider_name, key_id, len(trace.attempts), hedged, time.monotonic() - selecting, reserved)
+                # The task copies the current context, so the HTTP client sees this attempt
+                token = current_attempt.set(attempt)
+                try:
+                    awaitable, attempt.handle = start(adapter, api_key)
+                    task = asyncio.ensure_future(awaitable)
+                finally:
+                    current_attempt.reset(token)
+                attempts[task] = attempt
+                trace.attempts.append(attempt)
+                if hedged:
+                    metrics.hedges.labels(request.model.value, provider_name).inc()
+                elif attempt.index:
+                    metrics.fallbacks.labels(request.model.value, provider_name).inc()
+                return True
+            return False
+
+        exhausted = not await launch_next()
+        try:
+            while attempts:
+                can_hedge = not exhausted and len(attempts) < max_parallel
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    print(f"No answer for {request.model} within {hedge_delay}s, hedging to the next provider.")
+                    exhausted = not await launch_next(hedged=True)
+                    continue
+
+                for task in done:
+                    attempt = attempts.pop(task)
+                    attempt.latency = latency = time.monotonic() - attempt.started
+                    provider_name, key_id = attempt.provider, attempt.key_id
+                    metrics.upstream_latency.labels(request.model.value, provider_name).observe(latency)
+                    try:
+                        result = task.result()
+                    except httpx.HTTPStatusError as e:
+                        await quota_service.release_key(key_id, attempt.reserved)
+                        kind = rate_limits.classify_response(e.response)
+                        rate_limited = kind == rate_limits.RATE_LIMITED
+                        attempt.outcome = "rate_limited" if rate_limited else "error"
+                        attempt.status_code = e.response.status_code
+                        # A refused request says nothing about the provider's health
+                        unhealthy = kind not in (rate_limits.RATE_LIMITED, rate_limits.BAD_REQUEST)
+                        provider_stats.record(provider_name, key_id, latency, error=unhealthy, rate_limited=rate_limited)
+                        # Only server errors say the provider is unhealthy
+                        if e.response.status_code >= 500:
+                            if circuit_breaker.record_failure(provider_name, key_id):
+                                await quota_service.set_cooldown(db, key_id, int(circuit_breaker.open_seconds))
+                        else:
+                            circuit_breaker.release(provider_name)
+                        await self._handle_http_error(db, provider_name, key_id, e, kind)
+                        await self._discard(attempt.handle)
+                        if kind == rate_limits.BAD_REQUEST:
+                            # Too long or unsupported for this provider; another may accept it
+                            rejected = (provider_name, e.response)
+                        else:
+                            only_rejections = False
+                        last_exception = e
+                        continue
+                    except Exception as e:
+                        only_rejections = False
+                        await quota_service.release_key(key_id, attempt.reserved)
+                        attempt.outcome = "error"
+                        provider_stats.record(provider_name, key_id, latency, error=True)
+                        if circuit_breaker.record_failure(provider_name, key_id):
+                            await quota_service.set_cooldown(db, key_id, int(circuit_breaker.open_seconds))
+                        print(f"Error with provider {provider_name}: {str(e)[:100]}")
+                        last_exception = e
+                        await self._discard(attempt.handle)
+                        continue
+                    attempt.outcome = "success"
+                    trace.answered_at = time.monotonic()
+                    provider_stats.record(provider_name, key_id, latency)
+                    circuit_breaker.record_success(provider_name, key_id)
+                    if attempt.cooldown and key_id:
+                        # The provider says this key's budget is spent; rest it before it returns 429s
+                        await quota_service.set_cooldown(db, key_id, _cooldown_seconds(attempt.cooldown))
+                    return result, attempt
+
+                # Every finished attempt failed: fall back to the next provider after a jittered pause
+                if not exhausted:
+                    failures += 1
+                    delay = rate_limits.backoff.delay(failures)
+                    if delay:
+                        await asyncio.sleep(delay)
+                    exhausted = not await launch_next()
+        finally:
+            # Cancel the attempts that lost the race. Their breaker slots are
+            # freed right away and the rest of the cleanup is shielded, so a
+            # second cancellation of this request cannot leak keys or slots.
+            for task, attempt in attempts.items():
+                task.cancel()
+                attempt.outcome = "cancelled"
+                circuit_breaker.release(attempt.provider)
+            for attempt in trace.attempts:
+                metrics.attempts.labels(request.model.value, attempt.provider, attempt.key_id or "env", attempt.outcome).inc()
+            if attempts:
+                await asyncio.shield(self._release_cancelled(dict(attempts)))
+
+        if rejected and only_rejections:
+            provider_name, response = rejected
+            raise UpstreamRequestError(response.status_code, f"Provider {provider_name} rejected the request: {_error_message(response)}")
         if last_exception:
             raise Exception(f"All providers failed. Last error: {str(last_exception)}")
         raise Exception(f"No providers available for model {request.model}")
 
+    async def _record_trace(self, trace: RequestTrace, winner: Optional[Attempt] = None, upstream: Optional[float] = None):
+        """Queue one timing row per attempt. `upstream` is the winner's total upstream time."""
+        if not self.record_timings:
+            return
+
+        def ms(seconds: Optional[float]) -> Optional[int]:
+            return int(seconds * 1000) if seconds is not None else None
+
+        timestamp = int(time.time())
+        for attempt in trace.attempts:
+            row = {
+                "request_id": trace.request_id,
+                "timestamp": timestamp,
+                "model": trace.model.value,
+                "provider": attempt.provider,
+                "api_key_id": attempt.key_id,
+                "attempt": attempt.index,
+                "hedged": attempt.hedged,
+                "outcome": attempt.outcome or "cancelled",
+                "status_code": attempt.status_code,
+                "queue_ms": ms(trace.dispatched_at - trace.received_at) if attempt.index == 0 else None,
+                "key_select_ms": ms(attempt.key_select),
+                "ttfb_ms": ms(attempt.first_byte - attempt.started) if attempt.first_byte else None,
+                # A cancelled loser never finished, so it has no upstream time
+                "upstream_ms": ms(attempt.latency) if attempt.outcome != "cancelled" else None,
+                "overhead_ms": None,
+            }
+            if attempt is winner:
+                row["upstream_ms"] = ms(upstream)
+                # Time the client waited for the answer beyond what the winning provider took
+                row["overhead_ms"] = ms(max(trace.answered_at - trace.received_at - attempt.latency, 0.0))
+            await usage_writer.enqueue(row, kind="attempt")
+
+    async def _release_cancelled(self, attempts: Dict[asyncio.Task, Attempt]):
+        """Give back the keys of cancelled attempts, then wait for them to finish and close their streams."""
+        for attempt in attempts.values():
+            await quota_service.release_key(attempt.key_id, attempt.reserved)
+        await asyncio.gather(*attempts, return_exceptions=True)
+        for attempt in attempts.values():
+            await self._discard(attempt.handle)
+
+    @staticmethod
+    async def _discard(handle: Any):
+        if handle is not None:
+            await handle.aclose()
+
+    async def _handle_http_error(self, db: AsyncSession, provider_name: str, key_id: Optional[int], e: httpx.HTTPStatusError, kind: str):
+        # Rest the key for as long as the provider asks, or the default without a hint
+        if kind == rate_limits.RATE_LIMITED and key_id:
+            seconds = rate_limits.cooldown_from_error(e.response)
+            cooldown = _cooldown_seconds(seconds) if seconds is not None else RATE_LIMIT_COOLDOWN
+            print(f"Rate limit hit for {provider_name}, putting key on cooldown for {cooldown}s.")
+            await quota_service.set_cooldown(db, key_id, cooldown)
+        elif kind == rate_limits.KEY_REJECTED and key_id:
+            print(f"Key rejected by {provider_name}, putting key on cooldown for {KEY_REJECTED_COOLDOWN}s.")
+            await quota_service.set_cooldown(db, key_id, KEY_REJECTED_COOLDOWN)
+
+        print(f"HTTP Error with provider {provider_name}: {str(e)[:100]}")
+
+def _cooldown_seconds(seconds: float) -> int:
+    # Whole seconds, at least one, and never more than a day
+    return min(max(math.ceil(seconds), 1), 86400)
+
+def _error_message(response: httpx.Response) -> str:
+    try:
+        body = response.json()
+    except (httpx.ResponseNotRead, ValueError):
+        return response.reason_phrase
+    error = body.get("error", body) if isinstance(body, dict) else body
+    message = error.get("message") if isinstance(error, dict) else error
+    return str(message or response.reason_phrase)[:500]
+
 router = RoutingEngine()
@@ -1,14 +1,25 @@
 import os
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, Union, Optional, Tuple
 from jose import jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
 # Password Hashing
-# "bcrypt" is generally recommended over "pbkdf2_sha256" for new projects
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# "bcrypt" is generally recommended over "pbkdf2_sha256" for new projects.
+# Hashes made with another work factor are upgraded on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a few threads keep hashing off the event loop
+# without letting a burst of logins use every core
+_hash_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    thread_name_prefix="password-hash"
+)
 
 # JWT Configuration
 # CRITICAL: Fail if no secret key is provided in production
@@ -36,6 +47,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify in the hashing pool; also returns a new hash when the stored one uses an old work factor."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_pool, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -47,69 +67,130 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 
 # Encryption for API Keys
-# Generate a key if not exists (in prod this should be persistent)
-_ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
-if not _ENCRYPTION_KEY:
+# ENCRYPTION_KEY may list several comma-separated keys: the first encrypts,
+# all of them decrypt, so a new key can be put in front and the old ones
+# kept until every stored value has been re-encrypted (see credentials.rotate).
+_ENCRYPTION_KEYS = [k.strip() for k in os.getenv("ENCRYPTION_KEY", "").split(",") if k.strip()]
+if not _ENCRYPTION_KEYS:
     # Use a derivation of the SECRET_KEY to ensure consistency across restarts if SECRET_KEY is consistent
-    # Or just warn and generate one. For specific implementation, let's derive from SECRET_KEY if long enough, else generate.
-    # To be safe and simple: Use a hardcoded fallback hash for dev if env missing.
     import base64
     import hashlib
     # Derive a 32-byte key from SECRET_KEY
     k = hashlib.sha256(SECRET_KEY.encode()).digest()
-    _ENCRYPTION_KEY = base64.urlsafe_b64encode(k).decode()
+    _ENCRYPTION_KEYS = [base64.urlsafe_b64encode(k).decode()]
+
+_primary_fernet = Fernet(_ENCRYPTION_KEYS[0])
+_fernet = MultiFernet([Fernet(key) for key in _ENCRYPTION_KEYS])
 
-_fernet = Fernet(_ENCRYPTION_KEY)
+# Every Fernet token starts with the version byte 0x80, i.e. "gAAAAA" in base64
+_FERNET_TOKEN_PREFIX = "gAAAAA"
+
+class DecryptionError(Exception):
+    """A stored secret looks encrypted but none of the configured keys can decrypt it."""
+
+def is_encrypted(value: str) -> bool:
+    return bool(value) and value.startswith(_FERNET_TOKEN_PREFIX)
 
 def encrypt_value(value: str) -> str:
     if not value: return value
     return _fernet.encrypt(value.encode()).decode()
 
 def decrypt_value(value: str) -> str:
-    if not value: return value
+    """Decrypt a stored secret. Values that were never encrypted (keys seeded
+    as plain text) are returned as they are; anything else that fails to
+    decrypt raises DecryptionError instead of being passed upstream."""
+    if not is_encrypted(value):
+        return value
     try:
         return _fernet.decrypt(value.encode()).decode()
-    except Exception:
-        # If decryption fails (e.g. old plain text keys), return original
-        return value
+    except InvalidToken:
+        raise DecryptionError("Stored value cannot be decrypted with the configured ENCRYPTION_KEY")
+
+def needs_reencryption(value: str) -> bool:
+    """Whether a stored value is plain text or encrypted with a non-primary key."""
+    if not value:
+        return False
+    if not is_encrypted(value):
+        return True
+    try:
+        _primary_fernet.decrypt(value.encode())
+        return False
+    except InvalidToken:
+        return True
+
+def reencrypt_value(value: str) -> str:
+    """Re-encrypt with the primary key (encrypting plain-text values for the first time)."""
+    if not is_encrypted(value):
+        return encrypt_value(value)
+    try:
+        return _fernet.rotate(value.encode()).decode()
+    except InvalidToken:
+        raise DecryptionError("Stored value cannot be decrypted with the configured ENCRYPTION_KEY")
 
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.core.database import get_db
-from app.models.db_models import User
+from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
+from app.models.db_models import User, GatewayToken
+from app.services.auth_cache import auth_cache, MISSING
+from app.core.config import env_bool
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="v1/auth/login")
+api_token_scheme = HTTPBearer(auto_error=False)
+
+# Off by default so existing internal deployments keep working without tokens
+PUBLIC_API_AUTH = env_bool("ENABLE_PUBLIC_API_AUTH")
+GATEWAY_TOKEN_PREFIX = "lh-"
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except Exception:
-        raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.username == token_data.username))
-    user = result.scalar_one_or_none()
-    if user is None:
-        raise credentials_exception
+
+def _jwt_username(token: str) -> Optional[str]:
+    """Decode a JWT once; the result is cached until the token expires."""
+    username = auth_cache.cached_jwt(token)
+    if username is MISSING:
+        username = None
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username = payload.get("sub")
+            auth_cache.put_jwt(token, username, payload.get("exp"))
+        except Exception:
+            auth_cache.put_jwt(token, None, None)
+    return username
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    username = _jwt_username(token)
+    user = await auth_cache.get_user(username) if username else None
+    if user is None or not user.is_active:
+        raise _credentials_exception()
     return user
 
 async def check_admin(user: User = Depends(get_current_user)) -> User:
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="The user doesn't have enough privileges")
     return user
+
+async def require_api_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(api_token_scheme)
+) -> Optional[Union[GatewayToken, User]]:
+    """Authenticate /v1/chat callers with a gateway token (or a dashboard JWT) when enabled."""
+    if not PUBLIC_API_AUTH:
+        return None
+    if credentials is None:
+        raise _credentials_exception()
+    token = credentials.credentials
+    if token.startswith(GATEWAY_TOKEN_PREFIX):
+        entry = await auth_cache.get_token(token)
+        if entry is None:
+            raise _credentials_exception()
+        row, owner_active = entry
+        # A disabled user's tokens stop working along with the user
+        if not row.is_active or not owner_active:
+            raise _credentials_exception()
+        return row
+    return await get_current_user(token)
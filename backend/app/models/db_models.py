@@ -1,6 +1,6 @@
 import time
 from typing import List, Optional
-from sqlalchemy import String, Integer, Float, Boolean, ForeignKey, JSON
+from sqlalchemy import String, Integer, Float, Boolean, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.core.database import Base
 
@@ -17,11 +17,21 @@ class APIKey(Base):
     daily_quota: Mapped[int] = mapped_column(default=0)  # 0 means unlimited
     used_today: Mapped[int] = mapped_column(default=0)
     last_reset: Mapped[int] = mapped_column(default=lambda: int(time.time()))
+    # Provider-side limits enforced before sending anything upstream; 0 means unlimited
+    rpm_limit: Mapped[int] = mapped_column(default=0)
+    tpm_limit: Mapped[int] = mapped_column(default=0)
+    max_concurrency: Mapped[int] = mapped_column(default=0)
 
     usage_logs: Mapped[List["UsageLog"]] = relationship(back_populates="api_key")
 
 class UsageLog(Base):
     __tablename__ = "usage_logs"
+    # Newest-first listing pages on (timestamp, id); filtered views use the key/model prefixes
+    __table_args__ = (
+        Index("ix_usage_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_usage_logs_key_timestamp", "api_key_id", "timestamp", "id"),
+        Index("ix_usage_logs_model_timestamp", "model", "timestamp", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     api_key_id: Mapped[int] = mapped_column(ForeignKey("api_keys.id"))
@@ -33,6 +43,65 @@ class UsageLog(Base):
 
     api_key: Mapped["APIKey"] = relationship(back_populates="usage_logs")
 
+class UsageRollup(Base):
+    """Hourly pre-aggregated usage per model/provider/key, updated as usage is written."""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "model", "provider", "api_key_id", name="uq_usage_rollup_bucket"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    bucket_start: Mapped[int] = mapped_column(Integer, index=True)  # start of the hour (epoch seconds)
+    model: Mapped[str] = mapped_column(String(50))
+    provider: Mapped[str] = mapped_column(String(50))
+    api_key_id: Mapped[int] = mapped_column(Integer)
+    requests: Mapped[int] = mapped_column(default=0)
+    prompt_tokens: Mapped[int] = mapped_column(default=0)
+    completion_tokens: Mapped[int] = mapped_column(default=0)
+    total_tokens: Mapped[int] = mapped_column(default=0)
+    latency_ms_sum: Mapped[int] = mapped_column(default=0)
+    latency_count: Mapped[int] = mapped_column(default=0)  # requests that carried a latency measurement
+
+class RequestAttempt(Base):
+    """Timings of one provider attempt, including failed, fallback, hedged and cancelled ones."""
+    __tablename__ = "request_attempts"
+    __table_args__ = (
+        Index("ix_request_attempts_timestamp", "timestamp"),
+        Index("ix_request_attempts_provider_timestamp", "provider", "timestamp"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    request_id: Mapped[str] = mapped_column(String(32), index=True)
+    timestamp: Mapped[int] = mapped_column(default=lambda: int(time.time()))
+    model: Mapped[str] = mapped_column(String(50))
+    provider: Mapped[str] = mapped_column(String(50))
+    api_key_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    attempt: Mapped[int] = mapped_column(default=0)  # order in which attempts were started
+    hedged: Mapped[bool] = mapped_column(default=False)
+    outcome: Mapped[str] = mapped_column(String(20))  # success, error, rate_limited, cancelled
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Milliseconds; queue time is stored on the first attempt and overhead on the winner only
+    queue_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    key_select_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    ttfb_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    upstream_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    overhead_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+class LatencyRollup(Base):
+    """Hourly latency histograms per model/provider/metric, used for percentiles."""
+    __tablename__ = "latency_rollups"
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "model", "provider", "metric", "le_ms", name="uq_latency_rollup_bucket"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    bucket_start: Mapped[int] = mapped_column(Integer, index=True)  # start of the hour (epoch seconds)
+    model: Mapped[str] = mapped_column(String(50))
+    provider: Mapped[str] = mapped_column(String(50))
+    metric: Mapped[str] = mapped_column(String(20))  # queue, key_select, ttfb, upstream, overhead
+    le_ms: Mapped[int] = mapped_column(Integer)  # histogram bucket upper bound, -1 for +Inf
+    count: Mapped[int] = mapped_column(default=0)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -45,3 +114,15 @@ class User(Base):
     created_at: Mapped[int] = mapped_column(default=lambda: int(time.time()))
     last_login: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
+
+class GatewayToken(Base):
+    """Token clients send to /v1/chat; only its SHA-256 digest is stored."""
+    __tablename__ = "gateway_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(100))
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    token_prefix: Mapped[str] = mapped_column(String(20))
+    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"), nullable=True)
+    is_active: Mapped[bool] = mapped_column(default=True)
+    created_at: Mapped[int] = mapped_column(default=lambda: int(time.time()))
@@ -18,6 +18,8 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 512
     stream: Optional[bool] = False
+    # Set to false to bypass the response cache for this request
+    cache: Optional[bool] = None
 
 class ChatChoice(BaseModel):
     index: int
@@ -37,6 +39,45 @@ class ChatResponse(BaseModel):
     choices: List[ChatChoice]
     usage: Usage
 
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    # Items in flight at once; capped by BATCH_MAX_CONCURRENCY on the server
+    concurrency: Optional[int] = None
+    # Stream results as NDJSON lines in completion order instead of one JSON body
+    stream: Optional[bool] = False
+
+class ChatBatchItem(BaseModel):
+    index: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+class ChatBatchSummary(BaseModel):
+    succeeded: int = 0
+    failed: int = 0
+    usage: Usage = Field(default_factory=lambda: Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0))
+
+class ChatBatchResponse(ChatBatchSummary):
+    results: List[ChatBatchItem]
+
+class ChatDelta(BaseModel):
+    """Provider-independent piece of a streamed completion."""
+    content: Optional[str] = None
+    finish_reason: Optional[str] = None
+    usage: Optional[Usage] = None
+
+class ChatChunkChoice(BaseModel):
+    index: int = 0
+    delta: Dict[str, str] = {}
+    finish_reason: Optional[str] = None
+
+class ChatCompletionChunk(BaseModel):
+    id: str
+    object: str = "chat.completion.chunk"
+    created: int
+    model: str
+    choices: List[ChatChunkChoice]
+    usage: Optional[Usage] = None
+
 class UserBase(BaseModel):
     username: str
     email: Optional[str] = None
@@ -57,10 +98,40 @@ class UserOut(UserBase):
     class Config:
         from_attributes = True
 
+class UserUpdate(BaseModel):
+    role: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class GatewayTokenCreate(BaseModel):
+    name: str = Field(..., min_length=1)
+
+class GatewayTokenUpdate(BaseModel):
+    name: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class GatewayTokenOut(BaseModel):
+    id: int
+    name: str
+    token_prefix: str
+    user_id: Optional[int] = None
+    is_active: bool
+    created_at: int
+
+    class Config:
+        from_attributes = True
+
+class GatewayTokenCreated(GatewayTokenOut):
+    # Only returned once, when the token is created
+    token: str
+
 class APIKeyBase(BaseModel):
     name: str = Field(..., min_length=1)
     provider: str
     daily_quota: Optional[int] = 0
+    # 0 means unlimited
+    rpm_limit: Optional[int] = 0
+    tpm_limit: Optional[int] = 0
+    max_concurrency: Optional[int] = 0
 
 class APIKeyCreate(APIKeyBase):
     key_value: str
@@ -69,6 +140,9 @@ class APIKeyUpdate(BaseModel):
     name: Optional[str] = None
     is_active: Optional[bool] = None
     daily_quota: Optional[int] = None
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    max_concurrency: Optional[int] = None
 
 class APIKeyOut(APIKeyBase):
     id: int
@@ -76,6 +150,7 @@ class APIKeyOut(APIKeyBase):
     is_active: bool
     used_today: int
     cooldown_until: Optional[int] = None
+    in_flight: int = 0
 
     class Config:
         from_attributes = True
@@ -88,6 +163,8 @@ class UsageLogOut(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    key_name: Optional[str] = None
+    provider: Optional[str] = None
 
     class Config:
         from_attributes = True
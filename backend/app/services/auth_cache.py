@@ -0,0 +1,130 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import select
+from app.core.database import AsyncSessionLocal
+from app.models.db_models import User, GatewayToken
+
+MISSING = object()
+
+def hash_token(token: str) -> str:
+    # Gateway tokens are long random strings, so a fast digest is enough at rest
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class TTLCache:
+    """Small LRU map whose entries expire; misses (None) can be cached for a shorter time."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (expires_at, value)
+        self.entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISSING
+        if entry[0] <= time.monotonic():
+            del self.entries[key]
+            return MISSING
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Any, value: Any, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Any):
+        self.entries.pop(key, None)
+
+class AuthCache:
+    """Keeps authentication off the database for repeat callers.
+
+    Decoded JWTs (raw token -> username, until the token expires), users by
+    username and gateway tokens by digest, together with whether their owner
+    is active, are cached for AUTH_CACHE_TTL seconds. Unknown users and
+    tokens are cached briefly too, so a client retrying a bad token does not
+    hit the database on every request. Admin changes invalidate the entries
+    on this worker; other workers pick them up when the TTL runs out.
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("AUTH_CACHE_TTL", "60"))
+        self.negative_ttl = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "5"))
+        max_entries = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+        self.jwts = TTLCache(max_entries)
+        self.users = TTLCache(max_entries)
+        self.tokens = TTLCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def cached_jwt(self, token: str) -> Any:
+        return self.jwts.get(token)
+
+    def put_jwt(self, token: str, username: Optional[str], expires_at: Optional[float]):
+        ttl = self.ttl if username else self.negative_ttl
+        if expires_at:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl > 0:
+            self.jwts.put(token, username, ttl)
+
+    async def get_user(self, username: str) -> Optional[User]:
+        user = self.users.get(username)
+        if user is not MISSING:
+            self.hits += 1
+            return user
+        self.misses += 1
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+        # Detached once the session closes; loaded attributes stay readable
+        self.users.put(username, user, self.ttl if user else self.negative_ttl)
+        return user
+
+    async def get_token(self, token: str) -> Optional[Tuple[GatewayToken, bool]]:
+        """Return (token row, whether its owner is active), or None for an unknown token.
+
+        Tokens without an owner count as having an active one.
+        """
+        digest = hash_token(token)
+        entry = self.tokens.get(digest)
+        if entry is not MISSING:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GatewayToken, User.is_active)
+                .outerjoin(User, GatewayToken.user_id == User.id)
+                .where(GatewayToken.token_hash == digest)
+            )
+            found = result.first()
+        entry = (found[0], found[1] is not False) if found else None
+        self.tokens.put(digest, entry, self.ttl if entry else self.negative_ttl)
+        return entry
+
+    def invalidate_user(self, username: str):
+        self.users.pop(username)
+
+    def invalidate_token(self, token_hash: str):
+        self.tokens.pop(token_hash)
+
+    def invalidate_user_tokens(self, user_id: int):
+        """Drop the cached tokens owned by a user, e.g. after the user is disabled."""
+        for digest, (_, entry) in list(self.tokens.entries.items()):
+            if entry is not None and entry[0].user_id == user_id:
+                self.tokens.pop(digest)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "jwts": len(self.jwts.entries),
+            "users": len(self.users.entries),
+            "tokens": len(self.tokens.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+auth_cache = AuthCache()
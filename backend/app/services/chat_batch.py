@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+from typing import AsyncIterator, List, Dict, Any, Optional
+from app.core.database import AsyncSessionLocal
+from app.core.router import router
+from app.models.schemas import ChatRequest, ChatBatchItem, ChatBatchSummary
+from app.services.quota_service import quota_service
+
+class ChatBatchRunner:
+    """Runs the items of a batch through the RoutingEngine with bounded concurrency.
+
+    At most `concurrency` items are in flight; each gets its own session and
+    goes through normal provider ordering, so items spread over providers and
+    (round-robin) keys. Failures are reported per item. Usage of the whole
+    batch is counted against keys as items finish but written in one go at
+    the end, also when the client goes away before the batch is done.
+    """
+
+    def __init__(self):
+        self.max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+        self.max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+    def concurrency(self, requested: Optional[int]) -> int:
+        if not requested or requested < 1:
+            return self.max_concurrency
+        return min(requested, self.max_concurrency)
+
+    async def run(self, requests: List[ChatRequest], concurrency: int, summary: ChatBatchSummary) -> AsyncIterator[ChatBatchItem]:
+        """Yield items in completion order and fill `summary` along the way."""
+        received_at = time.monotonic()
+        semaphore = asyncio.Semaphore(concurrency)
+        usage_rows: List[Dict[str, Any]] = []
+
+        async def run_item(index: int, request: ChatRequest) -> ChatBatchItem:
+            if request.stream:
+                return ChatBatchItem(index=index, error="Streaming is not supported inside a batch")
+            async with semaphore:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        response = await router.route(db, request, received_at, usage_rows=usage_rows)
+                except Exception as e:
+                    return ChatBatchItem(index=index, error=str(e))
+            return ChatBatchItem(index=index, response=response)
+
+        tasks = [asyncio.ensure_future(run_item(index, request)) for index, request in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                if item.response:
+                    summary.succeeded += 1
+                    summary.usage.prompt_tokens += item.response.usage.prompt_tokens
+                    summary.usage.completion_tokens += item.response.usage.completion_tokens
+                    summary.usage.total_tokens += item.response.usage.total_tokens
+                else:
+                    summary.failed += 1
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Shielded: when the client goes away the server cancels again while
+            # the items wind down, which must not skip writing their usage
+            await asyncio.shield(self._settle(tasks, usage_rows))
+
+    @staticmethod
+    async def _settle(tasks: List[asyncio.Task], usage_rows: List[Dict[str, Any]]):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await quota_service.write_usage(usage_rows)
+
+chat_batch = ChatBatchRunner()
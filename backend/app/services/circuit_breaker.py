@@ -0,0 +1,162 @@
+import os
+import time
+from typing import Dict, Any, Optional, List
+from app.core.config import env_bool
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class Circuit:
+    """Closed/open/half-open state of one provider.
+
+    Failures are counted both consecutively and in a sliding window made of
+    one-second buckets. Either threshold opens the circuit; after the open
+    period a limited number of probe requests decide whether to close it again.
+    """
+
+    def __init__(self, window_seconds: int):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.times_opened = 0
+        # [second, requests, failures] buckets covering the sliding window
+        self.buckets: List[List[int]] = [[0, 0, 0] for _ in range(window_seconds)]
+
+    def bucket(self, now: float) -> List[int]:
+        second = int(now)
+        bucket = self.buckets[second % len(self.buckets)]
+        if bucket[0] != second:
+            bucket[0], bucket[1], bucket[2] = second, 0, 0
+        return bucket
+
+    def window_counts(self, now: float):
+        oldest = int(now) - len(self.buckets)
+        requests = failures = 0
+        for second, total, failed in self.buckets:
+            if second > oldest:
+                requests += total
+                failures += failed
+        return requests, failures
+
+class CircuitBreaker:
+    """Per-provider circuit breakers consulted by RoutingEngine before each attempt."""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+        self.error_rate_threshold = float(os.getenv("CB_ERROR_RATE_THRESHOLD", "0.5"))
+        self.min_requests = int(os.getenv("CB_MIN_REQUESTS", "10"))
+        self.window_seconds = int(os.getenv("CB_WINDOW_SECONDS", "60"))
+        self.open_seconds = float(os.getenv("CB_OPEN_SECONDS", "30"))
+        self.half_open_probes = int(os.getenv("CB_HALF_OPEN_PROBES", "1"))
+        self.success_threshold = int(os.getenv("CB_SUCCESS_THRESHOLD", "2"))
+        # Optionally break individual keys too: record_failure reports a key that
+        # keeps failing so the caller puts it on cooldown for the open period
+        self.per_key = env_bool("CB_PER_KEY")
+        self.circuits: Dict[str, Circuit] = {}
+        self.key_failures: Dict[int, int] = {}
+
+    def _circuit(self, provider: str) -> Circuit:
+        circuit = self.circuits.get(provider)
+        if circuit is None:
+            circuit = self.circuits[provider] = Circuit(self.window_seconds)
+        return circuit
+
+    def allow(self, provider: str) -> bool:
+        """Whether an attempt may be sent to the provider. Reserves a probe slot when half-open."""
+        circuit = self.circuits.get(provider)
+        if circuit is None or circuit.state == CLOSED:
+            return True
+        if circuit.state == OPEN:
+            if time.monotonic() - circuit.opened_at < self.open_seconds:
+                return False
+            circuit.state = HALF_OPEN
+            circuit.probe_successes = 0
+            circuit.probes_in_flight = 0
+            print(f"Circuit for {provider} is half-open, probing.")
+        if circuit.probes_in_flight >= self.half_open_probes:
+            return False
+        circuit.probes_in_flight += 1
+        return True
+
+    def record_success(self, provider: str, key_id: Optional[int] = None):
+        now = time.monotonic()
+        circuit = self._circuit(provider)
+        circuit.bucket(now)[1] += 1
+        circuit.consecutive_failures = 0
+        if key_id is not None:
+            self.key_failures.pop(key_id, None)
+        if circuit.state == HALF_OPEN:
+            circuit.probes_in_flight = max(circuit.probes_in_flight - 1, 0)
+            circuit.probe_successes += 1
+            if circuit.probe_successes >= self.success_threshold:
+                self._close(provider, circuit)
+
+    def record_failure(self, provider: str, key_id: Optional[int] = None) -> bool:
+        """Count a failure. Returns True when the key should be put on cooldown."""
+        now = time.monotonic()
+        circuit = self._circuit(provider)
+        bucket = circuit.bucket(now)
+        bucket[1] += 1
+        bucket[2] += 1
+        circuit.consecutive_failures += 1
+
+        trip_key = False
+        if key_id is not None and self.per_key:
+            failures = self.key_failures.get(key_id, 0) + 1
+            self.key_failures[key_id] = failures
+            if failures >= self.failure_threshold:
+                print(f"Key {key_id} keeps failing, putting it on cooldown for {self.open_seconds}s.")
+                trip_key = True
+
+        if circuit.state == HALF_OPEN:
+            self._open(provider, circuit, now)
+        elif circuit.state == CLOSED:
+            requests, failures = circuit.window_counts(now)
+            if circuit.consecutive_failures >= self.failure_threshold or (
+                requests >= self.min_requests and failures / requests >= self.error_rate_threshold
+            ):
+                self._open(provider, circuit, now)
+        return trip_key
+
+    def release(self, provider: str):
+        """Give back a probe slot for an attempt with no verdict (cancelled, rate-limited, client error)."""
+        circuit = self.circuits.get(provider)
+        if circuit is not None and circuit.state == HALF_OPEN:
+            circuit.probes_in_flight = max(circuit.probes_in_flight - 1, 0)
+
+    def _open(self, provider: str, circuit: Circuit, now: float):
+        print(f"Opening circuit for {provider} ({circuit.consecutive_failures} consecutive failures).")
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probes_in_flight = 0
+        circuit.times_opened += 1
+
+    def _close(self, provider: str, circuit: Circuit):
+        print(f"Closing circuit for {provider}, probes succeeded.")
+        circuit.state = CLOSED
+        circuit.opened_at = None
+        circuit.consecutive_failures = 0
+        circuit.probes_in_flight = 0
+
+    def get_state(self, provider: str) -> Dict[str, Any]:
+        circuit = self.circuits.get(provider)
+        if circuit is None:
+            return {"state": CLOSED, "consecutive_failures": 0, "window_requests": 0, "window_error_rate": 0.0, "retry_in_seconds": None, "times_opened": 0}
+        now = time.monotonic()
+        requests, failures = circuit.window_counts(now)
+        retry_in = None
+        if circuit.state == OPEN:
+            retry_in = round(max(self.open_seconds - (now - circuit.opened_at), 0.0), 1)
+        return {
+            "state": circuit.state,
+            "consecutive_failures": circuit.consecutive_failures,
+            "window_requests": requests,
+            "window_error_rate": round(failures / requests, 4) if requests else 0.0,
+            "retry_in_seconds": retry_in,
+            "times_opened": circuit.times_opened,
+        }
+
+circuit_breaker = CircuitBreaker()
@@ -0,0 +1,98 @@
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import select
+from app.core.database import AsyncSessionLocal
+from app.core.security import decrypt_value, needs_reencryption, reencrypt_value, DecryptionError
+from app.models.db_models import APIKey
+from app.services.key_registry import key_registry
+from app.services.quota_service import quota_service
+from app.core.config import env_bool
+
+class CredentialCache:
+    """Decrypted provider keys, kept in memory so routing does no crypto per attempt.
+
+    Entries are keyed by key id and remember the ciphertext they came from:
+    when a key is edited or re-encrypted its ciphertext changes and the next
+    lookup decrypts again. Failures are cached the same way, so a key that
+    cannot be decrypted is reported once per ciphertext, not on every request.
+    """
+
+    def __init__(self):
+        # key_id -> (ciphertext, plaintext or None when decryption failed)
+        self.entries: Dict[int, Tuple[str, Optional[str]]] = {}
+        self.hits = 0
+        self.decrypts = 0
+        self.failures = 0
+        self.rotate_on_startup = env_bool("KEY_ROTATION_ENABLED", True)
+
+    def get(self, key_id: int, ciphertext: str) -> str:
+        """Return the plain key, raising DecryptionError if it cannot be decrypted."""
+        entry = self.entries.get(key_id)
+        if entry is not None and entry[0] == ciphertext:
+            if entry[1] is None:
+                raise DecryptionError(f"API key {key_id} cannot be decrypted")
+            self.hits += 1
+            return entry[1]
+
+        self.decrypts += 1
+        try:
+            plaintext = decrypt_value(ciphertext)
+        except DecryptionError:
+            self.failures += 1
+            self.entries[key_id] = (ciphertext, None)
+            print(f"Error: API key {key_id} cannot be decrypted with the configured ENCRYPTION_KEY; it will not be used.")
+            raise DecryptionError(f"API key {key_id} cannot be decrypted")
+        self.entries[key_id] = (ciphertext, plaintext)
+        return plaintext
+
+    def invalidate(self, key_id: int):
+        self.entries.pop(key_id, None)
+
+    async def rotate(self, batch_size: int = 100) -> int:
+        """Re-encrypt stored keys that use an old ENCRYPTION_KEY (or none) with the current one.
+
+        Runs in the background after startup; each batch is committed on its
+        own and pushed into the key registry. Returns the number of keys rewritten.
+        """
+        rotated = 0
+        last_id = 0
+        try:
+            async with AsyncSessionLocal() as db:
+                while True:
+                    result = await db.execute(
+                        select(APIKey).where(APIKey.id > last_id).order_by(APIKey.id).limit(batch_size)
+                    )
+                    keys = result.scalars().all()
+                    if not keys:
+                        break
+                    last_id = keys[-1].id
+                    changed = []
+                    for key in keys:
+                        if not needs_reencryption(key.key_value):
+                            continue
+                        try:
+                            key.key_value = reencrypt_value(key.key_value)
+                        except DecryptionError:
+                            print(f"Error: API key {key.id} cannot be decrypted with any ENCRYPTION_KEY; not re-encrypted.")
+                            continue
+                        changed.append(key)
+                    if changed:
+                        await db.commit()
+                        for key in changed:
+                            key_registry.upsert(key)
+                        await quota_service.key_config_changed()
+                        rotated += len(changed)
+        except Exception as e:
+            print(f"Error re-encrypting API keys: {e}")
+        if rotated:
+            print(f"Re-encrypted {rotated} API keys with the current ENCRYPTION_KEY.")
+        return rotated
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self.entries),
+            "hits": self.hits,
+            "decrypts": self.decrypts,
+            "failures": self.failures,
+        }
+
+credential_cache = CredentialCache()
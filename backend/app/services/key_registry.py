@@ -0,0 +1,338 @@
+import os
+import time
+import heapq
+import random
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.db_models import APIKey
+from app.services.metrics import metrics
+
+DAILY_RESET_SECONDS = 86400
+
+KEY_STRATEGIES = ("round_robin", "least_recently_used", "weighted_quota", "power_of_two")
+
+class KeyState:
+    """In-memory mirror of an APIKey row used on the routing hot path."""
+
+    __slots__ = (
+        "id", "name", "provider", "key_value", "key_prefix", "is_active",
+        "daily_quota", "used_today", "last_reset", "cooldown_until",
+        "rpm_limit", "tpm_limit", "max_concurrency",
+        "rpm_tokens", "tpm_tokens", "bucket_updated", "in_flight", "reserved", "last_used",
+    )
+
+    def __init__(self, key: APIKey):
+        self.id = key.id
+        self.used_today = key.used_today or 0
+        self.last_reset = key.last_reset or int(time.time())
+        self.cooldown_until = key.cooldown_until
+        self.in_flight = 0
+        # Estimated tokens of requests in flight, held against the daily quota
+        self.reserved = 0
+        # Monotonic time the key was last handed out or handed back
+        self.last_used = 0.0
+        self.rpm_limit = self.tpm_limit = 0
+        self.rpm_tokens = self.tpm_tokens = 0.0
+        self.bucket_updated = time.monotonic()
+        self.apply_config(key)
+
+    def apply_config(self, key: APIKey):
+        """Copy admin-editable fields, keeping the live counters."""
+        self.name = key.name
+        self.provider = key.provider
+        self.key_value = key.key_value
+        self.key_prefix = key.key_prefix
+        self.is_active = key.is_active
+        self.daily_quota = key.daily_quota or 0
+        self.max_concurrency = key.max_concurrency or 0
+        rpm_limit, tpm_limit = key.rpm_limit or 0, key.tpm_limit or 0
+        if (rpm_limit, tpm_limit) != (self.rpm_limit, self.tpm_limit):
+            # Buckets start full whenever the limits change
+            self.rpm_limit, self.tpm_limit = rpm_limit, tpm_limit
+            self.rpm_tokens, self.tpm_tokens = float(rpm_limit), float(tpm_limit)
+            self.bucket_updated = time.monotonic()
+
+    def has_quota(self) -> bool:
+        return self.daily_quota == 0 or self.used_today < self.daily_quota
+
+    def _refill(self, now: float):
+        elapsed = now - self.bucket_updated
+        if elapsed > 0:
+            if self.rpm_limit:
+                self.rpm_tokens = min(self.rpm_tokens + elapsed * self.rpm_limit / 60, self.rpm_limit)
+            if self.tpm_limit:
+                self.tpm_tokens = min(self.tpm_tokens + elapsed * self.tpm_limit / 60, self.tpm_limit)
+            self.bucket_updated = now
+
+    def has_capacity(self, now: float, tokens: int = 0) -> bool:
+        """Whether the key can take one more request of about `tokens` tokens
+        right now under its daily quota and RPM/TPM/concurrency limits."""
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return False
+        if self.daily_quota and self.used_today + self.reserved + tokens > self.daily_quota:
+            return False
+        if not (self.rpm_limit or self.tpm_limit):
+            return True
+        self._refill(now)
+        # TPM is charged after the fact, so the bucket only has to cover this request's estimate
+        return (
+            (not self.rpm_limit or self.rpm_tokens >= 1)
+            and (not self.tpm_limit or self.tpm_tokens >= max(min(tokens, self.tpm_limit), 1))
+        )
+
+    def remaining_quota(self) -> Optional[int]:
+        """Daily tokens left after in-flight reservations, or None when unlimited."""
+        if not self.daily_quota:
+            return None
+        return max(self.daily_quota - self.used_today - self.reserved, 0)
+
+    def acquire(self, tokens: int = 0):
+        self.in_flight += 1
+        self.reserved += tokens
+        self.last_used = time.monotonic()
+        if self.rpm_limit:
+            self.rpm_tokens -= 1
+
+    def charge_tokens(self, tokens: int):
+        if self.tpm_limit:
+            self._refill(time.monotonic())
+            self.tpm_tokens -= tokens
+
+def _least_recently_used(states: List[KeyState]) -> KeyState:
+    return min(states, key=lambda state: state.last_used)
+
+def _weighted_quota(states: List[KeyState]) -> KeyState:
+    # Unlimited keys weigh as much as the roomiest limited one
+    remaining = [state.remaining_quota() for state in states]
+    unlimited = max([r for r in remaining if r is not None] or [1])
+    weights = [max(r if r is not None else unlimited, 1) for r in remaining]
+    return random.choices(states, weights)[0]
+
+def _power_of_two(states: List[KeyState]) -> KeyState:
+    if len(states) == 1:
+        return states[0]
+    first, second = random.sample(states, 2)
+    return first if first.in_flight <= second.in_flight else second
+
+# Strategies that pick among every eligible key; round_robin is handled inline
+CHOOSERS = {
+    "least_recently_used": _least_recently_used,
+    "weighted_quota": _weighted_quota,
+    "power_of_two": _power_of_two,
+}
+
+def strategy_for(provider: str) -> str:
+    """Key strategy of a provider: <PROVIDER>_KEY_STRATEGY, else KEY_STRATEGY, else round_robin."""
+    strategy = os.getenv(f"{provider.upper()}_KEY_STRATEGY") or os.getenv("KEY_STRATEGY", "round_robin")
+    if strategy not in KEY_STRATEGIES:
+        print(f"Unknown key strategy {strategy!r} for {provider}, using round_robin.")
+        return "round_robin"
+    return strategy
+
+class ProviderKeys:
+    """Keys of one provider: an ordered set of ready keys and a heap of waiting ones."""
+
+    def __init__(self, strategy: str = "round_robin"):
+        self.strategy = strategy
+        self.ready: Dict[int, KeyState] = {}
+        # (wake_at, key_id) for keys on cooldown or out of quota until the daily reset
+        self.waiting: List[Tuple[int, int]] = []
+
+class KeyRegistry:
+    """Holds key state in memory so key selection needs no DB round-trip.
+
+    Loaded once at startup and kept in sync by the admin key endpoints.
+    Mutated keys are marked dirty and written back in batches by the usage
+    writer, so the hot path never waits on the database.
+    """
+
+    def __init__(self):
+        self.keys: Dict[int, KeyState] = {}
+        self.providers: Dict[str, ProviderKeys] = {}
+        self.dirty: Set[int] = set()
+        self.loaded = False
+
+    async def load(self, db: AsyncSession):
+        started = time.monotonic()
+        result = await db.execute(select(APIKey))
+        self.keys.clear()
+        self.providers.clear()
+        now = int(time.time())
+        for key in result.scalars().all():
+            state = KeyState(key)
+            self.keys[state.id] = state
+            self._place(state, now)
+        self.loaded = True
+        metrics.quota_db.labels("load_keys").observe(time.monotonic() - started)
+
+    async def refresh(self, db: AsyncSession):
+        """Re-read key config from the database, keeping the live counters of known keys."""
+        result = await db.execute(select(APIKey))
+        keys = result.scalars().all()
+        for key in keys:
+            self.upsert(key)
+        for key_id in set(self.keys) - {key.id for key in keys}:
+            self.remove(key_id)
+        self.loaded = True
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            await self.load(db)
+
+    def upsert(self, key: APIKey):
+        """Add a new key or refresh the config of an existing one."""
+        state = self.keys.get(key.id)
+        if state is None:
+            state = KeyState(key)
+            self.keys[state.id] = state
+        else:
+            self._unplace(state)
+            state.apply_config(key)
+        self._place(state, int(time.time()))
+
+    def remove(self, key_id: int):
+        state = self.keys.pop(key_id, None)
+        if state is not None:
+            self._unplace(state)
+        self.dirty.discard(key_id)
+
+    def get(self, key_id: int) -> Optional[KeyState]:
+        return self.keys.get(key_id)
+
+    def active_keys(self, provider: str) -> List[KeyState]:
+        """All active keys of a provider, whatever their quota or cooldown state."""
+        return [state for state in self.keys.values() if state.provider == provider and state.is_active]
+
+    def get_active_key(self, provider: str, tokens: int = 0) -> Optional[KeyState]:
+        """Return a ready key of a provider chosen by its key strategy, waking up keys whose wait is over.
+
+        Keys at their RPM/TPM/concurrency limit, or without `tokens` of daily
+        quota left, are passed over. The returned key is acquired (one RPM
+        token, one concurrency slot, `tokens` reserved) and must be handed
+        back with release() once the upstream call is over.
+        """
+        pool = self.providers.get(provider)
+        if pool is None:
+            return None
+
+        now = int(time.time())
+        while pool.waiting and pool.waiting[0][0] <= now:
+            _, key_id = heapq.heappop(pool.waiting)
+            state = self.keys.get(key_id)
+            if state is not None and state.provider == provider and state.id not in pool.ready:
+                self._place(state, now)
+
+        clock = time.monotonic()
+        choose = CHOOSERS.get(pool.strategy)
+        if choose is not None:
+            eligible = [state for state in pool.ready.values() if self._can_take(state, now, clock, tokens)]
+            if not eligible:
+                return None
+            state = choose(eligible)
+            state.acquire(tokens)
+            return state
+
+        for state in pool.ready.values():
+            if not self._can_take(state, now, clock, tokens):
+                continue
+            # Rotate so concurrent requests spread over all ready keys
+            del pool.ready[state.id]
+            pool.ready[state.id] = state
+            state.acquire(tokens)
+            return state
+        return None
+
+    def order_candidates(self, provider: str, candidates: List[KeyState]) -> List[KeyState]:
+        """Put the key the provider's strategy prefers first (used by stores that check limits elsewhere)."""
+        pool = self.providers.get(provider)
+        choose = CHOOSERS.get(pool.strategy) if pool else None
+        if choose is None or len(candidates) < 2:
+            return candidates
+        if choose is _least_recently_used:
+            return sorted(candidates, key=lambda state: state.last_used)
+        preferred = choose(candidates)
+        return [preferred] + [state for state in candidates if state is not preferred]
+
+    def release(self, key_id: int, tokens: int = 0):
+        state = self.keys.get(key_id)
+        if state is not None and state.in_flight > 0:
+            state.in_flight -= 1
+            state.reserved = max(state.reserved - tokens, 0)
+            state.last_used = time.monotonic()
+
+    def strategies(self) -> Dict[str, str]:
+        return {provider: pool.strategy for provider, pool in self.providers.items()}
+
+    def record_usage(self, key_id: int, total_tokens: int):
+        state = self.keys.get(key_id)
+        if state is None:
+            return
+        now = int(time.time())
+        self._maybe_reset(state, now)
+        state.used_today += total_tokens
+        state.charge_tokens(total_tokens)
+        self.dirty.add(key_id)
+        if not state.has_quota():
+            self._unplace(state)
+            self._place(state, now)
+
+    def set_cooldown(self, key_id: int, duration_seconds: int):
+        state = self.keys.get(key_id)
+        if state is None:
+            return
+        now = int(time.time())
+        state.cooldown_until = now + duration_seconds
+        self.dirty.add(key_id)
+        self._unplace(state)
+        self._place(state, now)
+
+    def _can_take(self, state: KeyState, now: int, clock: float, tokens: int) -> bool:
+        # A key still in the ready set may be close to its quota; its daily
+        # reset has to happen before the reservation is checked against it
+        self._maybe_reset(state, now)
+        return state.has_capacity(clock, tokens)
+
+    def _maybe_reset(self, state: KeyState, now: int) -> bool:
+        if now - state.last_reset >= DAILY_RESET_SECONDS:
+            state.used_today = 0
+            state.last_reset = now
+            self.dirty.add(state.id)
+            return True
+        return False
+
+    def _unplace(self, state: KeyState):
+        pool = self.providers.get(state.provider)
+        if pool is not None:
+            pool.ready.pop(state.id, None)
+
+    def _place(self, state: KeyState, now: int):
+        if not state.is_active:
+            return
+        pool = self.providers.get(state.provider)
+        if pool is None:
+            pool = self.providers[state.provider] = ProviderKeys(strategy_for(state.provider))
+        self._maybe_reset(state, now)
+        if state.cooldown_until and state.cooldown_until > now:
+            heapq.heappush(pool.waiting, (state.cooldown_until, state.id))
+        elif not state.has_quota():
+            heapq.heappush(pool.waiting, (state.last_reset + DAILY_RESET_SECONDS, state.id))
+        else:
+            pool.ready[state.id] = state
+
+    def drain_dirty(self) -> List[dict]:
+        """Snapshot the persisted counters of every mutated key and clear the dirty set."""
+        rows = []
+        for key_id in self.dirty:
+            state = self.keys.get(key_id)
+            if state is not None:
+                rows.append({
+                    "id": state.id,
+                    "used_today": state.used_today,
+                    "last_reset": state.last_reset,
+                    "cooldown_until": state.cooldown_until,
+                })
+        self.dirty.clear()
+        return rows
+
+key_registry = KeyRegistry()
@@ -0,0 +1,68 @@
+import os
+import time
+from collections import deque
+from typing import Dict, Any, Deque, Optional
+
+class LoginThrottle:
+    """Sliding-window limits on password attempts, checked before any bcrypt work.
+
+    Each client IP gets LOGIN_MAX_ATTEMPTS_PER_IP login/register attempts per
+    window, and each username LOGIN_MAX_FAILURES failed logins per window, so
+    a credential-stuffing burst is turned away cheaply instead of queueing
+    password hashes. A successful login clears the username's failures.
+    """
+
+    def __init__(self):
+        self.window = float(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+        self.max_per_ip = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "20"))
+        self.max_failures = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+        self.by_ip: Dict[str, Deque[float]] = {}
+        self.failures: Dict[str, Deque[float]] = {}
+        self.rejected = 0
+        self.last_sweep = time.monotonic()
+
+    def _recent(self, buckets: Dict[str, Deque[float]], key: str, now: float) -> Deque[float]:
+        times = buckets.get(key)
+        if times is None:
+            times = buckets[key] = deque()
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        return times
+
+    def _sweep(self, now: float):
+        # Drop clients that have gone quiet so the maps do not grow forever
+        if now - self.last_sweep < self.window:
+            return
+        self.last_sweep = now
+        for buckets in (self.by_ip, self.failures):
+            for key in [key for key, times in buckets.items() if not times or times[-1] <= now - self.window]:
+                del buckets[key]
+
+    def check(self, ip: str, username: Optional[str] = None) -> Optional[int]:
+        """Count an attempt; return seconds to wait if it must be rejected, else None."""
+        now = time.monotonic()
+        self._sweep(now)
+        attempts = self._recent(self.by_ip, ip, now)
+        failures = self._recent(self.failures, username, now) if username else None
+        for times, limit in ((attempts, self.max_per_ip), (failures, self.max_failures)):
+            if times is not None and limit and len(times) >= limit:
+                self.rejected += 1
+                return max(int(times[0] + self.window - now) + 1, 1)
+        attempts.append(now)
+        return None
+
+    def record_failure(self, username: str):
+        self._recent(self.failures, username, time.monotonic()).append(time.monotonic())
+
+    def record_success(self, username: str):
+        self.failures.pop(username, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "tracked_ips": len(self.by_ip),
+            "tracked_usernames": len(self.failures),
+            "rejected": self.rejected,
+        }
+
+login_throttle = LoginThrottle()
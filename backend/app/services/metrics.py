@@ -0,0 +1,179 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, Any, List, Tuple, Callable, Iterable
+from app.core.config import env_bool
+
+# Upper bounds (seconds) of the latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class Metric(ABC):
+    """A metric family rendered in the Prometheus text format."""
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    @abstractmethod
+    def render(self) -> Iterable[str]:
+        """Sample lines of this family, without the HELP and TYPE header."""
+        pass
+
+class LabelledMetric(Metric):
+    """A metric family recorded through label children, created once and cached.
+
+    Recording looks up (or keeps) the child and bumps plain attributes on it,
+    so once a label set has been seen no metric objects are created per
+    request. No lock is needed because everything runs on the event loop.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.children: Dict[Tuple[Any, ...], Any] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """Fresh child holding the samples of one label set."""
+        pass
+
+    def labels(self, *values: Any):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+class Counter(LabelledMetric):
+    TYPE = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def render(self) -> Iterable[str]:
+        for values, child in self.children.items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {child.value}"
+
+class Histogram(LabelledMetric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def render(self) -> Iterable[str]:
+        for values, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {child.sum}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+class Gauge(Metric):
+    """Gauge whose samples, label values included, are read from a callback at scrape time."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], collect: Callable[[], Iterable[Tuple[Tuple[Any, ...], float]]]):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        for values, value in self.collect():
+            yield f"{self.name}{_labels(self.labelnames, values)} {value}"
+
+class Metrics:
+    """In-process counters and histograms exposed in the Prometheus text format on /metrics."""
+
+    def __init__(self):
+        self.enabled = env_bool("METRICS_ENABLED", True)
+        self.families: List[Metric] = []
+
+        self.attempts = self.counter(
+            "llm_hub_attempts_total", "Provider attempts by logical model, provider, key and outcome.",
+            ("model", "provider", "key_id", "outcome"))
+        self.upstream_responses = self.counter(
+            "llm_hub_upstream_responses_total", "Upstream HTTP responses by provider and status code.",
+            ("provider", "code"))
+        self.fallbacks = self.counter(
+            "llm_hub_fallbacks_total", "Attempts started because earlier providers failed.",
+            ("model", "provider"))
+        self.hedges = self.counter(
+            "llm_hub_hedges_total", "Attempts started in parallel because earlier ones were slow.",
+            ("model", "provider"))
+        self.cooldowns = self.counter(
+            "llm_hub_key_cooldowns_total", "API keys put on cooldown, e.g. after a 429.",
+            ("provider",))
+        self.key_selections = self.counter(
+            "llm_hub_key_selections_total", "Times each API key was picked for an attempt, by provider and key strategy.",
+            ("provider", "key_id", "strategy"))
+        self.tokens = self.counter(
+            "llm_hub_tokens_total", "Tokens used by logical model, provider and direction.",
+            ("model", "provider", "type"))
+        self.upstream_latency = self.histogram(
+            "llm_hub_upstream_latency_seconds", "Time until a provider answered (first delta for streams).",
+            ("model", "provider"))
+        self.quota_db = self.histogram(
+            "llm_hub_quota_db_seconds", "Database time spent on quota bookkeeping.",
+            ("operation",))
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        family = Counter(name, documentation, labelnames)
+        self.families.append(family)
+        return family
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        family = Histogram(name, documentation, labelnames, buckets)
+        self.families.append(family)
+        return family
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...], collect: Callable[[], Iterable[Tuple[Tuple[Any, ...], float]]]) -> Gauge:
+        family = Gauge(name, documentation, labelnames, collect)
+        self.families.append(family)
+        return family
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.TYPE}")
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
@@ -0,0 +1,120 @@
+import os
+import time
+import random
+from typing import Dict, List, Optional, Any
+from app.core.config import env_bool
+
+class RollingStats:
+    """EWMA latency plus error and 429 rates that decay back towards zero over time."""
+
+    __slots__ = ("latency", "error_rate", "rate_limit_rate", "samples", "updated_at")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.rate_limit_rate = 0.0
+        self.samples = 0
+        self.updated_at = time.monotonic()
+
+    def decay(self, now: float, half_life: float) -> float:
+        return 0.5 ** ((now - self.updated_at) / half_life)
+
+    def record(self, latency: Optional[float], error: bool, rate_limited: bool, alpha: float, half_life: float):
+        now = time.monotonic()
+        decay = self.decay(now, half_life)
+        self.error_rate = (1 - alpha) * self.error_rate * decay + alpha * (1.0 if error else 0.0)
+        self.rate_limit_rate = (1 - alpha) * self.rate_limit_rate * decay + alpha * (1.0 if rate_limited else 0.0)
+        if latency is not None:
+            self.latency = latency if self.latency is None else (1 - alpha) * self.latency + alpha * latency
+        self.samples += 1
+        self.updated_at = now
+
+    def snapshot(self, half_life: float) -> Dict[str, Any]:
+        decay = self.decay(time.monotonic(), half_life)
+        return {
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate * decay, 4),
+            "rate_limit_rate": round(self.rate_limit_rate * decay, 4),
+            "samples": self.samples,
+        }
+
+class ProviderStats:
+    """Rolling per-provider and per-key outcome statistics used to order providers.
+
+    Lower scores are tried first. The score weighs EWMA latency (seconds), error
+    rate, 429 rate and the provider's position in the static routing_config list,
+    so with no data the static priority order is kept. A small exploration share
+    of requests starts with a random candidate so recovered providers get traffic.
+    """
+
+    def __init__(self):
+        self.enabled = env_bool("ADAPTIVE_ROUTING", True)
+        self.alpha = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+        self.half_life = float(os.getenv("ROUTING_STATS_HALF_LIFE", "60"))
+        self.exploration = float(os.getenv("ROUTING_EXPLORATION", "0.05"))
+        self.prior_latency = float(os.getenv("ROUTING_PRIOR_LATENCY_MS", "1000")) / 1000
+        self.weights = {
+            "latency": float(os.getenv("ROUTING_WEIGHT_LATENCY", "1.0")),
+            "error": float(os.getenv("ROUTING_WEIGHT_ERROR", "5.0")),
+            "rate_limit": float(os.getenv("ROUTING_WEIGHT_RATE_LIMIT", "3.0")),
+            "priority": float(os.getenv("ROUTING_WEIGHT_PRIORITY", "0.1")),
+        }
+        self.providers: Dict[str, RollingStats] = {}
+        self.keys: Dict[int, RollingStats] = {}
+
+    def record(self, provider: str, key_id: Optional[int], latency: Optional[float], error: bool = False, rate_limited: bool = False):
+        stats = self.providers.get(provider)
+        if stats is None:
+            stats = self.providers[provider] = RollingStats()
+        stats.record(latency, error, rate_limited, self.alpha, self.half_life)
+        if key_id is not None:
+            stats = self.keys.get(key_id)
+            if stats is None:
+                stats = self.keys[key_id] = RollingStats()
+            stats.record(latency, error, rate_limited, self.alpha, self.half_life)
+
+    def score(self, provider: str, position: int) -> float:
+        w = self.weights
+        stats = self.providers.get(provider)
+        if stats is None:
+            return w["latency"] * self.prior_latency + w["priority"] * position
+        decay = stats.decay(time.monotonic(), self.half_life)
+        latency = stats.latency if stats.latency is not None else self.prior_latency
+        return (
+            w["latency"] * latency
+            + w["error"] * stats.error_rate * decay
+            + w["rate_limit"] * stats.rate_limit_rate * decay
+            + w["priority"] * position
+        )
+
+    def order(self, providers: List[str]) -> List[str]:
+        if not self.enabled or len(providers) < 2:
+            return providers
+        positions = {provider: position for position, provider in enumerate(providers)}
+        ordered = sorted(providers, key=lambda p: self.score(p, positions[p]))
+        if random.random() < self.exploration:
+            explored = ordered.pop(random.randrange(1, len(ordered)))
+            ordered.insert(0, explored)
+        return ordered
+
+    def get_scores(self, routing_config: Dict[Any, List[str]]) -> Dict[str, Any]:
+        models = {}
+        for model, providers in routing_config.items():
+            models[model.value] = [
+                {
+                    "provider": provider,
+                    "score": round(self.score(provider, position), 4),
+                    **(self.providers[provider].snapshot(self.half_life) if provider in self.providers else {}),
+                }
+                for position, provider in enumerate(providers)
+            ]
+            models[model.value].sort(key=lambda item: item["score"])
+        return {
+            "enabled": self.enabled,
+            "exploration": self.exploration,
+            "weights": self.weights,
+            "models": models,
+            "keys": {key_id: stats.snapshot(self.half_life) for key_id, stats in self.keys.items()},
+        }
+
+provider_stats = ProviderStats()
@@ -1,67 +1,103 @@
 import time
-from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.db_models import APIKey, UsageLog
-from typing import Optional
+from app.services.key_registry import key_registry, KeyState
+from app.services.quota_store import quota_store
+from app.services.usage_writer import usage_writer
+from app.services.metrics import metrics
+from typing import Optional, List, Dict, Any
 
 class QuotaService:
+    """Key selection and usage accounting on top of the configured quota store.
+
+    Key config always comes from the in-memory key registry; live state (usage,
+    cooldowns, rate buckets, in-flight requests) lives in `quota_store`, which
+    is this process (QUOTA_BACKEND=memory) or Redis shared by all workers.
+    """
+
     @staticmethod
-    async def get_active_key(db: AsyncSession, provider: str) -> Optional[APIKey]:
-        """Find an active key for a provider that is not on cooldown and has quota."""
-        now = int(time.time())
-        stmt = select(APIKey).where(
-            APIKey.provider == provider,
-            APIKey.is_active == True,
-            (APIKey.cooldown_until == None) | (APIKey.cooldown_until <= now)
-        )
-        # We can add more logic here, like selecting the one with most remaining quota
-        result = await db.execute(stmt)
-        keys = result.scalars().all()
-        
-        for key in keys:
-            # Check if quota reset is needed (daily reset)
-            if now - key.last_reset >= 86400:
-                key.used_today = 0
-                key.last_reset = now
-            
-            if key.daily_quota == 0 or key.used_today < key.daily_quota:
-                return key
-        
-        return None
+    async def get_active_key(db: AsyncSession, provider: str, tokens: int = 0) -> Optional[KeyState]:
+        """Find an active key for a provider that is not on cooldown and has
+        quota for `tokens` more tokens, which are reserved on it."""
+        await key_registry.ensure_loaded(db)
+        state = await quota_store.acquire(provider, tokens)
+        if state is not None:
+            pool = key_registry.providers.get(provider)
+            metrics.key_selections.labels(provider, state.id, pool.strategy if pool else "round_robin").inc()
+        return state
 
     @staticmethod
-    async def log_usage(db: AsyncSession, key_id: int, model: str, prompt_tokens: int, completion_tokens: int):
+    async def key_config_changed():
+        """Call after adding, editing or deleting keys so every worker reloads their config."""
+        await quota_store.config_changed()
+
+    @staticmethod
+    async def release_key(key_id: Optional[int], tokens: int = 0):
+        """Hand back the concurrency slot and token reservation taken when the key was selected."""
+        if key_id:
+            await quota_store.release(key_id, tokens)
+
+    @staticmethod
+    async def log_usage(
+        db: AsyncSession,
+        key_id: int,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        provider: Optional[str] = None,
+        latency_ms: Optional[int] = None
+    ):
         """Record token usage for a specific key."""
-        total_tokens = prompt_tokens + completion_tokens
-        
-        # Log the detailed usage
-        new_log = UsageLog(
-            api_key_id=key_id,
-            model=model,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=total_tokens
-        )
-        db.add(new_log)
-        
-        # Update the key's accumulated usage
-        await db.execute(
-            update(APIKey)
-            .where(APIKey.id == key_id)
-            .values(used_today=APIKey.used_today + total_tokens)
+        await usage_writer.enqueue(
+            await QuotaService.record_usage(key_id, model, prompt_tokens, completion_tokens, provider, latency_ms)
         )
+
+    @staticmethod
+    async def write_usage(rows: List[Dict[str, Any]]):
+        """Persist usage events returned by record_usage together, in one write."""
+        await usage_writer.enqueue_many(rows)
+
+    @staticmethod
+    async def record_usage(
+        key_id: int,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        provider: Optional[str] = None,
+        latency_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Count usage against the key right away and return the usage event to persist."""
+        total_tokens = prompt_tokens + completion_tokens
         
-        await db.commit()
+        # The key's accumulated usage lives in the quota store; the detailed log
+        # (and, for the memory store, the key counters) is written in the
+        # background by the usage writer
+        await quota_store.record_usage(key_id, total_tokens)
+        label = getattr(model, "value", model)
+        metrics.tokens.labels(label, provider or "unknown", "prompt").inc(prompt_tokens)
+        metrics.tokens.labels(label, provider or "unknown", "completion").inc(completion_tokens)
+        return {
+            "api_key_id": key_id,
+            "timestamp": int(time.time()),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            # Only used for the hourly rollups, not stored on the log row
+            "provider": provider,
+            "latency_ms": latency_ms
+        }
 
     @staticmethod
     async def set_cooldown(db: AsyncSession, key_id: int, duration_seconds: int = 300):
         """Put a key on cooldown, usually after a 429 error."""
-        cooldown_end = int(time.time()) + duration_seconds
-        await db.execute(
-            update(APIKey)
-            .where(APIKey.id == key_id)
-            .values(cooldown_until=cooldown_end)
-        )
-        await db.commit()
+        await quota_store.set_cooldown(key_id, duration_seconds)
+        state = key_registry.get(key_id)
+        if state is not None:
+            metrics.cooldowns.labels(state.provider).inc()
+
+    @staticmethod
+    async def key_states(key_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Live used_today / cooldown_until / in_flight per key, which may not be persisted yet."""
+        return await quota_store.snapshot(key_ids)
 
 quota_service = QuotaService()
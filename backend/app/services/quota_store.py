@@ -0,0 +1,259 @@
+import os
+import time
+import uuid
+from typing import Dict, Any, Iterable, List, Optional
+from app.core.database import AsyncSessionLocal
+from app.services.key_registry import key_registry, KeyState, DAILY_RESET_SECONDS
+
+class MemoryQuotaStore:
+    """Key state kept in this process by the key registry (single worker)."""
+
+    name = "memory"
+
+    async def sync(self, states: Iterable[KeyState]):
+        pass
+
+    async def acquire(self, provider: str, tokens: int = 0) -> Optional[KeyState]:
+        return key_registry.get_active_key(provider, tokens)
+
+    async def release(self, key_id: int, tokens: int = 0):
+        key_registry.release(key_id, tokens)
+
+    async def record_usage(self, key_id: int, total_tokens: int):
+        key_registry.record_usage(key_id, total_tokens)
+
+    async def set_cooldown(self, key_id: int, duration_seconds: int):
+        key_registry.set_cooldown(key_id, duration_seconds)
+
+    async def config_changed(self):
+        # The admin endpoints already updated this process's registry
+        pass
+
+    async def snapshot(self, key_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        states = (key_registry.get(key_id) for key_id in key_ids)
+        return {
+            state.id: {"used_today": state.used_today, "cooldown_until": state.cooldown_until, "in_flight": state.in_flight}
+            for state in states if state is not None
+        }
+
+# Picks the first candidate key that is off cooldown, has daily quota for the
+# estimated tokens, RPM/TPM budget and a free concurrency slot, and takes one
+# request from it (reserving the estimate), atomically. Returns -1 without
+# taking anything when the caller's key config is older than the shared one.
+# KEYS: the config version, then per candidate its state hash and lease set.
+# ARGV: now, lease token, lease expiry, estimated tokens, config version seen
+#       by the caller, then per candidate:
+#       daily_quota, rpm_limit, tpm_limit, max_concurrency, last_reset seed.
+ACQUIRE_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or 0) ~= tonumber(ARGV[5]) then
+  return -1
+end
+local now, est = tonumber(ARGV[1]), tonumber(ARGV[4])
+for i = 1, (#KEYS - 1) / 2 do
+  local state, leases = KEYS[2 * i], KEYS[2 * i + 1]
+  local base = 5 + (i - 1) * 5
+  local quota, rpm, tpm, conc = tonumber(ARGV[base + 1]), tonumber(ARGV[base + 2]), tonumber(ARGV[base + 3]), tonumber(ARGV[base + 4])
+  local s = redis.call('HMGET', state, 'used', 'last_reset', 'cooldown_until', 'rpm_tokens', 'rpm_ts', 'tpm_tokens', 'tpm_ts', 'reserved')
+  local used = tonumber(s[1]) or 0
+  local last_reset = tonumber(s[2]) or tonumber(ARGV[base + 5])
+  if now - last_reset >= DAILY then
+    -- Reservations leaked by a crashed worker go away with the daily reset
+    used, last_reset, s[8] = 0, now, 0
+    redis.call('HSET', state, 'used', 0, 'last_reset', now, 'reserved', 0)
+  elseif not s[2] then
+    redis.call('HSET', state, 'last_reset', last_reset)
+  end
+  local ok = (tonumber(s[3]) or 0) <= now and (quota == 0 or used + (tonumber(s[8]) or 0) + est <= quota)
+  if ok and conc > 0 then
+    redis.call('ZREMRANGEBYSCORE', leases, '-inf', now)
+    ok = redis.call('ZCARD', leases) < conc
+  end
+  local rpm_tokens, tpm_tokens
+  if ok and rpm > 0 then
+    rpm_tokens = math.min((tonumber(s[4]) or rpm) + math.max(now - (tonumber(s[5]) or now), 0) * rpm / 60, rpm)
+    ok = rpm_tokens >= 1
+  end
+  if ok and tpm > 0 then
+    tpm_tokens = math.min((tonumber(s[6]) or tpm) + math.max(now - (tonumber(s[7]) or now), 0) * tpm / 60, tpm)
+    ok = tpm_tokens >= math.max(math.min(est, tpm), 1)
+  end
+  if ok then
+    if est > 0 then redis.call('HINCRBY', state, 'reserved', est) end
+    if rpm > 0 then redis.call('HSET', state, 'rpm_tokens', rpm_tokens - 1, 'rpm_ts', now) end
+    if tpm > 0 then redis.call('HSET', state, 'tpm_tokens', tpm_tokens, 'tpm_ts', now) end
+    if conc > 0 then redis.call('ZADD', leases, tonumber(ARGV[3]), ARGV[2]) end
+    return i
+  end
+end
+return 0
+""".replace("DAILY", str(DAILY_RESET_SECONDS))
+
+# Hands back reserved tokens without going below zero (e.g. after a daily reset).
+# KEYS: state hash. ARGV: tokens.
+RELEASE_SCRIPT = """
+if redis.call('HINCRBY', KEYS[1], 'reserved', -tonumber(ARGV[1])) < 0 then
+  redis.call('HSET', KEYS[1], 'reserved', 0)
+end
+"""
+
+# KEYS: state hash. ARGV: now, tokens, tpm_limit, last_reset seed.
+USAGE_SCRIPT = """
+local now, tokens, tpm = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local s = redis.call('HMGET', KEYS[1], 'last_reset', 'tpm_tokens', 'tpm_ts')
+local last_reset = tonumber(s[1]) or tonumber(ARGV[4])
+if now - last_reset >= DAILY then
+  redis.call('HSET', KEYS[1], 'used', 0, 'last_reset', now)
+elseif not s[1] then
+  redis.call('HSET', KEYS[1], 'last_reset', last_reset)
+end
+if tpm > 0 then
+  local tpm_tokens = math.min((tonumber(s[2]) or tpm) + math.max(now - (tonumber(s[3]) or now), 0) * tpm / 60, tpm)
+  redis.call('HSET', KEYS[1], 'tpm_tokens', tpm_tokens - tokens, 'tpm_ts', now)
+end
+return redis.call('HINCRBY', KEYS[1], 'used', tokens)
+""".replace("DAILY", str(DAILY_RESET_SECONDS))
+
+class RedisQuotaStore:
+    """Key state shared by every worker through Redis (or anything speaking its protocol).
+
+    Key config (which keys exist, their limits) comes from the local key
+    registry. Every admin change bumps a config version in Redis; the acquire
+    script compares it with the version this worker loaded, and on a mismatch
+    the worker re-reads its registry from the database before picking a key,
+    so disabled or deleted keys leave rotation on every worker. Usage,
+    cooldowns, rate buckets and in-flight leases live in Redis and are
+    checked and updated by Lua scripts, so concurrent workers never hand out
+    the same last unit of quota twice. Concurrency slots are leases with an
+    expiry, so a crashed worker cannot hold them forever.
+    """
+
+    name = "redis"
+
+    def __init__(self, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("QUOTA_BACKEND=redis needs the 'redis' package (pip install redis)")
+            client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.prefix = os.getenv("REDIS_KEY_PREFIX", "llm_hub:")
+        self.lease_seconds = int(os.getenv("REDIS_LEASE_SECONDS", "300"))
+        self.acquire_script = client.register_script(ACQUIRE_SCRIPT)
+        self.usage_script = client.register_script(USAGE_SCRIPT)
+        self.release_script = client.register_script(RELEASE_SCRIPT)
+        # Lease tokens held by this worker, per key
+        self.leases: Dict[int, List[str]] = {}
+        self.rotation: Dict[str, int] = {}
+        # Key config version the registry was loaded at. Redis starts without
+        # one (0); a worker that starts after changes reloads once
+        self.config_version = 0
+
+    def _state_key(self, key_id: int) -> str:
+        return f"{self.prefix}key:{key_id}"
+
+    def _lease_key(self, key_id: int) -> str:
+        return f"{self.prefix}leases:{key_id}"
+
+    def _config_key(self) -> str:
+        return f"{self.prefix}config_version"
+
+    async def config_changed(self):
+        """Tell every worker (this one included) to reload key config before its next pick."""
+        await self.client.incr(self._config_key())
+
+    async def _reload_config(self):
+        # Read the version first: a change racing the reload bumps it again
+        version = int(await self.client.get(self._config_key()) or 0)
+        async with AsyncSessionLocal() as db:
+            await key_registry.refresh(db)
+        self.config_version = version
+
+    async def sync(self, states: Iterable[KeyState]):
+        """Seed counters from the database for keys Redis does not know yet."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for state in states:
+                pipe.hsetnx(self._state_key(state.id), "used", state.used_today)
+                pipe.hsetnx(self._state_key(state.id), "last_reset", state.last_reset)
+                if state.cooldown_until:
+                    pipe.hsetnx(self._state_key(state.id), "cooldown_until", state.cooldown_until)
+            await pipe.execute()
+
+    async def acquire(self, provider: str, tokens: int = 0) -> Optional[KeyState]:
+        # The script also runs without local candidates: a key may have been added on another worker
+        for _ in range(2):
+            candidates = key_registry.active_keys(provider)
+            if candidates:
+                # Start at a different key each time so workers spread over all keys
+                start = self.rotation.get(provider, 0) % len(candidates)
+                self.rotation[provider] = start + 1
+                candidates = key_registry.order_candidates(provider, candidates[start:] + candidates[:start])
+
+            now = time.time()
+            token = uuid.uuid4().hex
+            keys: List[str] = [self._config_key()]
+            args: List[Any] = [now, token, now + self.lease_seconds, tokens, self.config_version]
+            for state in candidates:
+                keys += [self._state_key(state.id), self._lease_key(state.id)]
+                args += [state.daily_quota, state.rpm_limit, state.tpm_limit, state.max_concurrency, state.last_reset]
+            index = int(await self.acquire_script(keys=keys, args=args))
+            if index >= 0:
+                break
+            # Key config changed since this worker loaded it: reload, then pick again
+            await self._reload_config()
+        if index <= 0:
+            return None
+        state = candidates[index - 1]
+        if state.max_concurrency:
+            self.leases.setdefault(state.id, []).append(token)
+        # This worker's view of the key, used by the load-balancing strategies
+        state.in_flight += 1
+        state.last_used = time.monotonic()
+        return state
+
+    async def release(self, key_id: int, tokens: int = 0):
+        key_registry.release(key_id)
+        leases = self.leases.get(key_id)
+        if leases:
+            await self.client.zrem(self._lease_key(key_id), leases.pop())
+        if tokens:
+            await self.release_script(keys=[self._state_key(key_id)], args=[tokens])
+
+    async def record_usage(self, key_id: int, total_tokens: int):
+        state = key_registry.get(key_id)
+        if state is None:
+            return
+        await self.usage_script(
+            keys=[self._state_key(key_id)],
+            args=[time.time(), total_tokens, state.tpm_limit, state.last_reset]
+        )
+
+    async def set_cooldown(self, key_id: int, duration_seconds: int):
+        await self.client.hset(self._state_key(key_id), "cooldown_until", int(time.time()) + duration_seconds)
+
+    async def snapshot(self, key_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key_id in key_ids:
+                pipe.hmget(self._state_key(key_id), "used", "cooldown_until")
+                pipe.zcount(self._lease_key(key_id), now, "+inf")
+            results = await pipe.execute()
+        snapshot = {}
+        for i, key_id in enumerate(key_ids):
+            (used, cooldown_until), in_flight = results[2 * i], results[2 * i + 1]
+            if used is None:
+                continue
+            snapshot[key_id] = {
+                "used_today": int(used),
+                "cooldown_until": int(float(cooldown_until)) if cooldown_until else None,
+                "in_flight": in_flight,
+            }
+        return snapshot
+
+def create_quota_store():
+    backend = os.getenv("QUOTA_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisQuotaStore()
+    return MemoryQuotaStore()
+
+quota_store = create_quota_store()
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import random
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import httpx
+
+# Error classes for a failed upstream attempt
+RATE_LIMITED = "rate_limited"  # 429: cool the key down, try elsewhere
+KEY_REJECTED = "key_rejected"  # 401/403: this key is unusable, try elsewhere
+BAD_REQUEST = "bad_request"    # this provider refuses the request: no cooldown, try elsewhere
+UPSTREAM = "upstream"          # 5xx, timeouts and other provider trouble: try elsewhere
+
+# Statuses meaning this provider rejects the request. Context windows and
+# accepted parameters differ between providers, so another one may take it
+BAD_REQUEST_STATUSES = {400, 413, 422}
+
+# Error reasons (Gemini ErrorInfo) that mean the key, not the request, is bad
+KEY_REJECTED_REASONS = {"API_KEY_INVALID"}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+def classify(status_code: int) -> str:
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code in (401, 403):
+        return KEY_REJECTED
+    if status_code in BAD_REQUEST_STATUSES:
+        return BAD_REQUEST
+    return UPSTREAM
+
+def _error_details(response: httpx.Response) -> list:
+    """The `error.details` list of a Google-style error body, if the body was read and has one."""
+    try:
+        body = json.loads(response.content)
+    except (httpx.ResponseNotRead, ValueError):
+        # Streaming responses are not read before raise_for_status
+        return []
+    error = body.get("error") if isinstance(body, dict) else None
+    details = error.get("details") if isinstance(error, dict) else None
+    return [detail for detail in details if isinstance(detail, dict)] if isinstance(details, list) else []
+
+def classify_response(response: httpx.Response) -> str:
+    """Like classify, but also looks at the body: Gemini answers 400 INVALID_ARGUMENT for a bad key."""
+    kind = classify(response.status_code)
+    if kind == BAD_REQUEST:
+        for detail in _error_details(response):
+            if detail.get("@type", "").endswith("ErrorInfo") and detail.get("reason") in KEY_REJECTED_REASONS:
+                return KEY_REJECTED
+    return kind
+
+def parse_duration(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds from a rate-limit header value.
+
+    Accepts plain seconds ("2", "0.5"), Go-style durations as sent by OpenAI
+    and Groq ("6m0s", "20ms", "1h2m3.5s"), and absolute times as sent in
+    Retry-After (HTTP date) or by Anthropic (RFC 3339).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    now = time.time() if now is None else now
+    for parse in (lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")), parsedate_to_datetime):
+        try:
+            return max(parse(value).timestamp() - now, 0.0)
+        except (ValueError, TypeError, IndexError):
+            continue
+    return None
+
+def _header_number(headers: httpx.Headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def cooldown_from_headers(headers: httpx.Headers) -> Optional[float]:
+    """How long the key should rest according to the provider, if it says so.
+
+    Uses Retry-After (and retry-after-ms) when present; otherwise, when the
+    remaining request or token budget reported by OpenAI-style
+    (x-ratelimit-*) or Anthropic (anthropic-ratelimit-*) headers is zero,
+    the time until that budget resets. Works on successful responses too, so
+    a key is parked before it starts returning 429s.
+    """
+    retry_after_ms = _header_number(headers, "retry-after-ms")
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+
+    wait = None
+    for remaining, reset in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+        ("anthropic-ratelimit-input-tokens-remaining", "anthropic-ratelimit-input-tokens-reset"),
+        ("anthropic-ratelimit-output-tokens-remaining", "anthropic-ratelimit-output-tokens-reset"),
+    ):
+        if _header_number(headers, remaining) == 0:
+            seconds = parse_duration(headers.get(reset))
+            if seconds is not None:
+                wait = max(wait or 0.0, seconds)
+    return wait
+
+def cooldown_from_error(response: httpx.Response) -> Optional[float]:
+    """Cooldown for a rate-limited response: headers first, then Gemini's RetryInfo in the body."""
+    seconds = cooldown_from_headers(response.headers)
+    if seconds is not None:
+        return seconds
+    for detail in _error_details(response):
+        if detail.get("@type", "").endswith("RetryInfo"):
+            return parse_duration(detail.get("retryDelay"))
+    return None
+
+class Backoff:
+    """Full-jitter exponential backoff between fallback attempts."""
+
+    def __init__(self):
+        self.base = float(os.getenv("RETRY_BACKOFF_BASE_MS", "50")) / 1000
+        self.cap = float(os.getenv("RETRY_BACKOFF_MAX_MS", "1000")) / 1000
+
+    def delay(self, failures: int) -> float:
+        if self.base <= 0 or failures <= 0:
+            return 0.0
+        return random.uniform(0, min(self.cap, self.base * 2 ** (failures - 1)))
+
+backoff = Backoff()
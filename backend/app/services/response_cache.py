@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.models.schemas import ChatRequest
+from app.core.config import env_bool
+
+class ResponseCache:
+    """Exact-match LRU cache of serialized chat responses with a byte budget and TTL.
+
+    Only deterministic requests (temperature 0, by default) are cached. Entries
+    are keyed on a canonical hash of the logical model, messages, temperature
+    and max_tokens, and stored as the JSON bytes sent to the client.
+    """
+
+    def __init__(self):
+        self.enabled = env_bool("RESPONSE_CACHE_ENABLED", True)
+        self.max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.ttl = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+        self.max_temperature = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+        # key -> (stored_at, body)
+        self.entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def is_cacheable(self, request: ChatRequest) -> bool:
+        return (
+            self.enabled
+            and not request.stream
+            and request.temperature is not None
+            and request.temperature <= self.max_temperature
+        )
+
+    @staticmethod
+    def make_key(request: ChatRequest) -> str:
+        canonical = json.dumps(
+            [
+                request.model.value,
+                [[m.role, m.content] for m in request.messages],
+                request.temperature,
+                request.max_tokens,
+            ],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str, max_age: Optional[int] = None) -> Optional[Tuple[bytes, int]]:
+        """Return (body, age_seconds) for a fresh entry, or None on a miss."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, body = entry
+        age = time.time() - stored_at
+        if age >= self.ttl:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        if max_age is not None and age > max_age:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body, int(age)
+
+    def put(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.time(), body)
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, body = self.entries.pop(key)
+        self.bytes -= len(body)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+response_cache = ResponseCache()
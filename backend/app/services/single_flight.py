@@ -0,0 +1,64 @@
+import os
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, Tuple
+from app.models.schemas import ChatRequest, ChatResponse, LogicalModel
+
+class SingleFlight:
+    """Coalesces concurrent identical chat requests into one upstream call.
+
+    The first caller starts the call as a standalone task; callers arriving
+    while it is in flight wait on the same task through asyncio.shield, so a
+    client that disconnects only cancels its own wait, never the shared call.
+    Usage is logged once, by the shared call, against the key that served it.
+    Only requests at or below SINGLE_FLIGHT_MAX_TEMPERATURE (by default the
+    response cache's threshold) are coalesced: identical sampled prompts are
+    usually sent to get different completions.
+    """
+
+    def __init__(self):
+        models = os.getenv("SINGLE_FLIGHT_MODELS", ",".join(m.value for m in LogicalModel))
+        self.models = {m.strip() for m in models.split(",") if m.strip()}
+        self.max_temperature = float(
+            os.getenv("SINGLE_FLIGHT_MAX_TEMPERATURE", os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+        )
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def is_enabled(self, request: ChatRequest) -> bool:
+        return (
+            request.model.value in self.models
+            and request.temperature is not None
+            and request.temperature <= self.max_temperature
+        )
+
+    async def run(self, key: str, call: Callable[[], Awaitable[ChatResponse]]) -> Tuple[ChatResponse, bool]:
+        """Return (response, coalesced) where coalesced is True for callers that joined an existing call."""
+        task = self.in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(call())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), coalesced
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        # Mark the exception as retrieved in case every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "models": sorted(self.models),
+            "max_temperature": self.max_temperature,
+            "in_flight": len(self.in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+single_flight = SingleFlight()
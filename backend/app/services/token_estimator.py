@@ -0,0 +1,83 @@
+import os
+import math
+from typing import Dict, Iterable
+from app.models.schemas import ChatRequest, Usage
+from app.core.config import env_bool
+
+# Tokenizer family behind each provider's default models
+PROVIDER_FAMILIES: Dict[str, str] = {
+    "openai": "openai",
+    "openrouter": "openai",
+    "xai": "openai",
+    "groq": "llama",
+    "together": "llama",
+    "perplexity": "llama",
+    "deepseek": "deepseek",
+    "mistral": "mistral",
+    "anthropic": "anthropic",
+    "gemini": "gemini",
+    "cohere": "cohere",
+}
+
+# Average characters of English text per token for each family
+CHARS_PER_TOKEN: Dict[str, float] = {
+    "openai": 4.0,
+    "llama": 3.8,
+    "deepseek": 3.6,
+    "mistral": 3.5,
+    "anthropic": 3.5,
+    "gemini": 4.0,
+    "cohere": 4.0,
+}
+
+# Chat formatting tokens added around each message and before the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+class TokenEstimator:
+    """Offline, tokenizer-free token counts used before a request is sent.
+
+    ASCII text is counted at the family's characters-per-token ratio; other
+    characters (CJK, emoji, accents) are counted as one token each, which is
+    close for CJK and errs high elsewhere. The estimate is only used to
+    reserve quota before dispatch and to fill in usage a provider did not
+    report, so erring slightly high is the safe side.
+    """
+
+    def __init__(self):
+        self.enabled = env_bool("TOKEN_RESERVATION_ENABLED", True)
+        # Completion budget reserved when a request does not set max_tokens
+        self.default_completion = int(os.getenv("TOKEN_RESERVATION_DEFAULT_COMPLETION", "512"))
+
+    @staticmethod
+    def count(text: str, provider: str) -> int:
+        if not text:
+            return 0
+        ratio = CHARS_PER_TOKEN[PROVIDER_FAMILIES.get(provider, "openai")]
+        if text.isascii():
+            return math.ceil(len(text) / ratio)
+        other = sum(1 for char in text if ord(char) > 127)
+        return math.ceil((len(text) - other) / ratio) + other
+
+    def prompt_tokens(self, request: ChatRequest, provider: str) -> int:
+        return sum(self.count(m.content, provider) + TOKENS_PER_MESSAGE for m in request.messages) + TOKENS_PER_REPLY
+
+    def reservation(self, request: ChatRequest, provider: str) -> int:
+        """Tokens to hold on a key while the request is in flight: prompt plus the completion budget."""
+        if not self.enabled:
+            return 0
+        return self.prompt_tokens(request, provider) + (request.max_tokens or self.default_completion)
+
+    def fill_usage(self, usage: Usage, request: ChatRequest, provider: str, completion: Iterable[str]) -> Usage:
+        """Return the reported usage, or an estimate when the provider reported none."""
+        if usage is not None and usage.total_tokens:
+            return usage
+        prompt_tokens = self.prompt_tokens(request, provider)
+        completion_tokens = self.count("".join(completion), provider)
+        return Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+
+token_estimator = TokenEstimator()
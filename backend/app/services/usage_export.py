@@ -0,0 +1,95 @@
+import io
+import os
+import csv
+import json
+import time
+from typing import AsyncIterator, Optional
+from sqlalchemy import select, func, or_
+from app.core.database import AsyncSessionLocal
+from app.models.db_models import APIKey, UsageLog
+
+COLUMNS = (
+    "id", "timestamp", "api_key_id", "key_name", "provider", "model",
+    "prompt_tokens", "completion_tokens", "total_tokens",
+)
+
+class UsageExporter:
+    """Streams usage logs as CSV or NDJSON in id order without loading them all.
+
+    Rows are fetched through a streaming result in batches of USAGE_EXPORT_BATCH
+    and each batch is encoded into one chunk, so memory stays flat however many
+    rows are exported.
+
+    `after_id` set to the last exported id continues an incremental export.
+    Ids are assigned at insert but become visible at commit, so with several
+    workers a lower id can appear after a higher one was exported. Incremental
+    exports therefore stop before the first row younger than
+    USAGE_EXPORT_SETTLE_SECONDS, giving in-flight writes time to commit. Rows
+    committed later than that (e.g. retried after a database outage) can still
+    be passed over.
+    """
+
+    FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("USAGE_EXPORT_BATCH", "1000"))
+        self.settle_seconds = int(os.getenv("USAGE_EXPORT_SETTLE_SECONDS", "60"))
+
+    def query(self, start: Optional[int], end: Optional[int], after_id: Optional[int]):
+        query = (
+            select(
+                UsageLog.id,
+                UsageLog.timestamp,
+                UsageLog.api_key_id,
+                APIKey.name.label("key_name"),
+                APIKey.provider,
+                UsageLog.model,
+                UsageLog.prompt_tokens,
+                UsageLog.completion_tokens,
+                UsageLog.total_tokens
+            )
+            .outerjoin(APIKey, APIKey.id == UsageLog.api_key_id)
+            .order_by(UsageLog.id)
+        )
+        if after_id is not None:
+            # Stop at the first unsettled row so the next export resumes before it
+            unsettled = (
+                select(func.min(UsageLog.id))
+                .where(UsageLog.id > after_id, UsageLog.timestamp >= int(time.time()) - self.settle_seconds)
+                .scalar_subquery()
+            )
+            query = query.where(UsageLog.id > after_id, or_(unsettled.is_(None), UsageLog.id < unsettled))
+        if start is not None:
+            query = query.where(UsageLog.timestamp >= start)
+        if end is not None:
+            query = query.where(UsageLog.timestamp < end)
+        return query.execution_options(yield_per=self.batch_size)
+
+    async def stream(
+        self,
+        fmt: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        if fmt == "csv":
+            yield self._csv([COLUMNS])
+
+        # The response outlives the request's session, so the export opens its own
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(self.query(start, end, after_id))
+            async for batch in result.partitions():
+                if fmt == "csv":
+                    yield self._csv(batch)
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(COLUMNS, row)), separators=(",", ":")) + "\n" for row in batch
+                    ).encode()
+
+    @staticmethod
+    def _csv(rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode()
+
+usage_exporter = UsageExporter()
@@ -0,0 +1,200 @@
+from typing import Dict, Any, List, Tuple
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import sqlite, postgresql
+from app.models.db_models import APIKey, UsageLog, UsageRollup, RequestAttempt, LatencyRollup
+
+BUCKET_SECONDS = 3600
+
+# Upper bounds (ms) of the latency histogram buckets; -1 stands for +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 30000, 60000)
+LATENCY_METRICS = ("queue", "key_select", "ttfb", "upstream", "overhead")
+
+def bucket_of(timestamp: int) -> int:
+    return timestamp - timestamp % BUCKET_SECONDS
+
+def aggregate(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold usage events into one increment row per (hour, model, provider, key)."""
+    rows: Dict[Tuple[int, str, str, int], Dict[str, Any]] = {}
+    for event in events:
+        group = (bucket_of(event["timestamp"]), event["model"], event.get("provider") or "unknown", event["api_key_id"])
+        row = rows.get(group)
+        if row is None:
+            row = rows[group] = {
+                "bucket_start": group[0],
+                "model": group[1],
+                "provider": group[2],
+                "api_key_id": group[3],
+                "requests": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "latency_ms_sum": 0,
+                "latency_count": 0,
+            }
+        row["requests"] += 1
+        row["prompt_tokens"] += event["prompt_tokens"]
+        row["completion_tokens"] += event["completion_tokens"]
+        row["total_tokens"] += event["total_tokens"]
+        if event.get("latency_ms") is not None:
+            row["latency_ms_sum"] += event["latency_ms"]
+            row["latency_count"] += 1
+    return list(rows.values())
+
+def aggregate_latency(attempts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold attempt timings into histogram increments per (hour, model, provider, metric, bucket)."""
+    counts: Dict[Tuple[int, str, str, str, int], int] = {}
+    for attempt in attempts:
+        hour = bucket_of(attempt["timestamp"])
+        for metric in LATENCY_METRICS:
+            value = attempt.get(f"{metric}_ms")
+            if value is None:
+                continue
+            le = next((bound for bound in LATENCY_BUCKETS_MS if value <= bound), -1)
+            group = (hour, attempt["model"], attempt["provider"], metric, le)
+            counts[group] = counts.get(group, 0) + 1
+    return [
+        {"bucket_start": hour, "model": model, "provider": provider, "metric": metric, "le_ms": le, "count": count}
+        for (hour, model, provider, metric, le), count in counts.items()
+    ]
+
+async def _upsert(db: AsyncSession, table, keys: List[str], counters: List[str], rows: List[Dict[str, Any]]):
+    """Add increment rows to a rollup table with a single upsert."""
+    if not rows:
+        return
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    else:
+        stmt = sqlite.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(table, name) + getattr(stmt.excluded, name) for name in counters}
+    )
+    await db.execute(stmt, rows)
+
+async def apply(db: AsyncSession, rows: List[Dict[str, Any]]):
+    await _upsert(
+        db, UsageRollup,
+        ["bucket_start", "model", "provider", "api_key_id"],
+        ["requests", "prompt_tokens", "completion_tokens", "total_tokens", "latency_ms_sum", "latency_count"],
+        rows
+    )
+
+async def apply_latency(db: AsyncSession, rows: List[Dict[str, Any]]):
+    await _upsert(db, LatencyRollup, ["bucket_start", "model", "provider", "metric", "le_ms"], ["count"], rows)
+
+async def prune_attempts(db: AsyncSession, before: int) -> int:
+    """Delete raw attempt rows older than `before`; their timings stay in the latency rollups."""
+    result = await db.execute(delete(RequestAttempt).where(RequestAttempt.timestamp < before))
+    await db.commit()
+    return result.rowcount or 0
+
+async def backfill(db: AsyncSession):
+    """Build rollups from existing usage logs the first time the table is created."""
+    has_rollups = (await db.execute(select(UsageRollup.id).limit(1))).first()
+    has_logs = (await db.execute(select(UsageLog.id).limit(1))).first()
+    if has_rollups or not has_logs:
+        return
+
+    bucket = UsageLog.timestamp - UsageLog.timestamp % BUCKET_SECONDS
+    provider = func.coalesce(APIKey.provider, "unknown")
+    source = (
+        select(
+            bucket,
+            UsageLog.model,
+            provider,
+            UsageLog.api_key_id,
+            func.count(UsageLog.id),
+            func.sum(UsageLog.prompt_tokens),
+            func.sum(UsageLog.completion_tokens),
+            func.sum(UsageLog.total_tokens),
+            0,
+            0,
+        )
+        .select_from(UsageLog)
+        .outerjoin(APIKey, APIKey.id == UsageLog.api_key_id)
+        .group_by(bucket, UsageLog.model, provider, UsageLog.api_key_id)
+    )
+    await db.execute(insert(UsageRollup).from_select(
+        ["bucket_start", "model", "provider", "api_key_id", "requests", "prompt_tokens",
+         "completion_tokens", "total_tokens", "latency_ms_sum", "latency_count"],
+        source
+    ))
+    await db.commit()
+    print("Backfilled usage rollups from existing usage logs.")
+
+async def totals(db: AsyncSession, since: int = 0) -> Dict[str, Any]:
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(UsageRollup.requests), 0),
+            func.coalesce(func.sum(UsageRollup.total_tokens), 0),
+            func.coalesce(func.sum(UsageRollup.latency_ms_sum), 0),
+            func.coalesce(func.sum(UsageRollup.latency_count), 0),
+        ).where(UsageRollup.bucket_start >= since)
+    )
+    requests, tokens, latency_sum, latency_count = result.one()
+    return {
+        "requests": requests,
+        "tokens": tokens,
+        "avg_latency_ms": latency_sum / latency_count if latency_count else None,
+    }
+
+async def requests_by_model(db: AsyncSession, since: int = 0) -> Dict[str, int]:
+    result = await db.execute(
+        select(UsageRollup.model, func.sum(UsageRollup.requests))
+        .where(UsageRollup.bucket_start >= since)
+        .group_by(UsageRollup.model)
+    )
+    return {model: count for model, count in result.all()}
+
+async def series(db: AsyncSession, start: int, end: int) -> Dict[int, Tuple[int, int]]:
+    """Requests and tokens per hour bucket in [start, end)."""
+    result = await db.execute(
+        select(UsageRollup.bucket_start, func.sum(UsageRollup.requests), func.sum(UsageRollup.total_tokens))
+        .where(UsageRollup.bucket_start >= start, UsageRollup.bucket_start < end)
+        .group_by(UsageRollup.bucket_start)
+    )
+    return {bucket: (requests, tokens) for bucket, requests, tokens in result.all()}
+
+def _percentile(histogram: Dict[int, int], total: int, q: float) -> float:
+    """Estimate a percentile by linear interpolation inside the histogram bucket that holds it."""
+    rank = q * total
+    seen = 0
+    lower = 0
+    for bound in LATENCY_BUCKETS_MS:
+        count = histogram.get(bound, 0)
+        if count and seen + count >= rank:
+            return round(lower + (bound - lower) * (rank - seen) / count, 1)
+        seen += count
+        lower = bound
+    # Falls in the +Inf bucket: the last finite bound is the best lower estimate
+    return float(lower)
+
+async def latency_percentiles(db: AsyncSession, since: int = 0) -> Dict[str, Any]:
+    """p50/p95/p99 per provider and per logical model for every latency metric."""
+    result = await db.execute(
+        select(LatencyRollup.model, LatencyRollup.provider, LatencyRollup.metric, LatencyRollup.le_ms, func.sum(LatencyRollup.count))
+        .where(LatencyRollup.bucket_start >= since)
+        .group_by(LatencyRollup.model, LatencyRollup.provider, LatencyRollup.metric, LatencyRollup.le_ms)
+    )
+    histograms: Dict[str, Dict[str, Dict[str, Dict[int, int]]]] = {"providers": {}, "models": {}}
+    for model, provider, metric, le, count in result.all():
+        for group, name in (("providers", provider), ("models", model)):
+            histogram = histograms[group].setdefault(name, {}).setdefault(metric, {})
+            histogram[le] = histogram.get(le, 0) + count
+
+    summary: Dict[str, Any] = {}
+    for group, names in histograms.items():
+        summary[group] = {}
+        for name, metrics in names.items():
+            summary[group][name] = {}
+            for metric, histogram in metrics.items():
+                total = sum(histogram.values())
+                summary[group][name][metric] = {
+                    "count": total,
+                    "p50": _percentile(histogram, total, 0.50),
+                    "p95": _percentile(histogram, total, 0.95),
+                    "p99": _percentile(histogram, total, 0.99),
+                }
+    return summary
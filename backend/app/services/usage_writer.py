@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert, update
+from app.core.database import AsyncSessionLocal
+from app.models.db_models import APIKey, UsageLog, RequestAttempt
+from app.services.key_registry import key_registry
+from app.services import usage_rollups
+from app.services.metrics import metrics
+
+LOG_COLUMNS = tuple(UsageLog.__table__.columns.keys())
+
+class UsageWriter:
+    """Write-behind pipeline for usage logs.
+
+    Requests only enqueue an event; a background task drains the bounded queue
+    every USAGE_FLUSH_INTERVAL_MS or as soon as USAGE_FLUSH_BATCH events are
+    pending, and writes them as one bulk insert together with the aggregated
+    key counters from the key registry and the hourly usage rollups, in a
+    single transaction. Per-attempt timings (kind "attempt") travel through
+    the same queue and feed the latency histograms. Only one batch at a time
+    leaves the queue, so while the database is down events back up there and
+    producers get backpressure; a batch that keeps failing is split to drop
+    the events the database rejects without holding up the rest. Once an
+    hour the raw attempt rows older than REQUEST_ATTEMPT_RETENTION_DAYS are
+    pruned; the latency rollups keep their histograms.
+    """
+
+    def __init__(self):
+        self.flush_interval = int(os.getenv("USAGE_FLUSH_INTERVAL_MS", "500")) / 1000
+        self.batch_size = int(os.getenv("USAGE_FLUSH_BATCH", "200"))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("USAGE_QUEUE_SIZE", "10000")))
+        self._batch_ready = asyncio.Event()
+        # Failed attempts at the same batch before it is split to find rows the database rejects
+        self.flush_retries = int(os.getenv("USAGE_FLUSH_RETRIES", "3"))
+        # Where events the database rejects are appended as JSON lines (printed if unset)
+        self.dead_letter_file = os.getenv("USAGE_DEAD_LETTER_FILE")
+        # How long raw request_attempts rows are kept (0 keeps them forever)
+        self.attempt_retention = int(float(os.getenv("REQUEST_ATTEMPT_RETENTION_DAYS", "7")) * 86400)
+        self._next_prune = 0.0
+        self._pending: List[Tuple[float, str, Dict[str, Any]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.batch_failures = 0
+        self.dropped = 0
+        self.attempts_pruned = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+
+    async def enqueue(self, row: Dict[str, Any], kind: str = "usage"):
+        item = (time.monotonic(), kind, row)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Queue is full: make the caller wait for the writer instead of dropping usage
+            self.backpressure_waits += 1
+            self._batch_ready.set()
+            started = time.monotonic()
+            await self.queue.put(item)
+            self.backpressure_seconds += time.monotonic() - started
+        self.enqueued += 1
+        if self.queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    async def enqueue_many(self, rows: List[Dict[str, Any]], kind: str = "usage"):
+        """Enqueue related events and flush right away so they are written together."""
+        for row in rows:
+            await self.enqueue(row, kind)
+        if rows:
+            self._batch_ready.set()
+
+    def _drain(self):
+        # Take at most one batch out of the queue. While writes are failing the
+        # rest stays queued, so the queue bound and backpressure keep applying
+        while len(self._pending) < self.batch_size:
+            try:
+                self._pending.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _write(self, batch: List[Tuple[float, str, Dict[str, Any]]], key_rows: List[Dict[str, Any]]):
+        async with AsyncSessionLocal() as db:
+            events = [row for _, kind, row in batch if kind == "usage"]
+            attempts = [row for _, kind, row in batch if kind == "attempt"]
+            if events:
+                await db.execute(insert(UsageLog), [
+                    {name: row[name] for name in LOG_COLUMNS if name in row} for row in events
+                ])
+                await usage_rollups.apply(db, usage_rollups.aggregate(events))
+            if attempts:
+                await db.execute(insert(RequestAttempt), attempts)
+                await usage_rollups.apply_latency(db, usage_rollups.aggregate_latency(attempts))
+            if key_rows:
+                await db.execute(update(APIKey), key_rows)
+            await db.commit()
+
+    async def _write_isolating(self, batch: List[Tuple[float, str, Dict[str, Any]]]) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """Write what the database accepts, halving failing batches; return the rows it rejects."""
+        try:
+            await self._write(batch, [])
+            return []
+        except Exception:
+            if len(batch) == 1:
+                return batch
+        middle = len(batch) // 2
+        return await self._write_isolating(batch[:middle]) + await self._write_isolating(batch[middle:])
+
+    def _dead_letter(self, rows: List[Tuple[float, str, Dict[str, Any]]]):
+        self.dropped += len(rows)
+        print(f"Dropping {len(rows)} usage events the database keeps rejecting.")
+        lines = [json.dumps({"kind": kind, "row": row}, default=str) for _, kind, row in rows]
+        if self.dead_letter_file:
+            try:
+                with open(self.dead_letter_file, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+                return
+            except OSError as e:
+                print(f"Cannot write dead letters to {self.dead_letter_file}: {e}")
+        for line in lines:
+            print(f"Dropped usage event: {line}")
+
+    async def flush(self):
+        """Write everything queued so far, one batch at a time."""
+        while True:
+            self._drain()
+            key_rows = key_registry.drain_dirty()
+            if not self._pending and not key_rows:
+                return
+
+            batch = self._pending
+            rejected = []
+            started = time.monotonic()
+            try:
+                await self._write(batch, key_rows)
+            except Exception:
+                self.flush_failures += 1
+                self.batch_failures += 1
+                key_registry.dirty.update(row["id"] for row in key_rows)
+                if self.batch_failures < self.flush_retries or len(batch) == 0:
+                    # Keep the batch for the next attempt
+                    raise
+                # The same batch keeps failing: find the rows the database rejects
+                rejected = await self._write_isolating(batch)
+                if len(rejected) == len(batch):
+                    # Nothing goes through, so the database itself is down; keep everything
+                    self.batch_failures = 0
+                    raise
+                self._dead_letter(rejected)
+
+            finished = time.monotonic()
+            self._pending = []
+            self.batch_failures = 0
+            self.flushes += 1
+            self.written += len(batch) - len(rejected)
+            self.last_flush_duration = finished - started
+            metrics.quota_db.labels("flush").observe(self.last_flush_duration)
+            if batch:
+                self.last_flush_lag = finished - batch[0][0]
+                self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush usage logs: {e}")
+            if self.attempt_retention and time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + usage_rollups.BUCKET_SECONDS
+                try:
+                    await self.prune()
+                except Exception as e:
+                    print(f"Failed to prune request attempts: {e}")
+
+    async def prune(self):
+        async with AsyncSessionLocal() as db:
+            removed = await usage_rollups.prune_attempts(db, int(time.time()) - self.attempt_retention)
+        self.attempts_pruned += removed
+        if removed:
+            print(f"Pruned {removed} request attempts older than {self.attempt_retention // 86400} days.")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Shutting down with the database unreachable: report the loss instead of aborting shutdown
+            print(f"Failed to flush usage logs at shutdown: {e}; {self.get_stats()['queue_depth']} usage events lost.")
+
+    def get_stats(self) -> Dict[str, Any]:
+        oldest = self._pending[0][0] if self._pending else None
+        return {
+            "queue_depth": self.queue.qsize() + len(self._pending),
+            "queue_capacity": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "dropped": self.dropped,
+            "attempts_pruned": self.attempts_pruned,
+            "backpressure_waits": self.backpressure_waits,
+            "backpressure_seconds": round(self.backpressure_seconds, 3),
+            "pending_age_seconds": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "max_flush_lag_seconds": round(self.max_flush_lag, 3),
+            "last_flush_duration_seconds": round(self.last_flush_duration, 3),
+        }
+
+usage_writer = UsageWriter()
@@ -1,15 +1,25 @@
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+
+# Load environment variables before app modules read their configuration
+load_dotenv()
+
 from app.api.v1.chat import api_router
 from app.api.v1.auth import auth_router
 from app.api.v1.admin import admin_router
-from app.core.database import init_db
-
-# Load environment variables
-load_dotenv()
+from app.api.metrics import metrics_router
+from app.core.database import init_db, check_db, AsyncSessionLocal
+from app.core.http_client import http_clients
+from app.core.router import router
+from app.services.key_registry import key_registry
+from app.services.quota_store import quota_store
+from app.services.usage_writer import usage_writer
+from app.services import usage_rollups
+from app.services.credentials import credential_cache
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -17,11 +27,30 @@ async def lifespan(app: FastAPI):
     try:
         await init_db()
         print("Database initialized successfully.")
+        print(f"Database settings: {await check_db()}")
+        async with AsyncSessionLocal() as db:
+            await key_registry.load(db)
+            await quota_store.sync(key_registry.keys.values())
+            await usage_rollups.backfill(db)
+        print(f"Loaded {len(key_registry.keys)} API keys into the key registry ({quota_store.name} quota store).")
     except Exception as e:
         print(f"Error initializing database: {e}")
         import traceback
         traceback.print_exc()
+
+    # Open one keep-alive connection pool per provider
+    http_clients.start(router.adapters.keys())
+    usage_writer.start()
+    # Move keys stored with an old ENCRYPTION_KEY (or in plain text) to the current one
+    rotation = asyncio.create_task(credential_cache.rotate()) if credential_cache.rotate_on_startup else None
     yield
+    if rotation and not rotation.done():
+        rotation.cancel()
+    # Flush pending usage logs and key counters before exiting
+    try:
+        await usage_writer.stop()
+    finally:
+        await http_clients.aclose()
 
 app = FastAPI(title="llm-hub", description="Central LLM API Gateway", lifespan=lifespan)
 
@@ -36,12 +65,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include API routes
 app.include_router(api_router, prefix="/v1")
 app.include_router(auth_router, prefix="/v1/auth", tags=["auth"])
 app.include_router(admin_router, prefix="/v1/admin", tags=["admin"])
+app.include_router(metrics_router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,236 @@
+"""Load-test the gateway against an in-process mock upstream and report its overhead.
+
+Run from the backend directory:
+
+    python -m tests.benchmark --requests 500 --concurrency 32 --output benchmark.json
+
+Each provider in --providers is benchmarked on its own (plain and streaming
+requests), with every adapter pointed at tests/mock_upstream.py. Overhead is
+the latency the client saw through /v1/chat minus the time the mock spent
+serving the request, i.e. what routing, key selection, quota accounting,
+adapters and response handling add. The gateway uses a throwaway SQLite
+database, never the configured one.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from typing import Dict, Any, List, Optional
+
+from tests.mock_upstream import MockUpstream
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+    return {
+        "p50": round(at(0.50) * 1000, 3),
+        "p90": round(at(0.90) * 1000, 3),
+        "p99": round(at(0.99) * 1000, 3),
+        "mean": round(statistics.fmean(ordered) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def seed(providers: List[str], keys: int, auth: bool) -> Optional[str]:
+    """Create `keys` API keys per provider; return a gateway token when auth is on."""
+    from app.core.database import init_db, AsyncSessionLocal
+    from app.core.security import encrypt_value, GATEWAY_TOKEN_PREFIX
+    from app.models.db_models import APIKey, GatewayToken
+    from app.services.auth_cache import hash_token
+
+    await init_db()
+    token = None
+    async with AsyncSessionLocal() as db:
+        for provider in providers:
+            for i in range(keys):
+                db.add(APIKey(name=f"bench-{provider}-{i}", provider=provider, key_value=encrypt_value(f"sk-bench-{i}")))
+        if auth:
+            token = GATEWAY_TOKEN_PREFIX + uuid.uuid4().hex
+            db.add(GatewayToken(name="benchmark", token_hash=hash_token(token), token_prefix=token[:8]))
+        await db.commit()
+    return token
+
+async def run_scenario(client, mock: MockUpstream, name: str, args, stream: bool,
+                       headers: Dict[str, str], count: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    upstream: List[float] = []
+    overhead: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    next_index = 0
+
+    async def one(index: int):
+        nonlocal errors
+        request_id = f"bench-{name}-{index}"
+        body = {
+            "model": "smart",
+            "messages": [{"role": "user", "content": f"{request_id} Write a short greeting."}],
+            "temperature": 0.7,
+            "stream": stream,
+        }
+        started = time.perf_counter()
+        try:
+            if stream:
+                async with client.stream("POST", "/v1/chat", json=body, headers=headers) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+                    status = response.status_code
+            else:
+                response = await client.post("/v1/chat", json=body, headers=headers)
+                status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        served = mock.service_times.pop(request_id, None)
+        if status != 200:
+            errors += 1
+            return
+        latencies.append(elapsed)
+        if served is not None:
+            upstream.append(served)
+            overhead.append(max(elapsed - served, 0.0))
+
+    async def worker():
+        nonlocal next_index
+        while next_index < count:
+            index = next_index
+            next_index += 1
+            await one(index)
+
+    rate_limited = mock.rate_limited
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, count))))
+    duration = time.perf_counter() - started
+    return {
+        "name": name,
+        "stream": stream,
+        "requests": count,
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else None,
+        "errors": errors,
+        "upstream_429s": mock.rate_limited - rate_limited,
+        "status_codes": statuses,
+        "latency_ms": percentiles(latencies),
+        "upstream_ms": percentiles(upstream),
+        "overhead_ms": percentiles(overhead),
+    }
+
+async def run(args) -> Dict[str, Any]:
+    mock = MockUpstream(
+        latency_ms=args.latency_ms,
+        chunks=args.chunks,
+        chunk_interval_ms=args.chunk_interval_ms,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+    )
+    url = mock.start()
+
+    import httpx
+    import server
+    from app.core.router import router
+    from app.models.schemas import LogicalModel
+
+    providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+    unknown = [p for p in providers if p not in router.adapters]
+    if unknown:
+        raise SystemExit(f"Unknown providers: {', '.join(unknown)}")
+    mock.point(router.adapters, url)
+    modes = {"plain": [False], "stream": [True], "both": [False, True]}[args.mode]
+
+    scenarios = []
+    with contextlib.ExitStack() as quiet:
+        if not args.verbose:
+            devnull = quiet.enter_context(open(os.devnull, "w"))
+            quiet.enter_context(contextlib.redirect_stdout(devnull))
+            quiet.enter_context(contextlib.redirect_stderr(devnull))
+        token = await seed(providers, args.keys, args.auth)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+                for provider in providers:
+                    router.routing_config[LogicalModel.SMART] = [provider]
+                    for stream in modes:
+                        name = f"{provider}-{'stream' if stream else 'plain'}"
+                        if args.warmup:
+                            await run_scenario(client, mock, f"{name}-warmup", args, stream, headers, args.warmup)
+                        scenarios.append(await run_scenario(client, mock, name, args, stream, headers, args.requests))
+    mock.stop()
+
+    return {
+        "timestamp": int(time.time()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "scenarios": scenarios,
+    }
+
+def print_summary(results: Dict[str, Any]):
+    print(f"{'scenario':<22}{'rps':>9}{'errors':>8}{'lat p50':>10}{'lat p99':>10}{'ovh p50':>10}{'ovh p99':>10}")
+    for s in results["scenarios"]:
+        latency = s["latency_ms"] or {}
+        overhead = s["overhead_ms"] or {}
+        print(
+            f"{s['name']:<22}{s['throughput_rps'] or 0:>9.1f}{s['errors']:>8}"
+            f"{latency.get('p50', 0):>10.2f}{latency.get('p99', 0):>10.2f}"
+            f"{overhead.get('p50', 0):>10.2f}{overhead.get('p99', 0):>10.2f}"
+        )
+    print("(milliseconds; overhead = client latency - mock service time)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure gateway overhead against a mock upstream.")
+    parser.add_argument("--providers", default="openai,anthropic,gemini,cohere",
+                        help="comma-separated providers to benchmark, one at a time")
+    parser.add_argument("--mode", choices=("plain", "stream", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--keys", type=int, default=4, help="API keys created per provider")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mock time to first byte")
+    parser.add_argument("--chunks", type=int, default=16, help="content chunks per response")
+    parser.add_argument("--chunk-interval-ms", type=float, default=0, help="delay between streamed chunks")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of upstream calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--auth", action="store_true", help="enable ENABLE_PUBLIC_API_AUTH and send a gateway token")
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--verbose", action="store_true", help="show the gateway's own output and tracebacks")
+    args = parser.parse_args(argv)
+
+    # Configure the gateway before any app module is imported
+    database = os.path.join(tempfile.mkdtemp(prefix="llm-hub-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    if args.auth:
+        os.environ["ENABLE_PUBLIC_API_AUTH"] = "true"
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Tests never touch the configured database: app modules read DATABASE_URL on import
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='llm-hub-test-'), 'test.db')}"
+
+# Integration scripts that need a server running on localhost:8000 (see TESTING.md)
+collect_ignore = ["test_auth.py", "test_chat.py"]
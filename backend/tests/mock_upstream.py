@@ -0,0 +1,190 @@
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Any, AsyncIterator, Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Requests carry this marker in their prompt so service times can be matched to them
+REQUEST_ID = re.compile(rb"bench-[\w-]+")
+
+class MockUpstream:
+    """In-process fake of the OpenAI, Anthropic, Gemini and Cohere chat APIs.
+
+    Runs uvicorn in a background thread on a free local port. Every response
+    waits `latency_ms` before its first byte, streams `chunks` pieces
+    `chunk_interval_ms` apart, and a `rate_limit_ratio` share of requests
+    get a 429 with Retry-After. The time spent serving each request is kept
+    in `service_times` under the request's marker, so a client can subtract
+    it from what it observed through the gateway.
+    """
+
+    def __init__(self, latency_ms: float = 50, chunks: int = 16, chunk_interval_ms: float = 0,
+                 rate_limit_ratio: float = 0.0, retry_after: int = 1):
+        self.latency = latency_ms / 1000
+        self.chunks = max(chunks, 1)
+        self.chunk_interval = chunk_interval_ms / 1000
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.service_times: Dict[str, float] = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self.server: Optional[uvicorn.Server] = None
+        self.app = Starlette(routes=[
+            Route("/anthropic/v1/messages", self.anthropic, methods=["POST"]),
+            Route("/gemini/models/{target}", self.gemini, methods=["POST"]),
+            Route("/cohere/v1/chat", self.cohere, methods=["POST"]),
+            Route("/{provider}/chat/completions", self.openai, methods=["POST"]),
+        ])
+
+    def start(self) -> str:
+        """Start serving and return the base URL."""
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+
+    def point(self, adapters: Dict[str, Any], url: str):
+        """Send every adapter's calls to this mock instead of the real provider."""
+        for name, adapter in adapters.items():
+            if name == "anthropic":
+                adapter.BASE_URL = f"{url}/anthropic/v1/messages"
+            elif name == "gemini":
+                adapter.BASE_URL = url + "/gemini/models/{model}:generateContent?key={api_key}"
+                adapter.STREAM_URL = url + "/gemini/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+            elif name == "cohere":
+                adapter.BASE_URL = f"{url}/cohere/v1/chat"
+            else:
+                adapter.BASE_URL = f"{url}/{name}/chat/completions"
+
+    def _words(self):
+        return [f"word{i} " for i in range(self.chunks)]
+
+    async def _begin(self, request: Request):
+        """Read the request; return (payload, request id, started) or a 429 response."""
+        started = time.perf_counter()
+        body = await request.body()
+        self.requests += 1
+        match = REQUEST_ID.search(body)
+        request_id = match.group().decode() if match else None
+        if self.rate_limit_ratio and random.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return None, request_id, started, JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit", "code": 429}},
+                status_code=429,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        await asyncio.sleep(self.latency)
+        return json.loads(body or b"{}"), request_id, started, None
+
+    def _done(self, request_id: Optional[str], started: float):
+        if request_id:
+            self.service_times[request_id] = time.perf_counter() - started
+
+    def _respond(self, body: Dict[str, Any], request_id: Optional[str], started: float) -> Response:
+        self._done(request_id, started)
+        return JSONResponse(body)
+
+    def _stream(self, events: AsyncIterator[str], media_type: str, request_id: Optional[str], started: float) -> StreamingResponse:
+        async def timed() -> AsyncIterator[str]:
+            async for event in events:
+                yield event
+            self._done(request_id, started)
+        return StreamingResponse(timed(), media_type=media_type)
+
+    async def _paced(self, events):
+        for i, event in enumerate(events):
+            if i and self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+            yield event
+
+    async def openai(self, request: Request) -> Response:
+        payload, request_id, started, rejected = await self._begin(request)
+        if rejected:
+            return rejected
+        words = self._words()
+        usage = {"prompt_tokens": 12, "completion_tokens": len(words), "total_tokens": 12 + len(words)}
+        if not payload.get("stream"):
+            return self._respond({
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": usage,
+            }, request_id, started)
+        chunks = [{"choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]} for word in words]
+        chunks.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        chunks.append({"choices": [], "usage": usage})
+        events = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"]
+        return self._stream(self._paced(events), "text/event-stream", request_id, started)
+
+    async def anthropic(self, request: Request) -> Response:
+        payload, request_id, started, rejected = await self._begin(request)
+        if rejected:
+            return rejected
+        words = self._words()
+        if not payload.get("stream"):
+            return self._respond({
+                "id": "mock", "type": "message", "role": "assistant",
+                "content": [{"type": "text", "text": "".join(words)}],
+                "stop_reason": "end_turn", "usage": {"input_tokens": 12, "output_tokens": len(words)},
+            }, request_id, started)
+        events = [{"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}}]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}} for word in words]
+        events += [
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(words)}},
+            {"type": "message_stop"},
+        ]
+        lines = [f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events]
+        return self._stream(self._paced(lines), "text/event-stream", request_id, started)
+
+    async def gemini(self, request: Request) -> Response:
+        payload, request_id, started, rejected = await self._begin(request)
+        if rejected:
+            return rejected
+        words = self._words()
+
+        def chunk(text: str, count: int, finish: bool = False) -> Dict[str, Any]:
+            candidate = {"content": {"parts": [{"text": text}], "role": "model"}}
+            if finish:
+                candidate["finishReason"] = "STOP"
+            return {
+                "candidates": [candidate],
+                "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": count, "totalTokenCount": 12 + count},
+            }
+
+        if not request.path_params["target"].endswith(":streamGenerateContent"):
+            return self._respond(chunk("".join(words), len(words), finish=True), request_id, started)
+        events = [
+            f"data: {json.dumps(chunk(word, i + 1, finish=i == len(words) - 1))}\r\n\r\n"
+            for i, word in enumerate(words)
+        ]
+        return self._stream(self._paced(events), "text/event-stream", request_id, started)
+
+    async def cohere(self, request: Request) -> Response:
+        payload, request_id, started, rejected = await self._begin(request)
+        if rejected:
+            return rejected
+        words = self._words()
+        token_count = {"prompt_tokens": 12, "response_tokens": len(words), "total_tokens": 12 + len(words)}
+        if not payload.get("stream"):
+            return self._respond({"text": "".join(words), "finish_reason": "COMPLETE", "token_count": token_count}, request_id, started)
+        events = [{"event_type": "stream-start", "is_finished": False}]
+        events += [{"event_type": "text-generation", "text": word, "is_finished": False} for word in words]
+        events.append({
+            "event_type": "stream-end", "finish_reason": "COMPLETE", "is_finished": True,
+            "response": {"text": "".join(words), "token_count": token_count},
+        })
+        lines = [json.dumps(event) + "\n" for event in events]
+        return self._stream(self._paced(lines), "application/stream+json", request_id, started)
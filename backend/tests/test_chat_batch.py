@@ -0,0 +1,79 @@
+import asyncio
+from app.core.router import router
+from app.models.schemas import ChatRequest, ChatMessage, ChatResponse, ChatChoice, Usage, LogicalModel, ChatBatchSummary
+from app.services.chat_batch import chat_batch
+from app.services.key_registry import key_registry
+from app.services.quota_service import quota_service
+from test_redis_quota import make_key
+
+class MockAdapter:
+    """Answers prompts starting with "fast" at once; the rest hang and tear down slowly."""
+
+    async def chat_completion(self, request, api_key):
+        if not request.messages[0].content.startswith("fast"):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.05)
+                raise
+        return ChatResponse(
+            id="mock", created=0, model="mock",
+            choices=[ChatChoice(index=0, message=ChatMessage(role="assistant", content="hello"), finish_reason="stop")],
+            usage=Usage(prompt_tokens=10, completion_tokens=2, total_tokens=12)
+        )
+
+async def disconnect_mid_batch():
+    key_registry.loaded = True
+    key_registry.upsert(make_key(601, provider="cohere"))
+    key_registry.upsert(make_key(602, provider="cohere"))
+    written = []
+
+    async def write_usage(rows):
+        written.extend(rows)
+
+    saved = router.adapters["cohere"], router.routing_config[LogicalModel.CHEAP], router.record_timings
+    router.adapters["cohere"] = MockAdapter()
+    router.routing_config[LogicalModel.CHEAP] = ["cohere"]
+    router.record_timings = False
+    quota_service.write_usage = write_usage
+    try:
+        await run_and_disconnect()
+    finally:
+        router.adapters["cohere"], router.routing_config[LogicalModel.CHEAP], router.record_timings = saved
+        del quota_service.write_usage
+        states = [key_registry.get(key_id) for key_id in (601, 602)]
+        for state in states:
+            key_registry.remove(state.id)
+
+    print(f"Usage rows written: {len(written)}")
+    assert len(written) == 2
+    for state in states:
+        print(f"Key {state.id}: in_flight={state.in_flight} reserved={state.reserved}")
+        assert state.in_flight == 0 and state.reserved == 0
+    print("Batch disconnect OK")
+
+async def run_and_disconnect():
+    prompts = ["fast one", "fast two", "slow one", "slow two"]
+    requests = [ChatRequest(model=LogicalModel.CHEAP, messages=[ChatMessage(role="user", content=p)]) for p in prompts]
+
+    async def client():
+        # Like a StreamingResponse: the client reads the finished items, then goes away
+        async for item in chat_batch.run(requests, 4, ChatBatchSummary()):
+            print(f"Item {item.index}: {'ok' if item.response else item.error}")
+
+    task = asyncio.ensure_future(client())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await asyncio.sleep(0.2)
+
+def test_disconnect_mid_batch():
+    asyncio.run(disconnect_mid_batch())
+
+if __name__ == "__main__":
+    test_disconnect_mid_batch()
@@ -0,0 +1,108 @@
+import time
+from app.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+def make_breaker(**settings) -> CircuitBreaker:
+    breaker = CircuitBreaker()
+    breaker.failure_threshold = 3
+    breaker.error_rate_threshold = 0.5
+    breaker.min_requests = 4
+    breaker.open_seconds = 0.05
+    breaker.half_open_probes = 1
+    breaker.success_threshold = 2
+    breaker.per_key = False
+    for name, value in settings.items():
+        setattr(breaker, name, value)
+    return breaker
+
+def open_circuit(breaker: CircuitBreaker, provider: str = "groq"):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(provider)
+    assert breaker.circuits[provider].state == OPEN
+
+def test_consecutive_failures_open():
+    breaker = make_breaker()
+    breaker.record_failure("groq")
+    breaker.record_failure("groq")
+    assert breaker.allow("groq") and breaker.circuits["groq"].state == CLOSED
+    breaker.record_failure("groq")
+    assert breaker.circuits["groq"].state == OPEN and not breaker.allow("groq")
+    assert breaker.get_state("groq")["times_opened"] == 1
+
+def test_success_resets_consecutive_failures():
+    breaker = make_breaker(min_requests=100)
+    for _ in range(5):
+        breaker.record_failure("groq")
+        breaker.record_failure("groq")
+        breaker.record_success("groq")
+    assert breaker.circuits["groq"].state == CLOSED
+
+def test_error_rate_opens():
+    breaker = make_breaker(failure_threshold=100)
+    breaker.record_success("groq")
+    breaker.record_failure("groq")
+    breaker.record_success("groq")
+    assert breaker.circuits["groq"].state == CLOSED
+    # Four requests in the window, half of them failed
+    breaker.record_failure("groq")
+    assert breaker.circuits["groq"].state == OPEN
+
+def test_half_open_probes_close_circuit():
+    breaker = make_breaker()
+    open_circuit(breaker)
+    time.sleep(breaker.open_seconds)
+    # One probe at a time once the open period is over
+    assert breaker.allow("groq") and breaker.circuits["groq"].state == HALF_OPEN
+    assert not breaker.allow("groq")
+    breaker.record_success("groq")
+    assert breaker.circuits["groq"].state == HALF_OPEN
+    assert breaker.allow("groq")
+    breaker.record_success("groq")
+    assert breaker.circuits["groq"].state == CLOSED and breaker.allow("groq")
+
+def test_half_open_failure_reopens():
+    breaker = make_breaker()
+    open_circuit(breaker)
+    time.sleep(breaker.open_seconds)
+    assert breaker.allow("groq")
+    breaker.record_failure("groq")
+    state = breaker.get_state("groq")
+    assert state["state"] == OPEN and state["times_opened"] == 2 and not breaker.allow("groq")
+
+def test_cancelled_probe_is_released():
+    breaker = make_breaker()
+    open_circuit(breaker)
+    time.sleep(breaker.open_seconds)
+    assert breaker.allow("groq")
+    circuit = breaker.circuits["groq"]
+    assert circuit.probes_in_flight == 1 and not breaker.allow("groq")
+    # A cancelled (or rate-limited) probe has no verdict: its slot goes back
+    breaker.release("groq")
+    assert circuit.probes_in_flight == 0 and circuit.state == HALF_OPEN
+    assert breaker.allow("groq")
+    # Releasing more than was taken never goes negative
+    breaker.release("groq")
+    breaker.release("groq")
+    assert circuit.probes_in_flight == 0
+
+def test_release_when_closed_is_a_no_op():
+    breaker = make_breaker()
+    breaker.release("groq")
+    assert "groq" not in breaker.circuits and breaker.allow("groq")
+
+def test_per_key_trip():
+    breaker = make_breaker(per_key=True, failure_threshold=2, min_requests=100)
+    assert not breaker.record_failure("groq", key_id=7)
+    assert breaker.record_failure("groq", key_id=7)
+    breaker.record_success("groq", key_id=7)
+    assert not breaker.record_failure("groq", key_id=7)
+
+def test_providers_are_independent():
+    breaker = make_breaker()
+    open_circuit(breaker, "groq")
+    assert breaker.allow("openai") and not breaker.allow("groq")
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("Circuit breaker OK")
@@ -0,0 +1,60 @@
+import os
+import asyncio
+import tempfile
+
+# Run against a throwaway database, never the configured one
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tokens.db')}"
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from app.api.v1.admin import update_user
+from app.core import security
+from app.core.database import init_db, AsyncSessionLocal
+from app.models.db_models import User, GatewayToken
+from app.models.schemas import UserUpdate
+from app.services.auth_cache import hash_token
+
+async def authenticate(token: str) -> bool:
+    try:
+        await security.require_api_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        return True
+    except HTTPException as e:
+        assert e.status_code == 401
+        return False
+
+async def disabled_owner():
+    await init_db()
+    owned, ownerless = "lh-owned-token", "lh-ownerless-token"
+    async with AsyncSessionLocal() as db:
+        admin = User(username="token-admin", password_hash="x", role="admin")
+        owner = User(username="token-owner", password_hash="x")
+        db.add_all([admin, owner])
+        await db.flush()
+        db.add(GatewayToken(name="owned", token_hash=hash_token(owned), token_prefix=owned[:10], user_id=owner.id))
+        db.add(GatewayToken(name="ownerless", token_hash=hash_token(ownerless), token_prefix=ownerless[:10]))
+        await db.commit()
+        owner_id = owner.id
+
+    enabled, security.PUBLIC_API_AUTH = security.PUBLIC_API_AUTH, True
+    try:
+        assert await authenticate(owned) and await authenticate(ownerless)
+
+        # Disabling the owner revokes the owner's (cached) tokens at once
+        async with AsyncSessionLocal() as db:
+            await update_user(owner_id, UserUpdate(is_active=False), db=db, admin=admin)
+        print(f"Owned token after disabling its owner: {await authenticate(owned)}")
+        assert not await authenticate(owned)
+        assert await authenticate(ownerless)
+
+        async with AsyncSessionLocal() as db:
+            await update_user(owner_id, UserUpdate(is_active=True), db=db, admin=admin)
+        assert await authenticate(owned)
+    finally:
+        security.PUBLIC_API_AUTH = enabled
+    print("Gateway tokens follow their owner OK")
+
+def test_disabled_owner_revokes_tokens():
+    asyncio.run(disabled_owner())
+
+if __name__ == "__main__":
+    test_disabled_owner_revokes_tokens()
@@ -0,0 +1,49 @@
+import asyncio
+from app.services.key_registry import key_registry, DAILY_RESET_SECONDS
+from app.services.quota_store import MemoryQuotaStore
+from test_redis_quota import make_key
+
+async def memory_quota(strategy: str):
+    store = MemoryQuotaStore()
+    key_registry.loaded = True
+    key_registry.upsert(make_key(701, provider="together", daily_quota=100, max_concurrency=2))
+    key_registry.providers["together"].strategy = strategy
+
+    # Reserved tokens count against the daily quota until released
+    first = await store.acquire("together", 80)
+    assert first is not None and first.reserved == 80
+    assert await store.acquire("together", 30) is None
+    await store.release(701, 80)
+    state = key_registry.get(701)
+    assert state.in_flight == 0 and state.reserved == 0
+    assert await store.acquire("together", 30) is not None
+    await store.release(701, 30)
+
+    # A key close to its quota stays ready; once its day is over it is reset
+    # before the reservation is checked, not skipped until a restart
+    await store.record_usage(701, 96)
+    assert state.has_quota() and await store.acquire("together", 6) is None
+    state.last_reset -= DAILY_RESET_SECONDS + 1
+    picked = await store.acquire("together", 6)
+    print(f"{strategy}: after the daily reset used_today={state.used_today} reserved={state.reserved}")
+    assert picked is state and state.used_today == 0 and state.reserved == 6
+    await store.release(701, 6)
+    assert state.in_flight == 0 and state.reserved == 0
+
+def run(strategy: str):
+    try:
+        asyncio.run(memory_quota(strategy))
+    finally:
+        key_registry.remove(701)
+        key_registry.providers.pop("together", None)
+
+def test_memory_quota_round_robin():
+    run("round_robin")
+
+def test_memory_quota_strategy():
+    run("least_recently_used")
+
+if __name__ == "__main__":
+    test_memory_quota_round_robin()
+    test_memory_quota_strategy()
+    print("Memory quota store OK")
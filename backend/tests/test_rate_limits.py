@@ -0,0 +1,158 @@
+import json
+from datetime import datetime, timezone
+import httpx
+from app.services import rate_limits
+from app.services.rate_limits import (
+    classify, classify_response, parse_duration, cooldown_from_headers, cooldown_from_error, Backoff,
+    RATE_LIMITED, KEY_REJECTED, BAD_REQUEST, UPSTREAM
+)
+
+NOW = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc).timestamp()
+
+CLASSIFY_CASES = [
+    (429, RATE_LIMITED),
+    (401, KEY_REJECTED),
+    (403, KEY_REJECTED),
+    (400, BAD_REQUEST),
+    (413, BAD_REQUEST),
+    (422, BAD_REQUEST),
+    (404, UPSTREAM),
+    (408, UPSTREAM),
+    (500, UPSTREAM),
+    (503, UPSTREAM),
+]
+
+DURATION_CASES = [
+    # Plain seconds
+    ("2", 2.0),
+    ("0.5", 0.5),
+    (" 7 ", 7.0),
+    ("0", 0.0),
+    ("-5", 0.0),
+    # Go-style durations (OpenAI, Groq)
+    ("1m30s", 90.0),
+    ("6m0s", 360.0),
+    ("20ms", 0.02),
+    ("1h2m3.5s", 3723.5),
+    ("2h", 7200.0),
+    # Absolute times: RFC 3339 (Anthropic) and HTTP dates (Retry-After)
+    ("2026-01-01T12:00:30Z", 30.0),
+    ("2026-01-01T12:01:00+00:00", 60.0),
+    ("2026-01-01T11:59:00Z", 0.0),
+    ("Thu, 01 Jan 2026 12:00:45 GMT", 45.0),
+    # Missing and malformed values
+    (None, None),
+    ("", None),
+    ("soon", None),
+    ("1m30", None),
+    ("30x", None),
+    ("1.5.2s", None),
+    ("Thu, 99 Foo 2026", None),
+]
+
+HEADER_CASES = [
+    ({}, None),
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "Thu, 01 Jan 2026 12:00:10 GMT"}, 10.0),
+    ({"retry-after-ms": "1500", "retry-after": "9"}, 1.5),
+    ({"retry-after": "garbage"}, None),
+    # Budget left: no cooldown even though a reset time is given
+    ({"x-ratelimit-remaining-requests": "12", "x-ratelimit-reset-requests": "1m"}, None),
+    ({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m30s"}, 90.0),
+    ({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "250ms"}, 0.25),
+    # Both budgets spent: wait for the later reset
+    ({
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s",
+    }, 360.0),
+    ({"anthropic-ratelimit-requests-remaining": "0", "anthropic-ratelimit-requests-reset": "2026-01-01T12:00:20Z"}, 20.0),
+    ({"anthropic-ratelimit-output-tokens-remaining": "0", "anthropic-ratelimit-output-tokens-reset": "2026-01-01T12:00:05Z"}, 5.0),
+    # Malformed counters or reset times are ignored
+    ({"x-ratelimit-remaining-requests": "none", "x-ratelimit-reset-requests": "1m"}, None),
+    ({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "later"}, None),
+    ({"x-ratelimit-remaining-requests": "0"}, None),
+]
+
+def approx(actual, expected) -> bool:
+    if expected is None or actual is None:
+        return actual is expected
+    return abs(actual - expected) < 1e-6
+
+def freeze_clock(now: float):
+    """Pin the clock used for absolute reset times; returns a function that restores it."""
+    original = rate_limits.time.time
+    rate_limits.time.time = lambda: now
+    return lambda: setattr(rate_limits.time, "time", original)
+
+def test_classify():
+    for status, expected in CLASSIFY_CASES:
+        assert classify(status) == expected, status
+
+def test_parse_duration():
+    for value, expected in DURATION_CASES:
+        actual = parse_duration(value, now=NOW)
+        assert approx(actual, expected), f"{value!r}: {actual} != {expected}"
+
+def test_cooldown_from_headers():
+    restore = freeze_clock(NOW)
+    try:
+        for headers, expected in HEADER_CASES:
+            actual = cooldown_from_headers(httpx.Headers(headers))
+            assert approx(actual, expected), f"{headers}: {actual} != {expected}"
+    finally:
+        restore()
+
+def gemini_response(body, headers=None) -> httpx.Response:
+    content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return httpx.Response(429, headers=headers or {}, content=content)
+
+def test_cooldown_from_error():
+    retry_info = {"error": {"code": 429, "details": [
+        {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "17s"},
+    ]}}
+    cases = [
+        (gemini_response(retry_info), 17.0),
+        # Headers win over the body
+        (gemini_response(retry_info, {"retry-after": "4"}), 4.0),
+        (gemini_response({"error": {"code": 429, "details": []}}), None),
+        (gemini_response({"error": {"details": [{"@type": "RetryInfo", "retryDelay": "bogus"}]}}), None),
+        (gemini_response({"error": "quota exceeded"}), None),
+        (gemini_response({"error": {"details": "RetryInfo"}}), None),
+        (gemini_response(b"not json"), None),
+        (gemini_response(["a", "list"]), None),
+    ]
+    for response, expected in cases:
+        actual = cooldown_from_error(response)
+        assert approx(actual, expected), f"{response.content!r}: {actual} != {expected}"
+
+def test_classify_response():
+    key_invalid = {"error": {"code": 400, "status": "INVALID_ARGUMENT", "details": [
+        {"@type": "type.googleapis.com/google.rpc.ErrorInfo", "reason": "API_KEY_INVALID"},
+    ]}}
+    cases = [
+        (httpx.Response(400, json=key_invalid), KEY_REJECTED),
+        (httpx.Response(400, json={"error": {"details": [{"@type": "ErrorInfo", "reason": "OTHER"}]}}), BAD_REQUEST),
+        (httpx.Response(400, json={"error": {"code": "context_length_exceeded"}}), BAD_REQUEST),
+        (httpx.Response(400, content=b"not json"), BAD_REQUEST),
+        # The reason only matters for a 400; a 500 stays an upstream error
+        (httpx.Response(500, json=key_invalid), UPSTREAM),
+        (httpx.Response(429, json=key_invalid), RATE_LIMITED),
+    ]
+    for response, expected in cases:
+        assert classify_response(response) == expected, response.content
+
+def test_backoff_is_bounded():
+    backoff = Backoff()
+    backoff.base, backoff.cap = 0.05, 0.2
+    assert backoff.delay(0) == 0.0
+    for failures in range(1, 10):
+        assert 0 <= backoff.delay(failures) <= min(0.2, 0.05 * 2 ** (failures - 1))
+    backoff.base = 0
+    assert backoff.delay(3) == 0.0
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("Rate limit parsing OK")
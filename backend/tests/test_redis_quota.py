@@ -0,0 +1,135 @@
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+# Run against a throwaway database, never the configured one
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'quota.db')}"
+
+from sqlalchemy import update, delete
+from app.core.database import init_db, AsyncSessionLocal
+from app.models.db_models import APIKey
+from app.services.key_registry import key_registry
+from app.services.quota_store import RedisQuotaStore
+
+def make_key(key_id, **limits):
+    return SimpleNamespace(
+        id=key_id, name=f"key-{key_id}", provider=limits.get("provider", "groq"), key_value="x", key_prefix="x",
+        is_active=True, daily_quota=limits.get("daily_quota", 0), used_today=0, last_reset=None,
+        cooldown_until=None, rpm_limit=limits.get("rpm_limit", 0), tpm_limit=limits.get("tpm_limit", 0),
+        max_concurrency=limits.get("max_concurrency", 0)
+    )
+
+async def make_workers():
+    # Two stores on one server stand in for two workers
+    try:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        return [RedisQuotaStore(fakeredis.FakeAsyncRedis(server=server)) for _ in range(2)]
+    except ImportError:
+        import redis.asyncio as redis
+        workers = [RedisQuotaStore(redis.from_url("redis://localhost:6379/15")) for _ in range(2)]
+        await workers[0].client.flushdb()
+        return workers
+
+async def redis_quota():
+    workers = await make_workers()
+
+    key_registry.upsert(make_key(1, max_concurrency=3))
+    key_registry.upsert(make_key(2, rpm_limit=2, daily_quota=100))
+    await workers[0].sync(key_registry.keys.values())
+
+    # Concurrent acquisitions from both workers never exceed the limits
+    picked = await asyncio.gather(*[workers[i % 2].acquire("groq") for i in range(10)])
+    ids = [state.id if state else None for state in picked]
+    print(f"Acquired: {ids}")
+    assert ids.count(1) == 3 and ids.count(2) == 2 and ids.count(None) == 5
+
+    # Releasing a slot on one worker frees it for the other
+    holder = next(worker for worker in workers if worker.leases.get(1))
+    await holder.release(1)
+    state = await workers[1].acquire("groq")
+    print(f"After release: {state.id if state else None}")
+    assert state is not None and state.id == 1
+
+    # Usage is shared and exhausts the daily quota everywhere
+    await workers[0].record_usage(2, 100)
+    await workers[1].set_cooldown(1, 60)
+    snapshot = await workers[1].snapshot([1, 2])
+    print(f"Snapshot: {snapshot}")
+    assert snapshot[2]["used_today"] == 100 and snapshot[1]["cooldown_until"]
+    assert await workers[0].acquire("groq") is None
+
+    # Reserved tokens count against the daily quota until released
+    key_registry.upsert(make_key(3, provider="cohere", daily_quota=100))
+    await workers[0].sync([key_registry.get(3)])
+    first = await workers[0].acquire("cohere", 80)
+    assert first is not None and await workers[1].acquire("cohere", 30) is None
+    await workers[0].release(3, 80)
+    assert await workers[1].acquire("cohere", 30) is not None
+    print("Redis quota store OK")
+
+async def set_key(statement):
+    async with AsyncSessionLocal() as db:
+        await db.execute(statement)
+        await db.commit()
+
+async def key_config_changes(key_ids):
+    await init_db()
+    workers = await make_workers()
+    async with AsyncSessionLocal() as db:
+        key = APIKey(name="shared", provider="mistral", key_value="x", key_prefix="x")
+        db.add(key)
+        await db.commit()
+        key_ids.append(key.id)
+        key_registry.upsert(key)
+    first = key_ids[0]
+    state = await workers[1].acquire("mistral")
+    assert state is not None and state.id == first
+    await workers[1].release(first)
+
+    # Another worker disables the key: it only changes the database and the
+    # config version, yet this worker stops handing the key out
+    await set_key(update(APIKey).where(APIKey.id == first).values(is_active=False))
+    await workers[0].config_changed()
+    assert await workers[1].acquire("mistral") is None
+    assert not key_registry.get(first).is_active
+
+    # A key added elsewhere is picked up even with no local candidate left
+    async with AsyncSessionLocal() as db:
+        key = APIKey(name="added", provider="mistral", key_value="x", key_prefix="x", rpm_limit=1)
+        db.add(key)
+        await db.commit()
+        key_ids.append(key.id)
+    added = key_ids[1]
+    await workers[0].config_changed()
+    state = await workers[1].acquire("mistral")
+    print(f"Picked up key {state.id if state else None} added on another worker")
+    assert state is not None and state.id == added and state.rpm_limit == 1
+    await workers[1].release(added)
+
+    # Deleted elsewhere: gone from this worker too
+    await set_key(delete(APIKey).where(APIKey.id == added))
+    await workers[0].config_changed()
+    assert await workers[1].acquire("mistral") is None and key_registry.get(added) is None
+
+def test_redis_quota():
+    # Uses fakeredis when installed (pip install fakeredis[lua]), else a local redis-server
+    try:
+        asyncio.run(redis_quota())
+    finally:
+        for key_id in (1, 2, 3):
+            key_registry.remove(key_id)
+
+def test_key_config_changes_reach_other_workers():
+    key_ids = []
+    try:
+        asyncio.run(key_config_changes(key_ids))
+    finally:
+        asyncio.run(set_key(delete(APIKey).where(APIKey.id.in_(key_ids))))
+        for key_id in key_ids:
+            key_registry.remove(key_id)
+
+if __name__ == "__main__":
+    test_redis_quota()
+    test_key_config_changes_reach_other_workers()
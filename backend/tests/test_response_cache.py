@@ -0,0 +1,132 @@
+import time
+import asyncio
+from app.api.v1 import chat
+from app.core.router import router
+from app.models.schemas import ChatRequest, ChatMessage, ChatResponse, ChatChoice, Usage, LogicalModel
+from app.services.response_cache import ResponseCache, response_cache
+
+def make_request(content: str = "What is 2 + 2?", **fields) -> ChatRequest:
+    fields.setdefault("temperature", 0)
+    return ChatRequest(model=LogicalModel.SMART, messages=[ChatMessage(role="user", content=content)], **fields)
+
+def test_key_derivation():
+    key = ResponseCache.make_key(make_request())
+    assert key == ResponseCache.make_key(make_request())
+    # Streaming and the cache opt-out do not change what is being asked
+    assert key == ResponseCache.make_key(make_request(stream=True, cache=False))
+    different = [
+        make_request("What is 2 + 3?"),
+        make_request(temperature=0.0001),
+        make_request(max_tokens=100),
+        ChatRequest(model=LogicalModel.FAST, messages=[ChatMessage(role="user", content="What is 2 + 2?")], temperature=0),
+        ChatRequest(model=LogicalModel.SMART, messages=[ChatMessage(role="system", content="What is 2 + 2?")], temperature=0),
+    ]
+    keys = {key} | {ResponseCache.make_key(request) for request in different}
+    assert len(keys) == len(different) + 1
+    # Message boundaries are part of the key
+    split = ChatRequest(model=LogicalModel.SMART, temperature=0, messages=[
+        ChatMessage(role="user", content="What is"), ChatMessage(role="user", content=" 2 + 2?"),
+    ])
+    assert ResponseCache.make_key(split) != key
+
+def test_only_deterministic_requests_are_cacheable():
+    cache = ResponseCache()
+    cache.enabled, cache.max_temperature = True, 0
+    assert cache.is_cacheable(make_request())
+    assert not cache.is_cacheable(make_request(stream=True))
+    assert not cache.is_cacheable(make_request(temperature=0.7))
+    assert not cache.is_cacheable(make_request(temperature=None))
+    cache.max_temperature = 0.2
+    assert cache.is_cacheable(make_request(temperature=0.2))
+    cache.enabled = False
+    assert not cache.is_cacheable(make_request())
+
+def test_ttl_and_max_age():
+    cache = ResponseCache()
+    cache.ttl = 60
+    cache.put("fresh", b"a")
+    assert cache.get("fresh") == (b"a", 0)
+    # Entries older than the TTL expire and are removed
+    cache.entries["stale"] = (time.time() - 61, b"bb")
+    cache.bytes += 2
+    assert cache.get("stale") is None
+    assert "stale" not in cache.entries and cache.expirations == 1 and cache.bytes == 1
+    # max-age only refuses entries older than the client accepts; they stay cached
+    cache.entries["aged"] = (time.time() - 30, b"c")
+    assert cache.get("aged", max_age=10) is None
+    assert cache.get("aged", max_age=40)[1] == 30
+    assert "aged" in cache.entries
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = ResponseCache()
+    cache.max_bytes = 10
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.get("a")
+    cache.put("c", b"1234")
+    assert set(cache.entries) == {"a", "c"} and cache.bytes == 8 and cache.evictions == 1
+    # Bodies larger than the whole budget are never stored
+    cache.put("huge", b"x" * 11)
+    assert "huge" not in cache.entries
+
+def test_parse_cache_control():
+    cases = [
+        (None, (False, False, None)),
+        ("", (False, False, None)),
+        ("no-store", (True, False, None)),
+        ("No-Cache", (False, True, None)),
+        ("max-age=30", (False, False, 30)),
+        ("no-cache, max-age=0", (False, True, 0)),
+        (" no-store ,no-cache", (True, True, None)),
+        ("max-age=soon", (False, False, None)),
+        ("private", (False, False, None)),
+    ]
+    for value, expected in cases:
+        assert chat._parse_cache_control(value) == expected, value
+
+async def endpoint_cache_control():
+    calls = []
+
+    async def route(db, request, received_at=None, usage_rows=None):
+        calls.append(request)
+        return ChatResponse(
+            id=f"answer-{len(calls)}", created=0, model="mock",
+            choices=[ChatChoice(index=0, message=ChatMessage(role="assistant", content="4"), finish_reason="stop")],
+            usage=Usage(prompt_tokens=5, completion_tokens=1, total_tokens=6)
+        )
+
+    async def ask(request, cache_control=None):
+        response = await chat.chat_completion(request, db=None, cache_control=cache_control)
+        return response.headers["X-Cache"], len(calls)
+
+    router.route = route
+    response_cache.clear()
+    enabled, max_temperature = response_cache.enabled, response_cache.max_temperature
+    response_cache.enabled, response_cache.max_temperature = True, 0
+    try:
+        request = make_request("endpoint cache test")
+        # no-store neither reads nor writes the cache
+        assert await ask(request, "no-store") == ("BYPASS", 1)
+        assert await ask(request) == ("MISS", 2)
+        assert await ask(request) == ("HIT", 2)
+        # no-cache goes upstream but refreshes the entry
+        assert await ask(request, "no-cache") == ("MISS", 3)
+        assert await ask(request) == ("HIT", 3)
+        assert await ask(request, "no-store") == ("BYPASS", 4)
+        # Non-deterministic requests and the per-request opt-out are never cached
+        assert await ask(make_request("endpoint cache test", temperature=0.7)) == ("BYPASS", 5)
+        assert await ask(make_request("endpoint cache test", temperature=0.7)) == ("BYPASS", 6)
+        assert await ask(make_request("endpoint cache test", cache=False)) == ("BYPASS", 7)
+    finally:
+        del router.route
+        response_cache.clear()
+        response_cache.enabled, response_cache.max_temperature = enabled, max_temperature
+
+def test_endpoint_cache_control():
+    asyncio.run(endpoint_cache_control())
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("Response cache OK")
@@ -0,0 +1,94 @@
+import time
+import asyncio
+from app.core.router import RoutingEngine
+from app.models.schemas import ChatRequest, ChatMessage, LogicalModel
+from app.services.key_registry import key_registry
+from app.services.circuit_breaker import circuit_breaker, HALF_OPEN, OPEN
+from test_redis_quota import make_key
+
+class SlowAdapter:
+    """Never answers; takes a moment to tear down so a second cancel lands mid-cleanup."""
+
+    async def chat_completion(self, request, api_key):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.05)
+            raise
+
+async def cancel_twice():
+    key_registry.loaded = True
+    key_registry.upsert(make_key(501, provider="xai"))
+    key_registry.upsert(make_key(502, provider="perplexity"))
+    # A half-open circuit hands out probe slots that must come back on cancel
+    circuit = circuit_breaker._circuit("perplexity")
+    circuit.state = HALF_OPEN
+
+    engine = RoutingEngine()
+    engine.record_timings = False
+    engine.adapters = {"xai": SlowAdapter(), "perplexity": SlowAdapter()}
+    engine.routing_config[LogicalModel.ANY] = ["xai", "perplexity"]
+    engine.hedge_delays[LogicalModel.ANY] = 0.01
+    request = ChatRequest(model=LogicalModel.ANY, messages=[ChatMessage(role="user", content="hi")])
+
+    task = asyncio.ensure_future(engine.route(None, request))
+    await asyncio.sleep(0.1)
+    assert all(key_registry.get(key_id).in_flight == 1 for key_id in (501, 502))
+    assert circuit.probes_in_flight == 1
+
+    # The client goes away, then the server cancels again while the attempts are torn down
+    task.cancel()
+    await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await asyncio.sleep(0.2)
+
+    for key_id in (501, 502):
+        state = key_registry.get(key_id)
+        print(f"Key {key_id}: in_flight={state.in_flight} reserved={state.reserved}")
+        assert state.in_flight == 0 and state.reserved == 0
+    assert circuit.probes_in_flight == 0
+    print("Cancelled dispatch released everything OK")
+
+async def open_circuit_spares_keys():
+    key_registry.loaded = True
+    key_registry.upsert(make_key(503, provider="deepseek", rpm_limit=5))
+    circuit = circuit_breaker._circuit("deepseek")
+    circuit.state = OPEN
+    circuit.opened_at = time.monotonic()
+
+    engine = RoutingEngine()
+    engine.record_timings = False
+    engine.adapters = {"deepseek": SlowAdapter()}
+    engine.routing_config[LogicalModel.CHEAP] = ["deepseek"]
+    request = ChatRequest(model=LogicalModel.CHEAP, messages=[ChatMessage(role="user", content="hi")])
+
+    # Requests skipped because the circuit is open never touch the key's RPM budget
+    for _ in range(10):
+        try:
+            await engine.route(None, request)
+        except Exception as e:
+            assert "No providers available" in str(e)
+    state = key_registry.get(503)
+    print(f"RPM tokens left while the circuit is open: {state.rpm_tokens}")
+    assert state.rpm_tokens == 5 and state.in_flight == 0
+
+def test_cancel_twice_releases_keys():
+    try:
+        asyncio.run(cancel_twice())
+    finally:
+        for key_id in (501, 502):
+            key_registry.remove(key_id)
+
+def test_open_circuit_spares_keys():
+    try:
+        asyncio.run(open_circuit_spares_keys())
+    finally:
+        key_registry.remove(503)
+
+if __name__ == "__main__":
+    test_cancel_twice_releases_keys()
+    test_open_circuit_spares_keys()
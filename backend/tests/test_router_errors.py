@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.adapters.openai import OpenAIAdapter
+from app.adapters.gemini import GeminiAdapter
+from app.adapters.anthropic import AnthropicAdapter
+from app.api.v1 import chat
+from app.core.http_client import http_clients
+from app.core.router import RoutingEngine, UpstreamRequestError
+from app.models.schemas import ChatRequest, ChatMessage, LogicalModel
+from app.services.key_registry import key_registry
+from app.services.provider_stats import provider_stats
+from test_redis_quota import make_key
+
+KEYS = {"openai": 601, "gemini": 602, "anthropic": 603}
+
+OPENAI_OK = {
+    "id": "chatcmpl-1", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "fits"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+}
+OPENAI_CHUNK = {"choices": [{"index": 0, "delta": {"content": "fits"}, "finish_reason": "stop"}]}
+GEMINI_OK = {
+    "candidates": [{"content": {"parts": [{"text": "fits"}]}, "finishReason": "STOP"}],
+    "usageMetadata": {"promptTokenCount": 5, "candidatesTokenCount": 1, "totalTokenCount": 6},
+}
+# Gemini streams chunks shaped like its plain responses
+STREAM_CHUNKS = {"openai": OPENAI_CHUNK}
+CONTEXT_TOO_LONG = (400, {"error": {
+    "message": "This model's maximum context length is 16385 tokens.",
+    "type": "invalid_request_error", "code": "context_length_exceeded",
+}})
+GEMINI_KEY_INVALID = (400, {"error": {
+    "code": 400, "message": "API key not valid. Please pass a valid API key.", "status": "INVALID_ARGUMENT",
+    "details": [{"@type": "type.googleapis.com/google.rpc.ErrorInfo", "reason": "API_KEY_INVALID", "domain": "googleapis.com"}],
+}})
+ANTHROPIC_TEMPERATURE = (400, {"type": "error", "error": {
+    "type": "invalid_request_error", "message": "temperature: range: 0..1",
+}})
+
+def make_engine(order, answers):
+    """A router over real adapters whose upstreams answer with canned (status, body) pairs."""
+    calls = {provider: 0 for provider in order}
+
+    def transport(provider):
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls[provider] += 1
+            status, body = answers[provider]
+            streamed = "streamGenerateContent" in request.url.path or json.loads(request.content).get("stream")
+            if streamed and status == 200:
+                chunk = STREAM_CHUNKS.get(provider, body)
+                return httpx.Response(200, content=f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+            return httpx.Response(status, json=body)
+        return httpx.MockTransport(handler)
+
+    for provider in order:
+        http_clients.clients[provider] = httpx.AsyncClient(transport=transport(provider))
+    engine = RoutingEngine()
+    engine.record_timings = False
+    engine.adapters = {"openai": OpenAIAdapter(), "gemini": GeminiAdapter(), "anthropic": AnthropicAdapter()}
+    engine.routing_config[LogicalModel.SMART] = order
+    engine.hedge_delays.pop(LogicalModel.SMART, None)
+    return engine, calls
+
+def cooling(provider) -> bool:
+    state = key_registry.get(KEYS[provider])
+    return bool(state.cooldown_until and state.cooldown_until > time.time())
+
+def request(**fields) -> ChatRequest:
+    return ChatRequest(model=LogicalModel.SMART, messages=[ChatMessage(role="user", content="hi")], **fields)
+
+async def context_too_long():
+    # A prompt too long for one provider's context window may fit another's
+    engine, calls = make_engine(["openai", "gemini"], {"openai": CONTEXT_TOO_LONG, "gemini": (200, GEMINI_OK)})
+    response = await engine.route(None, request())
+    assert response.choices[0].message.content == "fits"
+    assert calls == {"openai": 1, "gemini": 1} and not cooling("openai")
+
+async def gemini_key_invalid():
+    # Gemini answers 400 for a revoked key: the key rests, the request moves on
+    engine, calls = make_engine(["gemini", "openai"], {"gemini": GEMINI_KEY_INVALID, "openai": (200, OPENAI_OK)})
+    response = await engine.route(None, request())
+    assert response.choices[0].message.content == "fits" and cooling("gemini")
+
+    # Streaming reads the error body too, so the key is recognised there as well
+    key_registry.remove(KEYS["gemini"])
+    key_registry.upsert(make_key(KEYS["gemini"], provider="gemini"))
+    deltas = [delta async for delta in engine.route_stream(None, request(stream=True))]
+    assert "".join(delta.content or "" for delta in deltas) == "fits" and cooling("gemini")
+    assert calls == {"gemini": 2, "openai": 2}
+
+async def anthropic_parameter():
+    # Anthropic refuses temperatures above 1 that other providers accept
+    engine, calls = make_engine(["anthropic", "openai"], {"anthropic": ANTHROPIC_TEMPERATURE, "openai": (200, OPENAI_OK)})
+    response = await engine.route(None, request(temperature=1.5))
+    assert response.choices[0].message.content == "fits"
+    assert calls == {"anthropic": 1, "openai": 1} and not cooling("anthropic")
+
+async def every_provider_rejects():
+    # Only when every provider refuses does the client get the provider's status
+    engine, calls = make_engine(["anthropic", "openai"], {"anthropic": ANTHROPIC_TEMPERATURE, "openai": CONTEXT_TOO_LONG})
+    try:
+        await engine.route(None, request(temperature=1.5))
+        assert False, "expected UpstreamRequestError"
+    except UpstreamRequestError as e:
+        print(f"Every provider rejected the request: {e.status_code} {e}")
+        assert e.status_code == 400 and "maximum context length" in str(e)
+    assert calls == {"anthropic": 1, "openai": 1}
+    assert not cooling("anthropic") and not cooling("openai")
+
+def run(scenario):
+    key_registry.loaded = True
+    for provider, key_id in KEYS.items():
+        key_registry.upsert(make_key(key_id, provider=provider))
+    clients = dict(http_clients.clients)
+    # Try providers in the configured order
+    enabled, provider_stats.enabled = provider_stats.enabled, False
+    try:
+        asyncio.run(scenario())
+    finally:
+        provider_stats.enabled = enabled
+        for key_id in KEYS.values():
+            key_registry.remove(key_id)
+        http_clients.clients.clear()
+        http_clients.clients.update(clients)
+
+def test_context_length_falls_back():
+    run(context_too_long)
+
+def test_gemini_invalid_key_is_rejected_and_falls_back():
+    run(gemini_key_invalid)
+
+def test_provider_specific_parameter_falls_back():
+    run(anthropic_parameter)
+
+def test_rejected_everywhere_returns_status():
+    run(every_provider_rejects)
+
+def test_schema_errors_never_reach_a_provider():
+    # Our own validation is the same for every provider: 422 before routing
+    calls = []
+    app = FastAPI()
+    app.include_router(chat.api_router, prefix="/v1")
+    chat.router.route = lambda *args, **kwargs: calls.append(args)
+    try:
+        response = TestClient(app).post("/v1/chat", json={"model": "smart", "messages": "hi"})
+    finally:
+        del chat.router.route
+    assert response.status_code == 422 and not calls
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("Router error handling OK")
@@ -0,0 +1,94 @@
+import asyncio
+from app.models.schemas import ChatRequest, ChatMessage, LogicalModel
+from app.services.single_flight import SingleFlight
+
+async def leader_cancelled():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await release.wait()
+        return "answer"
+
+    leader = asyncio.ensure_future(flight.run("key", call))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(flight.run("key", call)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    # The client that started the call goes away; the shared call keeps running
+    leader.cancel()
+    await asyncio.sleep(0)
+    assert leader.cancelled() and "key" in flight.in_flight
+    release.set()
+    results = await asyncio.wait_for(asyncio.gather(*followers), 1)
+    print(f"Followers after the leader was cancelled: {results}")
+    assert results == [("answer", True)] * 3 and len(calls) == 1
+    assert "key" not in flight.in_flight
+
+    # The next request starts a fresh call
+    assert await asyncio.wait_for(flight.run("key", call), 1) == ("answer", False)
+    assert len(calls) == 2
+
+async def shared_call_fails():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def call():
+        started.set()
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    leader = asyncio.ensure_future(flight.run("key", call))
+    await started.wait()
+    follower = asyncio.ensure_future(flight.run("key", call))
+    leader.cancel()
+    results = await asyncio.wait_for(asyncio.gather(follower, return_exceptions=True), 1)
+    assert isinstance(results[0], RuntimeError) and "key" not in flight.in_flight
+
+async def shared_call_cancelled():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(10)
+
+    callers = [asyncio.ensure_future(flight.run("key", call)) for _ in range(3)]
+    await asyncio.sleep(0)
+    # The shared call itself is cancelled (e.g. on shutdown): every caller is told, none hangs
+    flight.in_flight["key"].cancel()
+    results = await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), 1)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert "key" not in flight.in_flight
+
+def test_only_deterministic_requests_coalesce():
+    flight = SingleFlight()
+    flight.models, flight.max_temperature = {"smart"}, 0
+
+    def request(model=LogicalModel.SMART, **fields):
+        return ChatRequest(model=model, messages=[ChatMessage(role="user", content="Say a line")], **fields)
+
+    assert flight.is_enabled(request(temperature=0))
+    # Sampled prompts (the default temperature is 0.7) want distinct completions
+    assert not flight.is_enabled(request())
+    assert not flight.is_enabled(request(temperature=None))
+    assert not flight.is_enabled(request(model=LogicalModel.FAST, temperature=0))
+    # Opting in coalesces sampled requests too
+    flight.max_temperature = 1.0
+    assert flight.is_enabled(request())
+
+def test_leader_cancelled_followers_get_result():
+    asyncio.run(leader_cancelled())
+
+def test_shared_call_failure_reaches_followers():
+    asyncio.run(shared_call_fails())
+
+def test_cancelled_shared_call_does_not_hang():
+    asyncio.run(shared_call_cancelled())
+
+if __name__ == "__main__":
+    test_only_deterministic_requests_coalesce()
+    test_leader_cancelled_followers_get_result()
+    test_shared_call_failure_reaches_followers()
+    test_cancelled_shared_call_does_not_hang()
+    print("Single flight OK")
@@ -0,0 +1,178 @@
+import json
+import asyncio
+import httpx
+from app.adapters.openai import OpenAIAdapter
+from app.adapters.mistral import MistralAdapter
+from app.adapters.anthropic import AnthropicAdapter
+from app.adapters.gemini import GeminiAdapter
+from app.adapters.cohere import CohereAdapter
+from app.api.v1.chat import _sse_events
+from app.core.http_client import http_clients
+from app.models.schemas import ChatRequest, ChatMessage, ChatDelta, LogicalModel, Usage
+
+REQUEST = ChatRequest(model=LogicalModel.FAST, messages=[ChatMessage(role="user", content="hi")], stream=True)
+
+def sse(*events) -> bytes:
+    return "".join(f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n" for event in events).encode()
+
+def ndjson(*events) -> bytes:
+    return "".join(json.dumps(event) + "\n" for event in events).encode()
+
+OPENAI_STREAM = sse(
+    {"choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]},
+    {"choices": [{"index": 0, "delta": {"content": "Hel"}, "finish_reason": None}]},
+    {"choices": [{"index": 0, "delta": {"content": "lo"}, "finish_reason": None}]},
+    {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+    # stream_options.include_usage: a last chunk with no choices and the totals
+    {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 2, "total_tokens": 11}},
+    "[DONE]",
+)
+
+ANTHROPIC_STREAM = b"".join([
+    b"event: message_start\n",
+    sse({"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}}),
+    b"event: ping\n",
+    sse({"type": "ping"}),
+    sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+    sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hel"}}),
+    sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "lo"}}),
+    sse({"type": "content_block_stop", "index": 0}),
+    # Output tokens in message_delta are the running total, not an increment
+    sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 5}}),
+    sse({"type": "message_stop"}),
+])
+
+GEMINI_STREAM = sse(
+    {"candidates": [{"content": {"parts": [{"text": "Hel"}]}}],
+     "usageMetadata": {"promptTokenCount": 7, "candidatesTokenCount": 1, "totalTokenCount": 8}},
+    # usageMetadata is cumulative: only the last one counts
+    {"candidates": [{"content": {"parts": [{"text": "lo"}]}, "finishReason": "STOP"}],
+     "usageMetadata": {"promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10}},
+)
+
+COHERE_STREAM = ndjson(
+    {"is_finished": False, "event_type": "stream-start", "generation_id": "g-1"},
+    {"is_finished": False, "event_type": "text-generation", "text": "Hel"},
+    {"is_finished": False, "event_type": "text-generation", "text": "lo"},
+    {"is_finished": True, "event_type": "stream-end", "finish_reason": "COMPLETE", "response": {
+        "text": "Hello", "token_count": {"prompt_tokens": 4, "response_tokens": 2, "total_tokens": 6},
+    }},
+)
+
+async def collect(adapter, body: bytes, sent: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, content=body)
+
+    http_clients.clients[adapter.PROVIDER] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return [delta async for delta in adapter.stream_chat_completion(REQUEST, "key")]
+
+def parse(adapter, body: bytes):
+    """Stream a canned body through an adapter; returns (text, finish reasons, last usage, payload sent)."""
+    clients = dict(http_clients.clients)
+    sent = []
+    try:
+        deltas = asyncio.run(collect(adapter, body, sent))
+    finally:
+        http_clients.clients.clear()
+        http_clients.clients.update(clients)
+    usages = [delta.usage for delta in deltas if delta.usage]
+    return (
+        "".join(delta.content or "" for delta in deltas),
+        [delta.finish_reason for delta in deltas if delta.finish_reason],
+        usages[-1] if usages else None,
+        sent[0],
+    )
+
+def test_openai_stream():
+    text, finish, usage, payload = parse(OpenAIAdapter(), OPENAI_STREAM)
+    assert (text, finish) == ("Hello", ["stop"])
+    assert usage == Usage(prompt_tokens=9, completion_tokens=2, total_tokens=11)
+    assert payload["stream"] and payload["stream_options"] == {"include_usage": True}
+
+def test_openai_compatible_stream_without_usage_option():
+    # Mistral rejects stream_options but sends the usage chunk anyway
+    text, finish, usage, payload = parse(MistralAdapter(), OPENAI_STREAM)
+    assert (text, finish) == ("Hello", ["stop"]) and usage.total_tokens == 11
+    assert "stream_options" not in payload
+
+def test_anthropic_stream():
+    text, finish, usage, payload = parse(AnthropicAdapter(), ANTHROPIC_STREAM)
+    assert (text, finish) == ("Hello", ["end_turn"])
+    assert usage == Usage(prompt_tokens=12, completion_tokens=5, total_tokens=17)
+    assert payload["stream"]
+
+def test_anthropic_stream_error_event():
+    body = ANTHROPIC_STREAM.split(b"event: ping")[0] + sse({"type": "error", "error": {"type": "overloaded_error"}})
+    try:
+        parse(AnthropicAdapter(), body)
+        assert False, "expected the error event to raise"
+    except RuntimeError as e:
+        assert "overloaded_error" in str(e)
+
+def test_gemini_stream():
+    text, finish, usage, _ = parse(GeminiAdapter(), GEMINI_STREAM)
+    assert (text, finish) == ("Hello", ["STOP"])
+    assert usage == Usage(prompt_tokens=7, completion_tokens=3, total_tokens=10)
+
+def test_cohere_stream():
+    text, finish, usage, payload = parse(CohereAdapter(), COHERE_STREAM)
+    assert (text, finish) == ("Hello", ["complete"])
+    assert usage == Usage(prompt_tokens=4, completion_tokens=2, total_tokens=6)
+    assert payload["stream"]
+
+class DeltaStream:
+    """Stands in for the router's stream: yields deltas, then optionally fails."""
+
+    def __init__(self, deltas, error=None):
+        self.deltas = iter(deltas)
+        self.error = error
+        self.closed = False
+
+    async def __anext__(self):
+        delta = next(self.deltas, None)
+        if delta is not None:
+            return delta
+        if self.error:
+            raise self.error
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        self.closed = True
+
+async def client_events(deltas, error=None):
+    stream = DeltaStream(deltas, error)
+    first = await stream.__anext__()
+    lines = [line async for line in _sse_events(REQUEST, first, stream)]
+    assert stream.closed
+    assert all(line.startswith("data: ") and line.endswith("\n\n") for line in lines)
+    return [line[6:-2] for line in lines]
+
+def test_sse_events():
+    usage = Usage(prompt_tokens=3, completion_tokens=2, total_tokens=5)
+    events = asyncio.run(client_events([
+        ChatDelta(content="Hel"), ChatDelta(content="lo"), ChatDelta(finish_reason="stop"), ChatDelta(usage=usage),
+    ]))
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert len({chunk["id"] for chunk in chunks}) == 1
+    assert all(chunk["object"] == "chat.completion.chunk" and chunk["model"] == "fast" for chunk in chunks)
+    # The first chunk only announces the role
+    assert chunks[0]["choices"] == [{"index": 0, "delta": {"role": "assistant"}}]
+    assert [chunk["choices"][0]["delta"].get("content") for chunk in chunks[1:3]] == ["Hel", "lo"]
+    assert chunks[3]["choices"][0] == {"index": 0, "delta": {}, "finish_reason": "stop"}
+    # Usage-only deltas produce no chunk of their own; the totals follow in a final chunk without choices
+    assert len(chunks) == 5 and chunks[4]["choices"] == [] and chunks[4]["usage"] == usage.model_dump()
+
+def test_sse_events_mid_stream_error():
+    events = asyncio.run(client_events([ChatDelta(content="Hel")], error=RuntimeError("upstream went away")))
+    assert json.loads(events[1])["choices"][0]["delta"] == {"content": "Hel"}
+    # The client learns about the failure in-band, and the stream still ends properly
+    assert json.loads(events[2]) == {"error": {"message": "upstream went away"}}
+    assert events[3:] == ["[DONE]"]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("Stream parsers OK")
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+# Run against a throwaway database, never the configured one
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'export.db')}"
+
+from sqlalchemy import delete
+from app.core.database import init_db, AsyncSessionLocal
+from app.models.db_models import UsageLog
+from app.services.usage_export import UsageExporter
+
+async def export_ids(exporter: UsageExporter, after_id=None):
+    rows = []
+    async for chunk in exporter.stream("ndjson", after_id=after_id):
+        rows += [json.loads(line) for line in chunk.decode().splitlines()]
+    return [row["id"] for row in rows]
+
+async def incremental_export(ids):
+    await init_db()
+    now = int(time.time())
+    # The third row is still settling; the fourth, older one was committed after it
+    async with AsyncSessionLocal() as db:
+        rows = [UsageLog(api_key_id=0, model="fast", timestamp=timestamp) for timestamp in (now - 300, now - 200, now - 5, now - 100)]
+        db.add_all(rows)
+        await db.commit()
+        ids += [row.id for row in rows]
+
+    exporter = UsageExporter()
+    exporter.settle_seconds = 60
+    after = ids[0] - 1
+    # A full export has everything; an incremental one stops before the unsettled row
+    assert [i for i in await export_ids(exporter) if i in ids] == ids
+    first = await export_ids(exporter, after)
+    print(f"Incremental export after {after}: {first}")
+    assert first == ids[:2]
+
+    # Once it has settled the next export resumes right where the last one stopped
+    exporter.settle_seconds = 1
+    assert await export_ids(exporter, first[-1]) == ids[2:]
+
+def test_incremental_export_holds_back_unsettled_rows():
+    ids = []
+    try:
+        asyncio.run(incremental_export(ids))
+    finally:
+        async def cleanup():
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(UsageLog).where(UsageLog.id.in_(ids)))
+                await db.commit()
+        asyncio.run(cleanup())
+
+if __name__ == "__main__":
+    test_incremental_export_holds_back_unsettled_rows()
+    print("Usage export OK")
@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+import tempfile
+
+# Run against a throwaway database, never the configured one
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'usage.db')}"
+
+from sqlalchemy import select
+from app.core.database import init_db, AsyncSessionLocal
+from app.models.db_models import RequestAttempt
+from app.services.usage_writer import UsageWriter
+
+def make_writer(database):
+    writer = UsageWriter()
+    writer.batch_size = 4
+    writer.flush_retries = 2
+    writer.queue = asyncio.Queue(maxsize=8)
+
+    async def write(batch, key_rows):
+        # Stands in for the database: down, or rejecting rows marked bad
+        if database["down"] or any(row.get("bad") for _, _, row in batch):
+            raise RuntimeError("write failed")
+        database["rows"].extend(row for _, _, row in batch)
+    writer._write = write
+    return writer
+
+async def flush_failing(writer) -> bool:
+    try:
+        await writer.flush()
+        return False
+    except RuntimeError:
+        return True
+
+async def database_down():
+    database = {"down": True, "rows": []}
+    writer = make_writer(database)
+    for i in range(8):
+        await writer.enqueue({"n": i})
+
+    # Failing flushes keep one batch aside; the rest stays in the bounded queue
+    for _ in range(5):
+        assert await flush_failing(writer)
+    print(f"Pending {len(writer._pending)}, queued {writer.queue.qsize()}, dropped {writer.dropped}")
+    assert len(writer._pending) == 4 and writer.queue.qsize() == 4 and writer.dropped == 0
+
+    # Once the queue is full again producers wait instead of memory growing
+    for i in range(8, 12):
+        await writer.enqueue({"n": i})
+    blocked = asyncio.ensure_future(writer.enqueue({"n": 12}))
+    await asyncio.sleep(0.01)
+    assert not blocked.done() and writer.backpressure_waits == 1
+
+    # Once the database is back everything is written, in order
+    database["down"] = False
+    await writer.flush()
+    await blocked
+    await writer.flush()
+    assert [row["n"] for row in database["rows"]] == list(range(13))
+
+async def shutdown_database_down():
+    database = {"down": True, "rows": []}
+    writer = make_writer(database)
+    writer.start()
+    for i in range(6):
+        await writer.enqueue({"n": i})
+
+    # The final flush fails too, but stopping still completes so the rest of shutdown runs
+    await writer.stop()
+    assert writer._task is None and writer.get_stats()["queue_depth"] == 6 and not database["rows"]
+
+async def poison_row():
+    database = {"down": False, "rows": []}
+    writer = make_writer(database)
+    for i in range(6):
+        await writer.enqueue({"n": i, "bad": i == 2})
+
+    # The batch is retried as is, then split to drop the row the database rejects
+    assert await flush_failing(writer)
+    await writer.flush()
+    print(f"Written {[row['n'] for row in database['rows']]}, dropped {writer.dropped}")
+    assert [row["n"] for row in database["rows"]] == [0, 1, 3, 4, 5] and writer.dropped == 1
+
+async def old_attempts_pruned():
+    await init_db()
+    now = int(time.time())
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            RequestAttempt(request_id=f"prune-{age}", timestamp=now - age * 86400, model="fast", provider="groq", outcome="success")
+            for age in (0, 1, 3, 10)
+        ])
+        await db.commit()
+
+    writer = UsageWriter()
+    writer.attempt_retention = 2 * 86400
+    writer.flush_interval = 0.01
+    writer.start()
+    await asyncio.sleep(0.1)
+    await writer.stop()
+    async with AsyncSessionLocal() as db:
+        kept = (await db.execute(
+            select(RequestAttempt.request_id).where(RequestAttempt.request_id.like("prune-%"))
+        )).scalars().all()
+    print(f"Kept {sorted(kept)}, pruned {writer.attempts_pruned}")
+    assert sorted(kept) == ["prune-0", "prune-1"] and writer.attempts_pruned == 2
+
+    # The next prune waits an hour
+    async with AsyncSessionLocal() as db:
+        db.add(RequestAttempt(request_id="prune-late", timestamp=now - 5 * 86400, model="fast", provider="groq", outcome="success"))
+        await db.commit()
+    writer.start()
+    await asyncio.sleep(0.05)
+    await writer.stop()
+    assert writer.attempts_pruned == 2
+
+def test_database_down_keeps_backpressure():
+    asyncio.run(database_down())
+
+def test_stop_survives_database_down():
+    asyncio.run(shutdown_database_down())
+
+def test_poison_row_is_dropped():
+    asyncio.run(poison_row())
+
+def test_old_attempts_are_pruned():
+    asyncio.run(old_attempts_pruned())
+
+if __name__ == "__main__":
+    test_database_down_keeps_backpressure()
+    test_stop_survives_database_down()
+    test_poison_row_is_dropped()
+    test_old_attempts_are_pruned()
+    print("Usage writer OK")